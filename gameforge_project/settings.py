@@ -143,4 +143,154 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 # Authentication settings
 LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'dashboard'
-LOGOUT_REDIRECT_URL = 'home'
\ No newline at end of file
+LOGOUT_REDIRECT_URL = 'home'
+
+# Génération des images
+# Nombre maximal d'images générées en parallèle pour un même concept
+IMAGE_GENERATION_MAX_WORKERS = int(os.getenv('IMAGE_GENERATION_MAX_WORKERS', 4))
+
+# Tâches de génération en arrière-plan (python manage.py run_generation_worker)
+# Si désactivé, les concepts sont générés directement pendant la requête
+GENERATION_USE_WORKER = os.getenv('GENERATION_USE_WORKER', 'True').lower() in ('1', 'true', 'yes')
+GENERATION_WORKER_POLL_INTERVAL = float(os.getenv('GENERATION_WORKER_POLL_INTERVAL', 2))
+# Durée (en secondes) sans progression signalée après laquelle une tâche en cours est considérée abandonnée
+GENERATION_JOB_TIMEOUT = int(os.getenv('GENERATION_JOB_TIMEOUT', 600))
+GENERATION_JOB_MAX_ATTEMPTS = int(os.getenv('GENERATION_JOB_MAX_ATTEMPTS', 2))
+
+# Client HTTP partagé (Hugging Face, téléchargements d'images)
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', 5))
+HTTP_READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', 120))
+HTTP_MAX_RETRIES = int(os.getenv('HTTP_MAX_RETRIES', 4))
+HTTP_BACKOFF_FACTOR = float(os.getenv('HTTP_BACKOFF_FACTOR', 1.0))
+# Nombre d'hôtes distincts gardés en cache et connexions gardées ouvertes par hôte
+HTTP_POOL_CONNECTIONS = int(os.getenv('HTTP_POOL_CONNECTIONS', 10))
+HTTP_POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', 10))
+HTTP_POOL_MAXSIZE_PER_HOST = {
+    'api-inference.huggingface.co': max(IMAGE_GENERATION_MAX_WORKERS, HTTP_POOL_MAXSIZE),
+}
+
+# Client LLM partagé (GitHub Models, API compatible OpenAI)
+LLM_BASE_URL = os.getenv('LLM_BASE_URL', 'https://models.inference.ai.azure.com')
+LLM_MODEL = os.getenv('LLM_MODEL', 'gpt-4o-mini')
+LLM_TIMEOUT = float(os.getenv('LLM_TIMEOUT', 90))
+LLM_CONNECT_TIMEOUT = float(os.getenv('LLM_CONNECT_TIMEOUT', 5))
+# Relances (429, erreurs réseau et 5xx), chacune repassant par le limiteur de débit
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', 2))
+LLM_RETRY_MAX_DELAY = float(os.getenv('LLM_RETRY_MAX_DELAY', 8))
+LLM_MAX_CONNECTIONS = int(os.getenv('LLM_MAX_CONNECTIONS', 20))
+
+# Modèle Stable Diffusion utilisé pour les images
+HUGGINGFACE_IMAGE_API_URL = os.getenv(
+    'HUGGINGFACE_IMAGE_API_URL',
+    'https://api-inference.huggingface.co/models/stabilityai/stable-diffusion-2'
+)
+
+# Cache des images générées, indexé par (modèle, prompt, paramètres)
+IMAGE_CACHE_ENABLED = os.getenv('IMAGE_CACHE_ENABLED', 'True').lower() in ('1', 'true', 'yes')
+IMAGE_CACHE_DIR = 'image_cache'  # Relatif à MEDIA_ROOT (anciennes entrées uniquement)
+IMAGE_CACHE_MAX_BYTES = int(os.getenv('IMAGE_CACHE_MAX_BYTES', 500 * 1024 * 1024))
+# La taille du cache n'est contrôlée que toutes les N insertions
+IMAGE_CACHE_PRUNE_INTERVAL = int(os.getenv('IMAGE_CACHE_PRUNE_INTERVAL', 50))
+
+# Cache des concepts générés (stream_game_creation)
+GAME_CONTENT_TEMPERATURE = float(os.getenv('GAME_CONTENT_TEMPERATURE', 0.7))
+GAME_CONTENT_CACHE_ENABLED = os.getenv('GAME_CONTENT_CACHE_ENABLED', 'True').lower() in ('1', 'true', 'yes')
+# Nombre de variantes conservées par requête avant de servir depuis le cache
+GAME_CONTENT_CACHE_VARIANTS = int(os.getenv('GAME_CONTENT_CACHE_VARIANTS', 3))
+GAME_CONTENT_CACHE_TTL = int(os.getenv('GAME_CONTENT_CACHE_TTL', 7 * 24 * 3600))
+
+# Création en streaming (server-sent events) depuis la page de création: la génération
+# reste faite par le worker, le flux relaie l'avancement de sa tâche (nécessite GENERATION_USE_WORKER)
+GENERATION_STREAMING_ENABLED = os.getenv('GENERATION_STREAMING_ENABLED', 'True').lower() in ('1', 'true', 'yes')
+# Intervalle (secondes) entre deux enregistrements de l'aperçu par le worker et deux lectures par le flux
+GENERATION_STREAM_INTERVAL = float(os.getenv('GENERATION_STREAM_INTERVAL', 0.5))
+
+# Préchargement des choix narratifs de l'acte suivant après chaque choix
+NARRATIVE_PREFETCH_ENABLED = os.getenv('NARRATIVE_PREFETCH_ENABLED', 'True').lower() in ('1', 'true', 'yes')
+NARRATIVE_PREFETCH_WORKERS = int(os.getenv('NARRATIVE_PREFETCH_WORKERS', 2))
+# Au-delà de ce délai (secondes), un préchargement inachevé est abandonné
+NARRATIVE_PREFETCH_TIMEOUT = int(os.getenv('NARRATIVE_PREFETCH_TIMEOUT', 120))
+
+# Réécriture de l'acte et choix suivants générés en un seul appel à l'API
+# (repli sur deux appels séparés en cas d'échec)
+NARRATIVE_COMBINED_STEP = os.getenv('NARRATIVE_COMBINED_STEP', 'True').lower() in ('1', 'true', 'yes')
+NARRATIVE_STEP_MAX_TOKENS = int(os.getenv('NARRATIVE_STEP_MAX_TOKENS', 1800))
+
+# Nombre de jeux par page (tableau de bord et favoris)
+GAMES_PAGE_SIZE = int(os.getenv('GAMES_PAGE_SIZE', 24))
+
+# Cache des exports PDF (hors de MEDIA_ROOT: les fichiers ne sont pas publics)
+PDF_CACHE_ENABLED = os.getenv('PDF_CACHE_ENABLED', 'True').lower() in ('1', 'true', 'yes')
+PDF_CACHE_DIR = os.getenv('PDF_CACHE_DIR', os.path.join(BASE_DIR, 'pdf_cache'))
+# Générer le PDF en arrière-plan dès la création d'un jeu
+PDF_PRERENDER_ENABLED = os.getenv('PDF_PRERENDER_ENABLED', 'False').lower() in ('1', 'true', 'yes')
+# Images du PDF réduites à cette taille (pixels, plus grand côté) et compressées en JPEG
+PDF_IMAGE_MAX_SIZE = int(os.getenv('PDF_IMAGE_MAX_SIZE', 800))
+PDF_IMAGE_QUALITY = int(os.getenv('PDF_IMAGE_QUALITY', 80))
+
+# Export groupé (ZIP): nombre de processus de rendu des PDF
+BULK_EXPORT_WORKERS = int(os.getenv('BULK_EXPORT_WORKERS', os.cpu_count() or 1))
+
+# Déclinaisons responsives des images générées (largeurs en pixels, formats WebP et JPEG)
+IMAGE_VARIANT_WIDTHS = [int(width) for width in os.getenv('IMAGE_VARIANT_WIDTHS', '320,640,1024').split(',')]
+IMAGE_VARIANT_QUALITY = int(os.getenv('IMAGE_VARIANT_QUALITY', 80))
+
+# Limites des images reçues du fournisseur (vérifiées pendant le téléchargement)
+IMAGE_MAX_BYTES = int(os.getenv('IMAGE_MAX_BYTES', 20 * 1024 * 1024))
+IMAGE_MAX_PIXELS = int(os.getenv('IMAGE_MAX_PIXELS', 4096 * 4096))
+# Délai (secondes) avant la suppression d'une image stockée qu'aucun modèle ne référence
+BLOB_ORPHAN_GRACE = int(os.getenv('BLOB_ORPHAN_GRACE', 24 * 3600))
+# Fichiers en cours de réception, hors de MEDIA_ROOT (servi publiquement). Doit
+# être sur le même système de fichiers que MEDIA_ROOT: mise en place par os.replace
+BLOB_STAGING_DIR = os.getenv('BLOB_STAGING_DIR', os.path.join(BASE_DIR, 'media_staging'))
+
+# Recherche: 'auto' (FULLTEXT sous MySQL, index inversé sinon), 'fulltext' ou 'postings'
+SEARCH_BACKEND = os.getenv('SEARCH_BACKEND', 'auto')
+SEARCH_PAGE_SIZE = int(os.getenv('SEARCH_PAGE_SIZE', 20))
+
+# Index local des jeux similaires (vecteurs hachés, fichiers NumPy en ajout seul)
+SIMILARITY_ENABLED = os.getenv('SIMILARITY_ENABLED', 'True').lower() in ('1', 'true', 'yes')
+SIMILARITY_INDEX_DIR = os.getenv('SIMILARITY_INDEX_DIR', os.path.join(BASE_DIR, 'similarity_index'))
+SIMILARITY_DIMENSIONS = int(os.getenv('SIMILARITY_DIMENSIONS', 256))
+SIMILARITY_RESULTS = int(os.getenv('SIMILARITY_RESULTS', 5))
+# Score cosinus minimal d'un jeu similaire
+SIMILARITY_MIN_SCORE = float(os.getenv('SIMILARITY_MIN_SCORE', 0.1))
+# Compactage automatique: vérifié toutes les N lignes ajoutées par un processus, effectué
+# lorsque l'index contient plus de SIMILARITY_COMPACT_RATIO lignes par jeu
+SIMILARITY_COMPACT_INTERVAL = int(os.getenv('SIMILARITY_COMPACT_INTERVAL', 1000))
+SIMILARITY_COMPACT_RATIO = float(os.getenv('SIMILARITY_COMPACT_RATIO', 2))
+
+# Limiteur de débit partagé entre processus (en base) pour les appels aux fournisseurs d'IA.
+# Quotas par minute ; 0 = pas de limite sur cette dimension.
+RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'True').lower() in ('1', 'true', 'yes')
+RATE_LIMITS = {
+    'github_models': {
+        'requests_per_minute': int(os.getenv('LLM_REQUESTS_PER_MINUTE', 15)),
+        'tokens_per_minute': int(os.getenv('LLM_TOKENS_PER_MINUTE', 150000)),
+    },
+    'huggingface': {
+        'requests_per_minute': int(os.getenv('HUGGINGFACE_REQUESTS_PER_MINUTE', 30)),
+        'tokens_per_minute': 0,
+    },
+}
+# Hôtes appelés via http_client et fournisseur correspondant
+RATE_LIMIT_HOSTS = {
+    'api-inference.huggingface.co': 'huggingface',
+}
+# Attente maximale (secondes) d'un appelant avant RateLimitExceeded
+RATE_LIMIT_MAX_WAIT = float(os.getenv('RATE_LIMIT_MAX_WAIT', 30))
+
+# Ordonnanceur des appels d'IA du processus: file équitable entre utilisateurs,
+# classes servies par priorité (interactive > bulk > image)
+AI_SCHEDULER_ENABLED = os.getenv('AI_SCHEDULER_ENABLED', 'True').lower() in ('1', 'true', 'yes')
+AI_SCHEDULER_MAX_CONCURRENT = int(os.getenv('AI_SCHEDULER_MAX_CONCURRENT', 8))
+# Appels simultanés maximum par utilisateur et par classe
+AI_SCHEDULER_USER_MAX_CONCURRENT = {
+    'interactive': int(os.getenv('AI_SCHEDULER_INTERACTIVE_PER_USER', 2)),
+    'bulk': int(os.getenv('AI_SCHEDULER_BULK_PER_USER', 1)),
+    'image': int(os.getenv('AI_SCHEDULER_IMAGE_PER_USER', IMAGE_GENERATION_MAX_WORKERS)),
+}
+# Poids par identifiant d'utilisateur (1 par défaut): un poids de 2 obtient deux fois plus de tours
+AI_SCHEDULER_USER_WEIGHTS = {}
+# Attente maximale (secondes) d'un appel dans la file
+AI_SCHEDULER_MAX_WAIT = float(os.getenv('AI_SCHEDULER_MAX_WAIT', 120))
@@ -1,6 +1,8 @@
 from django.contrib import admin
 
-from .models import Character, Game, Location
+from .models import (Character, ContentCacheKey, ContentCacheVariant, Game,
+                     GenerationJob, ImageCacheEntry, Keyword, Location,
+                     RateLimitBucket, StoredBlob)
 
 
 @admin.register(Game)
@@ -8,6 +10,14 @@ class GameAdmin(admin.ModelAdmin):
     list_display = ('title', 'genre', 'ambiance', 'owner', 'created_at')
     search_fields = ('title', 'keywords')
     list_filter = ('genre', 'ambiance', 'created_at')
+    list_select_related = ('owner',)
+    
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        # La liste n'affiche pas les textes longs de l'histoire
+        if request.resolver_match and request.resolver_match.url_name.endswith('changelist'):
+            queryset = queryset.defer('universe_description', 'story_act1', 'story_act2', 'story_act3')
+        return queryset
 
 @admin.register(Character)
 class CharacterAdmin(admin.ModelAdmin):
@@ -20,3 +30,57 @@ class LocationAdmin(admin.ModelAdmin):
     list_display = ('name', 'game')
     search_fields = ('name',)
     list_filter = ('game',)
+
+
+@admin.register(GenerationJob)
+class GenerationJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'owner', 'status', 'progress', 'attempts', 'created_at', 'finished_at')
+    list_filter = ('status', 'kind')
+    readonly_fields = ('game', 'created_at', 'started_at', 'finished_at')
+
+
+@admin.register(ImageCacheEntry)
+class ImageCacheEntryAdmin(admin.ModelAdmin):
+    list_display = ('key', 'prompt', 'size', 'hits', 'created_at', 'last_used_at')
+    search_fields = ('prompt',)
+    readonly_fields = ('key', 'file', 'size', 'hits', 'created_at', 'last_used_at')
+
+
+class ContentCacheVariantInline(admin.TabularInline):
+    model = ContentCacheVariant
+    fields = ('created_at', 'hits', 'payload')
+    readonly_fields = ('created_at', 'hits', 'payload')
+    extra = 0
+
+@admin.register(ContentCacheKey)
+class ContentCacheKeyAdmin(admin.ModelAdmin):
+    list_display = ('genre', 'ambiance', 'keywords', 'model', 'hits', 'misses', 'hit_rate_display', 'last_hit_at')
+    list_filter = ('genre', 'ambiance', 'model')
+    search_fields = ('keywords', 'references')
+    readonly_fields = ('key', 'hits', 'misses', 'created_at', 'last_hit_at')
+    inlines = [ContentCacheVariantInline]
+
+    @admin.display(description='Taux de hit')
+    def hit_rate_display(self, obj):
+        return f"{obj.hit_rate:.0%}"
+
+
+@admin.register(StoredBlob)
+class StoredBlobAdmin(admin.ModelAdmin):
+    list_display = ('path', 'size', 'refcount', 'created_at')
+    search_fields = ('sha256', 'path')
+    readonly_fields = ('sha256', 'path', 'size', 'refcount', 'created_at')
+
+
+@admin.register(Keyword)
+class KeywordAdmin(admin.ModelAdmin):
+    list_display = ('name', 'slug', 'usage_count', 'created_at')
+    search_fields = ('name', 'slug')
+    ordering = ('-usage_count',)
+    readonly_fields = ('usage_count', 'created_at')
+
+
+@admin.register(RateLimitBucket)
+class RateLimitBucketAdmin(admin.ModelAdmin):
+    list_display = ('provider', 'available_requests', 'available_tokens', 'throttled_calls', 'throttled_seconds', 'rejected_calls', 'rate_limited_responses')
+    readonly_fields = ('refilled_at', 'throttled_calls', 'throttled_seconds', 'rejected_calls', 'rate_limited_responses')
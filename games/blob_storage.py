@@ -0,0 +1,176 @@
+import glob
+import hashlib
+import os
+import tempfile
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import StoredBlob
+
+# Les écritures du stockage viennent aussi des threads de génération d'images:
+# elles sont sérialisées dans le processus (SQLite n'accepte qu'un écrivain à la fois)
+write_lock = threading.RLock()
+
+
+def blob_path(subfolder, digest, extension):
+    """
+    Chemin relatif (à MEDIA_ROOT) d'un fichier adressé par son contenu, réparti
+    sur deux niveaux de sous-dossiers: <dossier>/ab/cd/abcd....<ext>
+    """
+    return f"{subfolder}/{digest[:2]}/{digest[2:4]}/{digest}.{extension}"
+
+def staging_dir():
+    """
+    Dossier des fichiers en cours d'écriture: hors de MEDIA_ROOT, pour qu'un
+    fichier pas encore validé ne soit jamais servi
+    """
+    os.makedirs(settings.BLOB_STAGING_DIR, exist_ok=True)
+    return settings.BLOB_STAGING_DIR
+
+def save_chunks(chunks, subfolder, extension, validate=None):
+    """
+    Écrit des blocs d'octets dans le stockage adressé par contenu et retourne
+    le chemin relatif du fichier. Le contenu est d'abord écrit dans un fichier
+    temporaire (en calculant son empreinte) ; un contenu déjà stocké n'est pas
+    réécrit et garde son chemin d'origine, quel que soit `subfolder`.
+    validate(chemin_temporaire) peut lever une exception pour refuser le
+    fichier, ou retourner l'extension réelle du contenu.
+
+    Le fichier n'est compté comme référencé qu'à l'appel de add_references,
+    une fois enregistré le modèle qui l'utilise ; un fichier jamais référencé
+    est supprimé par collect_orphans.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=staging_dir(), suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in chunks:
+                digest.update(chunk)
+                size += len(chunk)
+                f.write(chunk)
+
+        if validate is not None:
+            extension = validate(tmp_path) or extension
+
+        return _store(tmp_path, digest.hexdigest(), blob_path(subfolder, digest.hexdigest(), extension), size)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def save_bytes(data, subfolder, extension):
+    return save_chunks([data], subfolder, extension)
+
+def _store(tmp_path, digest, relative_path, size):
+    """
+    Met le fichier temporaire en place sous le verrou de sa ligne StoredBlob:
+    une suppression concurrente (release) ne peut pas retirer le fichier entre
+    la vérification de sa présence et l'enregistrement
+    """
+    with write_lock, transaction.atomic():
+        blob = StoredBlob.objects.select_for_update().filter(sha256=digest).first()
+        if blob is None:
+            try:
+                with transaction.atomic():
+                    blob = StoredBlob.objects.create(
+                        sha256=digest, path=relative_path, size=size, refcount=0,
+                        last_stored_at=timezone.now()
+                    )
+            except IntegrityError:
+                # Le même contenu a été enregistré en parallèle
+                blob = StoredBlob.objects.select_for_update().get(sha256=digest)
+        else:
+            # Repousse le ramassage tant que l'appelant n'a pas ajouté sa référence
+            StoredBlob.objects.filter(id=blob.id).update(last_stored_at=timezone.now())
+
+        absolute_path = os.path.join(settings.MEDIA_ROOT, blob.path)
+        if not os.path.exists(absolute_path):
+            os.makedirs(os.path.dirname(absolute_path), exist_ok=True)
+            os.replace(tmp_path, absolute_path)
+    return blob.path
+
+def add_references(paths):
+    """
+    Compte une référence par chemin (un même chemin peut apparaître plusieurs
+    fois). À appeler dans la transaction qui enregistre les modèles.
+    """
+    counts = {}
+    for path in paths:
+        if path:
+            counts[path] = counts.get(path, 0) + 1
+    with write_lock:
+        for path, count in counts.items():
+            StoredBlob.objects.filter(path=path).update(refcount=F('refcount') + count)
+
+def release(relative_path, extra_paths=()):
+    """
+    Retire une référence au fichier. Quand plus aucune image ne l'utilise, le
+    fichier (et ses fichiers dérivés extra_paths) est supprimé à la validation
+    de la transaction. Retourne False si le fichier n'est pas géré par ce
+    stockage (il n'est alors pas touché).
+    """
+    if not relative_path:
+        return False
+
+    with write_lock, transaction.atomic():
+        blob = StoredBlob.objects.select_for_update().filter(path=relative_path).first()
+        if blob is None:
+            return False
+        if blob.refcount > 1:
+            StoredBlob.objects.filter(id=blob.id).update(refcount=F('refcount') - 1)
+            return True
+        blob.delete()
+        _remove_files_on_commit(relative_path, extra_paths)
+    return True
+
+def collect_orphans(grace=None):
+    """
+    Supprime les fichiers stockés qu'aucun modèle n'a référencés (image
+    terminée après l'abandon d'une génération, erreur avant l'enregistrement
+    des personnages...). Un délai de grâce laisse le temps à une génération
+    en cours d'ajouter sa référence. Retourne le nombre de fichiers supprimés.
+    """
+    grace = settings.BLOB_ORPHAN_GRACE if grace is None else grace
+    cutoff = timezone.now() - timedelta(seconds=grace)
+    removed = 0
+    for blob_id in StoredBlob.objects.filter(refcount=0, last_stored_at__lt=cutoff).values_list('id', flat=True):
+        with write_lock, transaction.atomic():
+            blob = StoredBlob.objects.select_for_update().filter(
+                id=blob_id, refcount=0, last_stored_at__lt=cutoff
+            ).first()
+            if blob is None:
+                continue
+            blob.delete()
+            _remove_files_on_commit(blob.path)
+            removed += 1
+    return removed
+
+def _remove_files_on_commit(relative_path, extra_paths=()):
+    # Les fichiers ne sont supprimés qu'une fois la suppression de la ligne
+    # validée: une transaction annulée garde une ligne et un fichier cohérents
+    transaction.on_commit(lambda: _remove_unreferenced_files(relative_path, extra_paths))
+
+def _remove_unreferenced_files(relative_path, extra_paths=()):
+    with write_lock:
+        # Même contenu stocké à nouveau entre la validation et ce rappel
+        if StoredBlob.objects.filter(path=relative_path).exists():
+            return
+        _remove_files(relative_path, extra_paths)
+
+def _remove_files(relative_path, extra_paths=()):
+    # Les déclinaisons redimensionnées sont nommées d'après le fichier source
+    folder, filename = os.path.split(relative_path)
+    stem = os.path.splitext(filename)[0]
+    variants = glob.glob(os.path.join(settings.MEDIA_ROOT, folder, 'variants', f"{glob.escape(stem)}-*"))
+
+    paths = [os.path.join(settings.MEDIA_ROOT, path) for path in (relative_path, *extra_paths)]
+    for path in set(paths + variants):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
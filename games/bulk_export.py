@@ -0,0 +1,242 @@
+import json
+import multiprocessing
+import os
+import threading
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import islice
+
+import django
+from django.conf import settings
+from django.utils.text import slugify
+
+from .models import Game
+
+# Taille des blocs copiés du PDF en cache vers l'archive
+COPY_CHUNK_SIZE = 64 * 1024
+
+# Pool de rendu partagé par toutes les exportations du processus, créé au premier besoin
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class _ZipStream:
+    """
+    Fichier en écriture seule et non positionnable pour zipfile: les octets
+    écrits sont conservés jusqu'à leur envoi (drain), de sorte que l'archive
+    n'est jamais entièrement en mémoire
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+def _get_executor(workers=None):
+    """
+    Pool de processus partagé: les exportations simultanées se partagent ses
+    BULK_EXPORT_WORKERS processus au lieu d'en démarrer chacune autant.
+    `workers` n'est pris en compte qu'à la création du pool.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=workers or settings.BULK_EXPORT_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+                # Processus démarrés avec 'spawn': Django doit y être initialisé avant
+                # de recevoir la première tâche (qui importe les modèles)
+                initializer=django.setup
+            )
+        return _executor
+
+def _discard_executor(executor):
+    # Un processus du pool est mort: le pool suivant repart de zéro
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+def shutdown_executor():
+    """
+    Arrête le pool partagé (fin de la commande export_games)
+    """
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown()
+
+def _render_pdf(game_id):
+    """
+    Exécuté dans un processus du pool: retourne le chemin du PDF en cache,
+    ses octets si le cache est désactivé, ou None
+    """
+    from django.db import connection
+
+    from .pdf_export import get_or_render_pdf
+
+    try:
+        game = Game.objects.filter(id=game_id).first()
+        if game is None:
+            return None
+        pdf, fingerprint = get_or_render_pdf(game)
+        return pdf
+    except Exception as e:
+        print(f"Erreur lors du rendu du PDF du jeu {game_id}: {e}")
+        return None
+    finally:
+        connection.close()
+
+def game_export_data(game):
+    """
+    Document JSON exporté pour un jeu (contenu complet, images en chemins relatifs)
+    """
+    return {
+        'id': game.id,
+        'title': game.title,
+        'genre': game.genre,
+        'ambiance': game.ambiance,
+        'keywords': [tag.name for tag in game.tags.all()],
+        'references': game.references,
+        'universe_description': game.universe_description,
+        'story': {
+            'act1': game.story_act1,
+            'act2': game.story_act2,
+            'act3': game.story_act3,
+        },
+        'has_dynamic_narrative': game.has_dynamic_narrative,
+        'current_act': game.current_act,
+        'characters': [
+            {
+                'name': character.name,
+                'role': character.role,
+                'background': character.background,
+                'abilities': character.abilities,
+                'image': character.image.name or None,
+            }
+            for character in game.characters.all()
+        ],
+        'locations': [
+            {
+                'name': location.name,
+                'description': location.description,
+                'image': location.image.name or None,
+            }
+            for location in game.locations.all()
+        ],
+        'narrative_history': [
+            {
+                'act': entry.act,
+                'choice_text': entry.choice_text,
+                'outcome_description': entry.outcome_description,
+                'created_at': entry.created_at.isoformat(),
+            }
+            for entry in game.narrative_history.all()
+        ],
+        'created_at': game.created_at.isoformat(),
+        'updated_at': game.updated_at.isoformat(),
+    }
+
+def iter_games_zip(game_ids, workers=None):
+    """
+    Produit, bloc par bloc, une archive ZIP contenant un PDF et un document
+    JSON par jeu. Les PDF sont rendus dans le pool de processus partagé ;
+    seuls quelques rendus par archive sont en cours à la fois pour que la
+    mémoire reste constante quel que soit le nombre de jeux.
+
+    Les processus du pool sont démarrés avec 'spawn', qui réimporte le module
+    principal: un script qui appelle cette fonction (ou write_games_zip) doit
+    protéger son code par `if __name__ == '__main__':`, sinon chaque processus
+    du pool le réexécute (manage.py l'est déjà).
+    """
+    workers = workers or settings.BULK_EXPORT_WORKERS
+    stream = _ZipStream()
+    archive = zipfile.ZipFile(stream, 'w', compression=zipfile.ZIP_DEFLATED)
+    executor = _get_executor(workers)
+    pending = deque()
+
+    try:
+        ids = iter(game_ids)
+        pending.extend((game_id, executor.submit(_render_pdf, game_id)) for game_id in islice(ids, workers * 2))
+
+        while pending:
+            game_id, future = pending.popleft()
+            # Garder le pool occupé pendant l'écriture de ce jeu
+            next_id = next(ids, None)
+            if next_id is not None:
+                pending.append((next_id, executor.submit(_render_pdf, next_id)))
+
+            game = Game.objects.filter(id=game_id).prefetch_related(
+                'tags', 'characters', 'locations', 'narrative_history'
+            ).first()
+            if game is None:
+                future.cancel()
+                continue
+
+            basename = f"{game.id}-{slugify(game.title) or 'jeu'}"
+            archive.writestr(
+                f"{basename}.json",
+                json.dumps(game_export_data(game), ensure_ascii=False, indent=2)
+            )
+            yield stream.drain()
+
+            pdf = future.result()
+            if pdf is None:
+                continue
+            if isinstance(pdf, bytes):
+                archive.writestr(f"{basename}.pdf", pdf)
+                yield stream.drain()
+                continue
+
+            with open(pdf, 'rb') as source, archive.open(f"{basename}.pdf", 'w') as dest:
+                while True:
+                    chunk = source.read(COPY_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    dest.write(chunk)
+                    yield stream.drain()
+            yield stream.drain()
+
+        archive.close()
+        yield stream.drain()
+    except BrokenProcessPool:
+        _discard_executor(executor)
+        raise
+    finally:
+        # Le pool reste ouvert pour les exportations suivantes: seuls les rendus
+        # de cette archive encore en file sont annulés
+        for game_id, future in pending:
+            future.cancel()
+
+def write_games_zip(game_ids, path, workers=None):
+    """
+    Écrit l'archive dans un fichier (commande export_games) et retourne sa
+    taille. Comme pour iter_games_zip, un script appelant doit être protégé
+    par `if __name__ == '__main__':`.
+    """
+    size = 0
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            for chunk in iter_games_zip(game_ids, workers=workers):
+                f.write(chunk)
+                size += len(chunk)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return size
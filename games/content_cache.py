@@ -0,0 +1,91 @@
+import hashlib
+import json
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import ContentCacheKey, ContentCacheVariant
+
+
+def normalize_request(genre, ambiance, keywords, references):
+    """
+    Normalise les paramètres de création d'un concept pour que deux requêtes
+    équivalentes (casse, espaces, ordre des mots-clés) partagent la même clé
+    """
+    keyword_set = {keyword.strip().lower() for keyword in (keywords or '').split(',') if keyword.strip()}
+    return {
+        'genre': (genre or '').strip().lower(),
+        'ambiance': (ambiance or '').strip().lower(),
+        'keywords': ', '.join(sorted(keyword_set)),
+        'references': ' '.join((references or '').lower().split()),
+        'model': settings.LLM_MODEL,
+        'temperature': settings.GAME_CONTENT_TEMPERATURE,
+    }
+
+def cache_key(normalized):
+    payload = json.dumps(normalized, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def get_variant(normalized):
+    """
+    Retourne une variante en cache pour cette requête, ou None si le pool de
+    variantes n'est pas encore plein (l'appelant doit alors générer une
+    nouvelle variante et l'enregistrer avec store_variant)
+    """
+    if not settings.GAME_CONTENT_CACHE_ENABLED:
+        return None
+
+    key = cache_key(normalized)
+    entry = ContentCacheKey.objects.filter(key=key).first()
+    if entry is None:
+        return None
+
+    # Les variantes expirées sont supprimées au passage
+    expiry = timezone.now() - timedelta(seconds=settings.GAME_CONTENT_CACHE_TTL)
+    entry.variants.filter(created_at__lt=expiry).delete()
+
+    variants = list(entry.variants.all())
+    if len(variants) < settings.GAME_CONTENT_CACHE_VARIANTS:
+        ContentCacheKey.objects.filter(id=entry.id).update(misses=F('misses') + 1)
+        return None
+
+    variant = random.choice(variants)
+    ContentCacheVariant.objects.filter(id=variant.id).update(hits=F('hits') + 1)
+    ContentCacheKey.objects.filter(id=entry.id).update(hits=F('hits') + 1, last_hit_at=timezone.now())
+    return variant.payload
+
+def store_variant(normalized, payload):
+    """
+    Ajoute une réponse générée au pool de variantes de cette requête, sauf si
+    des générations concurrentes l'ont déjà rempli entre-temps
+    """
+    if not settings.GAME_CONTENT_CACHE_ENABLED:
+        return
+
+    key = cache_key(normalized)
+    try:
+        ContentCacheKey.objects.get_or_create(
+            key=key,
+            defaults={
+                'genre': normalized['genre'][:20],
+                'ambiance': normalized['ambiance'][:20],
+                'keywords': normalized['keywords'][:200],
+                'references': normalized['references'][:200],
+                'model': normalized['model'][:100],
+                'misses': 1,
+            }
+        )
+    except IntegrityError:
+        pass
+
+    # Le verrou de la clé sérialise le comptage et l'ajout des variantes
+    with transaction.atomic():
+        entry = ContentCacheKey.objects.select_for_update().get(key=key)
+        expiry = timezone.now() - timedelta(seconds=settings.GAME_CONTENT_CACHE_TTL)
+        if entry.variants.filter(created_at__gte=expiry).count() >= settings.GAME_CONTENT_CACHE_VARIANTS:
+            return
+        ContentCacheVariant.objects.create(cache_key=entry, payload=payload)
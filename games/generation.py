@@ -0,0 +1,550 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.conf import settings
+from django.db import connection, transaction
+from PIL import Image
+
+from . import (blob_storage, content_cache, http_client, image_cache,
+               image_variants, llm, pdf_export, rate_limit, scheduler, search)
+from .json_stream import ConceptStreamParser
+from .models import Character, Game, Location
+
+
+# Taille des blocs lus lors du téléchargement et de la copie des images
+IMAGE_CHUNK_SIZE = 64 * 1024
+
+STREAMED_FIELDS = ('title', 'universe_description', 'story_act1', 'story_act2', 'story_act3')
+
+
+def build_game_content_messages(genre, ambiance, keywords, references):
+    """
+    Construit les messages envoyés au LLM pour générer un concept de jeu
+    """
+    # Préparation du prompt pour l'API
+    prompt = f"""
+    Crée un concept de jeu vidéo original avec les paramètres suivants:
+    - Genre: {genre}
+    - Ambiance: {ambiance}
+    - Mots-clés: {keywords}
+    - Références (si spécifiées): {references}
+    
+    Renvoie uniquement un objet JSON avec le format suivant, sans explications ni guillemets supplémentaires:
+    {{
+      "title": "Titre du jeu",
+      "universe_description": "Description détaillée de l'univers du jeu",
+      "story_act1": "Description de l'acte 1 du scénario",
+      "story_act2": "Description de l'acte 2 du scénario avec retournement",
+      "story_act3": "Description de l'acte 3 et conclusion",
+      "characters": [
+        {{
+          "name": "Nom du personnage 1",
+          "role": "Rôle dans l'histoire",
+          "background": "Histoire et motivations",
+          "abilities": "Capacités et compétences"
+        }},
+        {{
+          "name": "Nom du personnage 2",
+          "role": "Rôle dans l'histoire",
+          "background": "Histoire et motivations",
+          "abilities": "Capacités et compétences"
+        }}
+      ],
+      "locations": [
+        {{
+          "name": "Nom du lieu 1",
+          "description": "Description immersive du lieu"
+        }},
+        {{
+          "name": "Nom du lieu 2",
+          "description": "Description immersive du lieu"
+        }}
+      ]
+    }}
+    """
+    
+    return [
+        {"role": "system", "content": "Tu es un concepteur de jeux vidéo professionnel spécialisé dans la création de concepts originaux."},
+        {"role": "user", "content": prompt}
+    ]
+
+def parse_game_content(result_text):
+    """
+    Extrait l'objet JSON du concept de la réponse du LLM, ou None si invalide
+    """
+    # Trouver le début et la fin du JSON dans la réponse
+    json_start = result_text.find('{')
+    json_end = result_text.rfind('}') + 1
+    
+    if json_start >= 0 and json_end > json_start:
+        json_text = result_text[json_start:json_end]
+        try:
+            return json.loads(json_text)
+        except json.JSONDecodeError:
+            print("Erreur: La réponse de l'API n'est pas au format JSON valide")
+    else:
+        print("Erreur: Impossible de trouver du JSON dans la réponse")
+    return None
+
+def fallback_game_content():
+    """
+    Données par défaut utilisées quand le LLM ne répond pas correctement
+    """
+    return {
+        "title": "Nouveau Jeu",
+        "universe_description": "Un univers mystérieux à explorer.",
+        "story_act1": "Le début de l'aventure...",
+        "story_act2": "Le coeur de l'histoire...",
+        "story_act3": "La conclusion épique...",
+        "characters": [
+            {
+                "name": "Héros",
+                "role": "Protagoniste principal",
+                "background": "Origine inconnue",
+                "abilities": "Détermination et courage"
+            }
+        ],
+        "locations": [
+            {
+                "name": "Monde initial",
+                "description": "Le point de départ de l'aventure"
+            }
+        ]
+    }
+
+def stream_game_creation(owner, params, on_image_progress=None, on_game_saved=None):
+    """
+    Génère un concept avec l'API de streaming et produit des événements
+    (nom, données) au fil de l'eau. Les images d'un personnage ou d'un lieu
+    sont lancées dès que son objet JSON est complet, pendant que le LLM écrit
+    la suite. Le jeu n'est enregistré qu'une fois le flux terminé ;
+    on_game_saved(jeu, concept) est appelé dans la même transaction.
+    """
+    genre, ambiance = params['genre'], params['ambiance']
+    keywords, references = params['keywords'], params.get('references', '')
+    default_character_name = params.get('default_character_name', 'Unknown Character')
+    default_location_name = params.get('default_location_name', 'Unknown Location')
+    
+    # Jeu non enregistré servant à construire les prompts d'images pendant le flux
+    draft = Game(owner=owner, genre=genre, ambiance=ambiance, title=params.get('default_title', 'Untitled Game'))
+    fan_out = ImageFanOut(owner_id=owner.id)
+    
+    try:
+        yield 'status', {'message': "Génération du concept...", 'progress': 5}
+        
+        normalized_request = content_cache.normalize_request(genre, ambiance, keywords, references)
+        game_data = content_cache.get_variant(normalized_request)
+        
+        if game_data is None:
+            if llm.get_client() is None:
+                yield 'error', {'message': "Erreur lors de la génération du contenu du jeu."}
+                return
+            
+            parser = ConceptStreamParser(text_fields=STREAMED_FIELDS, entity_arrays=('characters', 'locations'))
+            try:
+                for delta in llm.stream_chat_completion(
+                    messages=build_game_content_messages(genre, ambiance, keywords, references),
+                    max_tokens=2000,
+                    temperature=settings.GAME_CONTENT_TEMPERATURE,
+                    # Création de concept: classe BULK, passée explicitement car
+                    # un générateur ne garde pas son contexte entre deux itérations
+                    work=scheduler.Work(owner.id, scheduler.BULK)
+                ):
+                    for event in parser.feed(delta):
+                        if event.kind == 'field':
+                            yield 'field', {'name': event.name, 'delta': event.value}
+                            continue
+                        # Personnage ou lieu complet: lancer son image immédiatement
+                        draft.title = parser.fields.get('title') or draft.title
+                        if event.name == 'characters':
+                            character = build_character(draft, event.value, default_character_name)
+                            fan_out.submit(('characters', event.index), *character_image_request(draft, character))
+                        else:
+                            location = build_location(draft, event.value, default_location_name)
+                            fan_out.submit(('locations', event.index), *location_image_request(draft, location))
+            except (rate_limit.RateLimitExceeded, scheduler.QueueTimeout) as e:
+                # Quota ou file saturés: un concept de secours serait pris pour un vrai résultat
+                print(f"Génération du concept abandonnée: {e}")
+                yield 'error', {'message': "Le service de génération est saturé, réessayez dans quelques minutes."}
+                return
+            except Exception as e:
+                print(f"Erreur lors de l'appel à l'API OpenAI: {e}")
+            
+            game_data = parse_game_content(parser.text)
+            if game_data is not None:
+                content_cache.store_variant(normalized_request, game_data)
+            else:
+                # Les images déjà lancées ne correspondent plus au concept final
+                fan_out.shutdown()
+                fan_out = ImageFanOut(owner_id=owner.id)
+                game_data = fallback_game_content()
+                yield 'reset', {}
+                for name in STREAMED_FIELDS:
+                    yield 'field', {'name': name, 'delta': game_data.get(name, '')}
+        else:
+            for name in STREAMED_FIELDS:
+                yield 'field', {'name': name, 'delta': game_data.get(name, '')}
+        
+        yield 'status', {'message': "Génération des images...", 'progress': 40}
+        draft.title = game_data.get('title', draft.title)
+        characters, locations = generate_game_assets(
+            draft,
+            game_data,
+            default_character_name=default_character_name,
+            default_location_name=default_location_name,
+            on_progress=on_image_progress,
+            fan_out=fan_out
+        )
+        # Jeu, personnages et lieux enregistrés ensemble: l'index de recherche
+        # (signal post_save, après validation) les voit en une seule fois
+        with transaction.atomic():
+            game = save_game(owner, params, game_data)
+            save_game_assets(game, characters, locations)
+            if on_game_saved is not None:
+                on_game_saved(game, game_data)
+        pdf_export.schedule_pdf_prerender(game)
+        yield 'done', {'game_id': game.id}
+    finally:
+        fan_out.shutdown()
+
+def save_game(owner, params, game_data):
+    """
+    Enregistre le jeu à partir des paramètres de création et du contenu généré
+    """
+    game = Game(
+        owner=owner,
+        title=game_data.get('title', params.get('default_title', 'Untitled Game')),
+        genre=params['genre'],
+        ambiance=params['ambiance'],
+        keywords=params['keywords'],
+        references=params.get('references', ''),
+        universe_description=game_data.get('universe_description', ''),
+        story_act1=game_data.get('story_act1', ''),
+        story_act2=game_data.get('story_act2', ''),
+        story_act3=game_data.get('story_act3', ''),
+        has_dynamic_narrative=params.get('has_dynamic_narrative', False)
+    )
+    game.save()
+    return game
+
+def create_game_from_params(owner, params, on_progress=None, on_game_saved=None, on_text=None):
+    """
+    Génère un concept complet (texte puis images) à partir des paramètres
+    d'un formulaire ou d'une tâche de génération. Retourne le jeu créé ou None.
+    on_text(champs) reçoit, au fil du flux, le texte déjà généré de chaque
+    champ diffusé (aperçu en direct de la page de création).
+    """
+    report = on_progress or (lambda progress, message: None)
+    show_text = on_text or (lambda fields: None)
+    fields = {}
+
+    for event, data in stream_game_creation(
+        owner, params, on_image_progress=_image_progress(report), on_game_saved=on_game_saved
+    ):
+        if event == 'field':
+            fields[data['name']] = fields.get(data['name'], '') + data['delta']
+            show_text(fields)
+        elif event == 'reset':
+            fields = {}
+            show_text(fields)
+        elif event == 'status':
+            report(data['progress'], data['message'])
+        elif event == 'error':
+            return None
+        elif event == 'done':
+            return Game.objects.get(id=data['game_id'])
+    return None
+
+def resume_game_creation(game, params, game_data, on_progress=None):
+    """
+    Termine un jeu enregistré par une génération interrompue (worker arrêté
+    avant la fin), à partir du concept conservé avec la tâche. Les
+    personnages et lieux ne sont créés que si aucun n'existe: ils sont
+    enregistrés ensemble, dans une seule transaction.
+    """
+    report = on_progress or (lambda progress, message: None)
+    if not game.characters.exists() and not game.locations.exists():
+        report(40, "Reprise de la génération des images...")
+        create_game_assets(
+            game,
+            game_data,
+            default_character_name=params.get('default_character_name', 'Unknown Character'),
+            default_location_name=params.get('default_location_name', 'Unknown Location'),
+            on_progress=_image_progress(report)
+        )
+    pdf_export.schedule_pdf_prerender(game)
+    return game
+
+def _image_progress(report):
+    def report_images(done, total):
+        report(40 + int(55 * done / total), f"Images générées: {done}/{total}")
+    return report_images
+
+def build_character(game, char_data, default_name='Unknown Character'):
+    return Character(
+        game=game,
+        name=char_data.get('name', default_name),
+        role=char_data.get('role', 'Unknown Role'),
+        background=char_data.get('background', ''),
+        abilities=char_data.get('abilities', '')
+    )
+
+def build_location(game, loc_data, default_name='Unknown Location'):
+    return Location(
+        game=game,
+        name=loc_data.get('name', default_name),
+        description=loc_data.get('description', '')
+    )
+
+def character_image_request(game, character):
+    return (
+        f"Portrait of {character.name}, a {character.role} from a {game.genre_name} game with {game.ambiance_name} ambiance.",
+        f"character_{character.name}",
+        "characters"
+    )
+
+def location_image_request(game, location):
+    return (
+        f"{location.name} from a {game.genre_name} game with {game.ambiance_name} ambiance, {game.title}.",
+        f"location_{location.name}",
+        "locations"
+    )
+
+def create_game_assets(game, game_data, default_character_name='Unknown Character',
+                       default_location_name='Unknown Location', on_progress=None, fan_out=None):
+    """
+    Crée les personnages et les lieux d'un jeu déjà enregistré et génère leurs
+    images en parallèle
+    """
+    characters, locations = generate_game_assets(
+        game, game_data, default_character_name, default_location_name, on_progress, fan_out
+    )
+    with transaction.atomic():
+        save_game_assets(game, characters, locations)
+        # bulk_create n'émet pas de signal: noms des personnages et lieux à indexer
+        game_id = game.id
+        transaction.on_commit(lambda: search.index_game_by_id(game_id))
+    return characters, locations
+
+def generate_game_assets(game, game_data, default_character_name='Unknown Character',
+                         default_location_name='Unknown Location', on_progress=None, fan_out=None):
+    """
+    Construit (sans les enregistrer) les personnages et les lieux d'un jeu,
+    éventuellement pas encore enregistré, et génère leurs images en parallèle.
+    Les images déjà lancées sur fan_out (pendant le streaming) sont réutilisées.
+    """
+    characters = [
+        build_character(game, char_data, default_character_name)
+        for char_data in game_data.get('characters', [])
+    ]
+    locations = [
+        build_location(game, loc_data, default_location_name)
+        for loc_data in game_data.get('locations', [])
+    ]
+
+    owns_fan_out = fan_out is None
+    fan_out = fan_out or ImageFanOut(owner_id=game.owner_id)
+    try:
+        # Lancer les images qui ne l'ont pas encore été
+        keys = []
+        for index, character in enumerate(characters):
+            keys.append(('characters', index))
+            fan_out.submit(keys[-1], *character_image_request(game, character))
+        for index, location in enumerate(locations):
+            keys.append(('locations', index))
+            fan_out.submit(keys[-1], *location_image_request(game, location))
+
+        images = fan_out.collect(keys, on_progress=on_progress)
+    finally:
+        if owns_fan_out:
+            fan_out.shutdown()
+
+    # Les écritures en base restent dans le thread de la requête
+    for key, instance in zip(keys, characters + locations):
+        path, variants = images.get(key, (None, {}))
+        if path:
+            instance.image = path
+            instance.image_variants = variants
+    return characters, locations
+
+def save_game_assets(game, characters, locations):
+    """
+    Enregistre les personnages et lieux générés pour ce jeu. Les références
+    aux images stockées sont comptées avec eux: à appeler dans une transaction.
+    """
+    for instance in characters + locations:
+        instance.game = game
+    Character.objects.bulk_create(characters)
+    Location.objects.bulk_create(locations)
+    blob_storage.add_references(instance.image.name for instance in characters + locations)
+
+
+class ImageFanOut:
+    """
+    Pool borné de générations d'images, alimenté au fur et à mesure que les
+    prompts sont connus. Chaque image est identifiée par une clé; une clé
+    déjà soumise n'est pas relancée. Les appels sont attribués à owner_id
+    dans la classe IMAGE de l'ordonnanceur.
+    """
+
+    def __init__(self, max_workers=None, owner_id=None):
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(1, max_workers or settings.IMAGE_GENERATION_MAX_WORKERS)
+        )
+        self._work = scheduler.Work(owner_id, scheduler.IMAGE)
+        self._futures = {}
+
+    def submit(self, key, prompt, filename, subfolder):
+        if key not in self._futures:
+            self._futures[key] = self._executor.submit(
+                scheduler.run_as, self._work, generate_and_save_image, prompt, filename, subfolder
+            )
+
+    def collect(self, keys, on_progress=None):
+        """
+        Attend les images demandées et retourne {clé: (chemin ou None, déclinaisons)}.
+        on_progress(done, total) est appelé depuis le thread appelant.
+        """
+        futures = {self._futures[key]: key for key in keys}
+        results = {}
+        for done, future in enumerate(as_completed(futures), start=1):
+            try:
+                results[futures[future]] = future.result()
+            except Exception as e:
+                print(f"Error during concurrent image generation: {e}")
+                results[futures[future]] = (None, {})
+            if on_progress:
+                on_progress(done, len(futures))
+        return results
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+def generate_and_save_image(prompt, filename, subfolder):
+    """
+    Generates an image for the prompt, saves it and builds its resized variants,
+    returning (relative path, variants) or (None, {}).
+    Runs in a pool thread, so the thread's database connection is closed when done.
+    """
+    try:
+        path = generate_image(prompt, filename, subfolder)
+        if not path:
+            return None, {}
+        return path, image_variants.build_variants(path)
+    finally:
+        connection.close()
+
+def generate_image(prompt, filename, subfolder):
+    """
+    Function that uses Hugging Face's Stable Diffusion API to generate an image.
+    The response is streamed to disk (never held in memory) and saved in media
+    storage; returns the relative path for the ImageField, or None.
+    """
+    # Get Hugging Face API token from environment variables
+    hf_token = os.getenv('HUGGINGFACE_TOKEN')
+    
+    # Hugging Face API configuration
+    API_URL = settings.HUGGINGFACE_IMAGE_API_URL
+    headers = {"Authorization": f"Bearer {hf_token}"}
+    
+    # Un prompt déjà généré est servi depuis le cache sans appel distant
+    cached_path = image_cache.get_path(prompt)
+    if cached_path:
+        return cached_path
+    
+    try:
+        # Send request to Hugging Face API (shared pooled session with timeouts and retries)
+        with http_client.post(API_URL, headers=headers, json={"inputs": prompt}, stream=True) as response:
+            # Check if the request was successful
+            if response.status_code != 200:
+                print(f"Error from Hugging Face API: Status {response.status_code}")
+                print(f"Response: {response.text[:1000]}")
+                return None
+            
+            # Refuser d'emblée une réponse qui n'est pas une image ou trop volumineuse
+            content_type = response.headers.get('Content-Type', '')
+            if content_type and not content_type.startswith('image/'):
+                print(f"Error from Hugging Face API: unexpected content type {content_type}")
+                return None
+            content_length = response.headers.get('Content-Length')
+            if content_length and content_length.isdigit() and int(content_length) > settings.IMAGE_MAX_BYTES:
+                print(f"Error from Hugging Face API: image too large ({content_length} bytes)")
+                return None
+            
+            path = save_image_chunks(response.iter_content(chunk_size=IMAGE_CHUNK_SIZE), filename, subfolder)
+    
+    except Exception as e:
+        print(f"Error during image generation: {e}")
+        return None
+    
+    if path:
+        image_cache.put(prompt, path)
+    return path
+
+
+class InvalidImageError(Exception):
+    pass
+
+
+def validated_image_chunks(chunks):
+    """
+    Vérifie au fil de l'eau que les blocs reçus forment une image (signature
+    du format) et ne dépassent pas IMAGE_MAX_BYTES ; lève InvalidImageError
+    dès qu'une vérification échoue, sans attendre la fin du téléchargement
+    """
+    header = b''
+    size = 0
+    for chunk in chunks:
+        if not chunk:
+            continue
+        size += len(chunk)
+        if size > settings.IMAGE_MAX_BYTES:
+            raise InvalidImageError(f"image larger than {settings.IMAGE_MAX_BYTES} bytes")
+        if len(header) < 12:
+            header += chunk[:12 - len(header)]
+            if len(header) >= 12 and not _is_image_header(header):
+                raise InvalidImageError("unrecognized image format")
+        yield chunk
+    
+    if not _is_image_header(header):
+        raise InvalidImageError("unrecognized image format")
+
+def _is_image_header(header):
+    return (
+        header.startswith(b'\xff\xd8\xff')                          # JPEG
+        or header.startswith(b'\x89PNG\r\n\x1a\n')                  # PNG
+        or (header[:4] == b'RIFF' and header[8:12] == b'WEBP')      # WebP
+        or header[:6] in (b'GIF87a', b'GIF89a')                     # GIF
+    )
+
+# Extension enregistrée pour chaque format détecté par Pillow
+IMAGE_EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp', 'GIF': 'gif'}
+
+def _validate_image(path):
+    """
+    Contrôle les dimensions de l'image et retourne l'extension de son format
+    réel. Pillow ne lit que l'en-tête: l'image n'est pas décodée.
+    """
+    with Image.open(path) as image:
+        width, height = image.size
+        image_format = image.format
+    if width * height > settings.IMAGE_MAX_PIXELS:
+        raise InvalidImageError(f"image dimensions too large ({width}x{height})")
+    if image_format not in IMAGE_EXTENSIONS:
+        raise InvalidImageError(f"unsupported image format {image_format}")
+    return IMAGE_EXTENSIONS[image_format]
+
+def save_image_chunks(chunks, filename, subfolder):
+    """
+    Enregistre une image reçue par blocs dans le stockage média après
+    validation ; retourne le chemin relatif ou None si l'image est refusée
+    """
+    # Le fichier est nommé par son contenu, avec l'extension de son format réel
+    try:
+        return blob_storage.save_chunks(
+            validated_image_chunks(chunks), subfolder, extension=None, validate=_validate_image
+        )
+    except (InvalidImageError, Image.DecompressionBombError, OSError) as e:
+        print(f"Error during image save: {e}")
+        return None
@@ -0,0 +1,123 @@
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from . import rate_limit
+
+_session = None
+_session_lock = threading.Lock()
+
+
+# Réponses relancées avec backoff exponentiel: 429 (quota) et 503 (modèle en
+# cours de chargement côté Hugging Face)
+RETRY_STATUSES = (429, 503)
+
+
+def _build_retry(retry_statuses=True):
+    """
+    Relance avec backoff exponentiel sur RETRY_STATUSES. POST est inclus car
+    les appels d'inférence sont sans effet de bord. Pour les hôtes soumis au
+    limiteur, seules les erreurs de connexion (requête jamais reçue) sont
+    relancées ici: les réponses 429/503 le sont par _request, qui repasse par
+    le limiteur à chaque tentative.
+    """
+    return Retry(
+        total=settings.HTTP_MAX_RETRIES,
+        connect=settings.HTTP_MAX_RETRIES,
+        read=0,
+        status=settings.HTTP_MAX_RETRIES if retry_statuses else 0,
+        status_forcelist=RETRY_STATUSES if retry_statuses else (),
+        allowed_methods=frozenset({'GET', 'POST'}),
+        backoff_factor=settings.HTTP_BACKOFF_FACTOR,
+        respect_retry_after_header=retry_statuses,
+        raise_on_status=False,
+    )
+
+def _build_adapter(pool_maxsize, retry_statuses=True):
+    return HTTPAdapter(
+        pool_connections=settings.HTTP_POOL_CONNECTIONS,
+        pool_maxsize=pool_maxsize,
+        max_retries=_build_retry(retry_statuses),
+    )
+
+def get_session():
+    """
+    Retourne la session HTTP partagée par tout le processus (créée au premier appel)
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                session.mount('https://', _build_adapter(settings.HTTP_POOL_MAXSIZE))
+                session.mount('http://', _build_adapter(settings.HTTP_POOL_MAXSIZE))
+                # Taille de pool spécifique pour certains hôtes
+                for host in set(settings.HTTP_POOL_MAXSIZE_PER_HOST) | set(settings.RATE_LIMIT_HOSTS):
+                    session.mount(f'https://{host}/', _build_adapter(
+                        settings.HTTP_POOL_MAXSIZE_PER_HOST.get(host, settings.HTTP_POOL_MAXSIZE),
+                        retry_statuses=host not in settings.RATE_LIMIT_HOSTS,
+                    ))
+                _session = session
+    return _session
+
+def _default_timeout():
+    return (settings.HTTP_CONNECT_TIMEOUT, settings.HTTP_READ_TIMEOUT)
+
+def _request(method, url, **kwargs):
+    kwargs.setdefault('timeout', _default_timeout())
+    # Les hôtes des fournisseurs d'IA passent par le limiteur partagé entre processus
+    provider = rate_limit.provider_for_host(urlsplit(url).hostname)
+    if not provider:
+        return get_session().request(method, url, **kwargs)
+
+    for attempt in range(settings.HTTP_MAX_RETRIES + 1):
+        # Tour attribué par l'ordonnanceur (utilisateur et classe du contexte courant), puis quota
+        with rate_limit.scheduled_call(provider):
+            response = get_session().request(method, url, **kwargs)
+        if response.status_code == 429:
+            rate_limit.report_rate_limited(provider)
+        if response.status_code not in RETRY_STATUSES or attempt == settings.HTTP_MAX_RETRIES:
+            return response
+        response.close()
+        # Après un 429, le seau vidé fait déjà patienter la tentative suivante
+        time.sleep(_retry_delay(response, attempt))
+
+def _retry_delay(response, attempt):
+    retry_after = response.headers.get('Retry-After', '')
+    if retry_after.isdigit():
+        return min(float(retry_after), settings.RATE_LIMIT_MAX_WAIT)
+    return settings.HTTP_BACKOFF_FACTOR * 2 ** attempt + random.uniform(0, 0.25)
+
+def post(url, **kwargs):
+    return _request('POST', url, **kwargs)
+
+def get(url, **kwargs):
+    return _request('GET', url, **kwargs)
+
+def get_pool_stats():
+    """
+    Compteurs par hôte: connexions ouvertes vs requêtes servies.
+    Les requêtes au-delà du nombre de connexions ont réutilisé une connexion du pool.
+    """
+    stats = {}
+    if _session is None:
+        return stats
+
+    adapters = {id(adapter): adapter for adapter in _session.adapters.values()}
+    for adapter in adapters.values():
+        pools = adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            host_stats = stats.setdefault(pool.host, {'new_connections': 0, 'requests': 0, 'reused': 0})
+            host_stats['new_connections'] += pool.num_connections
+            host_stats['requests'] += pool.num_requests
+            host_stats['reused'] += max(0, pool.num_requests - pool.num_connections)
+    return stats
@@ -0,0 +1,168 @@
+import hashlib
+import json
+import os
+import threading
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from . import blob_storage
+from .models import ImageCacheEntry
+
+# Compteurs du processus courant (les hits cumulés sont aussi stockés en base)
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'inserts': 0}
+
+
+def cache_key(prompt, model=None, parameters=None):
+    """
+    Clé de cache: empreinte SHA-256 de (modèle, prompt, paramètres)
+    """
+    payload = json.dumps(
+        {
+            'model': model or settings.HUGGINGFACE_IMAGE_API_URL,
+            'prompt': prompt,
+            'parameters': parameters or {},
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def _absolute_path(relative_path):
+    return os.path.join(settings.MEDIA_ROOT, relative_path)
+
+def _count(name, value=1):
+    with _stats_lock:
+        _stats[name] += value
+
+def _is_legacy(relative_path):
+    # Anciennes entrées: copie de l'image dans IMAGE_CACHE_DIR plutôt qu'une référence au stockage
+    return relative_path.startswith(f"{settings.IMAGE_CACHE_DIR}/")
+
+def get_path(prompt, parameters=None):
+    """
+    Retourne le chemin relatif (à MEDIA_ROOT) de l'image stockée pour ce
+    prompt, ou None. Une erreur de base de données est traitée comme un
+    défaut de cache.
+    """
+    if not settings.IMAGE_CACHE_ENABLED:
+        return None
+
+    key = cache_key(prompt, parameters=parameters)
+    try:
+        entry = ImageCacheEntry.objects.filter(key=key).first()
+        if entry is not None and (_is_legacy(entry.file) or not os.path.exists(_absolute_path(entry.file))):
+            # Fichier disparu ou copie d'avant le stockage par contenu: l'entrée n'est plus servie
+            with blob_storage.write_lock:
+                _delete_entry(entry)
+            entry = None
+        if entry is None:
+            _count('misses')
+            return None
+
+        with blob_storage.write_lock:
+            ImageCacheEntry.objects.filter(id=entry.id).update(hits=F('hits') + 1, last_used_at=timezone.now())
+    except DatabaseError as e:
+        print(f"Error while reading image cache: {e}")
+        _count('misses')
+        return None
+
+    _count('hits')
+    return entry.file
+
+def put(prompt, relative_path, parameters=None):
+    """
+    Associe au prompt une image déjà enregistrée dans le stockage par contenu.
+    L'entrée compte comme une référence au fichier: aucune copie n'est faite.
+    Une erreur d'écriture est ignorée (l'image générée reste valable).
+    """
+    if not settings.IMAGE_CACHE_ENABLED:
+        return
+
+    key = cache_key(prompt, parameters=parameters)
+    try:
+        size = os.path.getsize(_absolute_path(relative_path))
+        with blob_storage.write_lock, transaction.atomic():
+            if ImageCacheEntry.objects.filter(key=key).exists():
+                # Un autre thread a déjà mis ce prompt en cache
+                return
+            ImageCacheEntry.objects.create(
+                key=key, prompt=prompt, file=relative_path, size=size, last_used_at=timezone.now()
+            )
+            blob_storage.add_references([relative_path])
+    except (DatabaseError, OSError) as e:
+        print(f"Error while writing image cache entry: {e}")
+        return
+
+    # La limite de taille n'est vérifiée que toutes les IMAGE_CACHE_PRUNE_INTERVAL insertions
+    with _stats_lock:
+        _stats['inserts'] += 1
+        should_prune = _stats['inserts'] % settings.IMAGE_CACHE_PRUNE_INTERVAL == 0
+    if should_prune:
+        try:
+            prune()
+        except DatabaseError as e:
+            print(f"Error while pruning image cache: {e}")
+
+def prune(max_bytes=None):
+    """
+    Évince les entrées les moins récemment utilisées jusqu'à respecter max_bytes.
+    Retourne le nombre d'entrées supprimées.
+    """
+    max_bytes = settings.IMAGE_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    total = ImageCacheEntry.objects.aggregate(total=Sum('size'))['total'] or 0
+    if total <= max_bytes:
+        return 0
+
+    evicted = 0
+    for entry in ImageCacheEntry.objects.order_by('last_used_at').iterator():
+        if total <= max_bytes:
+            break
+        with blob_storage.write_lock:
+            _delete_entry(entry)
+        total -= entry.size
+        evicted += 1
+
+    _count('evictions', evicted)
+    return evicted
+
+def clear():
+    removed = 0
+    for entry in ImageCacheEntry.objects.iterator():
+        with blob_storage.write_lock:
+            _delete_entry(entry)
+        removed += 1
+    return removed
+
+def _delete_entry(entry):
+    # Le fichier est libéré par le signal post_delete (voir release_file)
+    ImageCacheEntry.objects.filter(id=entry.id).delete()
+
+def release_file(relative_path):
+    """
+    Retire la référence d'une entrée supprimée: l'image n'est effacée que si
+    aucun personnage ou lieu ne l'utilise
+    """
+    if not blob_storage.release(relative_path) and _is_legacy(relative_path):
+        try:
+            os.remove(_absolute_path(relative_path))
+        except FileNotFoundError:
+            pass
+
+def get_stats():
+    """
+    Statistiques du cache: contenu stocké, hits cumulés et compteurs du processus
+    """
+    aggregates = ImageCacheEntry.objects.aggregate(total_bytes=Sum('size'), total_hits=Sum('hits'))
+    with _stats_lock:
+        process_stats = dict(_stats)
+    return {
+        'entries': ImageCacheEntry.objects.count(),
+        'total_bytes': aggregates['total_bytes'] or 0,
+        'max_bytes': settings.IMAGE_CACHE_MAX_BYTES,
+        'total_hits': aggregates['total_hits'] or 0,
+        'process': process_stats,
+    }
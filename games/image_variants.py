@@ -0,0 +1,77 @@
+import os
+import tempfile
+
+from django.conf import settings
+from PIL import Image
+
+from . import blob_storage
+
+# Formats produits pour chaque largeur: (clé, format Pillow, extension)
+VARIANT_FORMATS = (
+    ('webp', 'WEBP', 'webp'),
+    ('jpeg', 'JPEG', 'jpg'),
+)
+
+
+def variant_path(relative_path, width, extension):
+    """
+    Chemin relatif (à MEDIA_ROOT) d'une déclinaison: <dossier>/variants/<nom>-<largeur>.<ext>
+    """
+    folder, filename = os.path.split(relative_path)
+    stem = os.path.splitext(filename)[0]
+    return f"{folder}/variants/{stem}-{width}.{extension}" if folder else f"variants/{stem}-{width}.{extension}"
+
+def build_variants(relative_path):
+    """
+    Crée les déclinaisons redimensionnées (WebP et JPEG) d'une image de
+    MEDIA_ROOT et retourne leur description pour le champ image_variants:
+    {'width': ..., 'height': ..., 'webp': {'320': chemin, ...}, 'jpeg': {...}}.
+    Retourne un dictionnaire vide si l'image ne peut pas être lue.
+    """
+    source = os.path.join(settings.MEDIA_ROOT, relative_path)
+    try:
+        with Image.open(source) as image:
+            image = image.convert('RGB')
+    except (OSError, ValueError) as e:
+        print(f"Error while reading image for variants: {e}")
+        return {}
+
+    original_width, original_height = image.size
+    # Largeurs plus petites que l'original, plus une version pleine taille plafonnée
+    largest = min(original_width, max(settings.IMAGE_VARIANT_WIDTHS))
+    widths = sorted({width for width in settings.IMAGE_VARIANT_WIDTHS if width < largest} | {largest})
+
+    variants = {'width': original_width, 'height': original_height}
+    for key, image_format, extension in VARIANT_FORMATS:
+        variants[key] = {}
+        for width in widths:
+            height = round(original_height * width / original_width)
+            path = variant_path(relative_path, width, extension)
+            absolute_path = os.path.join(settings.MEDIA_ROOT, path)
+            # Même image source (nommée par son contenu): déclinaison déjà produite
+            if not os.path.exists(absolute_path) and not _write_variant(
+                image, (width, height), absolute_path, image_format
+            ):
+                continue
+            variants[key][str(width)] = path
+    return variants
+
+def _write_variant(image, size, absolute_path, image_format):
+    """
+    Écrit une déclinaison dans un fichier temporaire puis la met en place par
+    os.replace: un lecteur ne voit jamais de fichier à moitié écrit
+    """
+    os.makedirs(os.path.dirname(absolute_path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=blob_storage.staging_dir(), suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as tmp_file:
+            resized = image if size == image.size else image.resize(size, Image.LANCZOS)
+            resized.save(tmp_file, image_format, quality=settings.IMAGE_VARIANT_QUALITY)
+        os.replace(tmp_path, absolute_path)
+        return True
+    except (OSError, ValueError) as e:
+        print(f"Error while writing image variant: {e}")
+        return False
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
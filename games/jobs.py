@@ -0,0 +1,199 @@
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import F
+from django.utils import timezone
+
+from . import http_client, scheduler
+from .generation import create_game_from_params, resume_game_creation
+from .models import Game, GenerationJob
+
+
+def enqueue_generation_job(owner, kind, params):
+    """
+    Ajoute une tâche de génération dans la file (la table GenerationJob)
+    """
+    return GenerationJob.objects.create(
+        owner=owner,
+        kind=kind,
+        params=params,
+        message="En attente d'un worker..."
+    )
+
+def claim_next_job():
+    """
+    Réserve la plus ancienne tâche en attente pour ce worker.
+    La réservation se fait par un UPDATE conditionnel sur le statut, ce qui
+    fonctionne sur MySQL comme sur SQLite sans verrou explicite.
+    """
+    candidate_ids = (
+        GenerationJob.objects
+        .filter(status=GenerationJob.STATUS_PENDING)
+        .order_by('created_at')
+        .values_list('id', flat=True)[:10]
+    )
+    for job_id in candidate_ids:
+        claimed = GenerationJob.objects.filter(
+            id=job_id,
+            status=GenerationJob.STATUS_PENDING
+        ).update(
+            status=GenerationJob.STATUS_RUNNING,
+            started_at=timezone.now(),
+            heartbeat_at=timezone.now(),
+            attempts=F('attempts') + 1,
+            message="Démarrage de la génération..."
+        )
+        if claimed:
+            return GenerationJob.objects.select_related('owner').get(id=job_id)
+    return None
+
+def update_job_progress(job, progress, message):
+    GenerationJob.objects.filter(id=job.id).update(
+        progress=progress, message=message[:200], heartbeat_at=timezone.now()
+    )
+
+def run_job(job):
+    """
+    Exécute une tâche réservée et enregistre son résultat. Le jeu et son
+    concept sont rattachés à la tâche dans la transaction qui enregistre le
+    jeu: une tâche remise en file après l'arrêt de son worker termine ce jeu
+    (images, index, PDF) au lieu d'en créer un second.
+    """
+    # Aperçu du texte écrit au plus toutes les GENERATION_STREAM_INTERVAL secondes
+    preview = {'fields': None, 'written_at': 0.0}
+
+    def write_preview():
+        if preview['fields'] is not None:
+            GenerationJob.objects.filter(id=job.id).update(preview=preview['fields'], heartbeat_at=timezone.now())
+            preview['fields'] = None
+            preview['written_at'] = time.monotonic()
+
+    def show_text(fields):
+        preview['fields'] = dict(fields)
+        if time.monotonic() - preview['written_at'] >= settings.GENERATION_STREAM_INTERVAL:
+            write_preview()
+
+    def report(progress, message):
+        write_preview()
+        update_job_progress(job, progress, message)
+
+    def attach_game(game, game_data):
+        GenerationJob.objects.filter(id=job.id).update(game=game, concept=game_data)
+
+    try:
+        game = Game.objects.filter(id=job.game_id).first() if job.game_id else None
+        if game is not None:
+            game = resume_game_creation(game, job.params, job.concept or {}, on_progress=report)
+        else:
+            game = create_game_from_params(
+                job.owner, job.params, on_progress=report, on_game_saved=attach_game, on_text=show_text
+            )
+    except Exception as e:
+        print(f"Erreur lors de l'exécution de la tâche {job.id}: {e}")
+        GenerationJob.objects.filter(id=job.id).update(
+            status=GenerationJob.STATUS_FAILED,
+            error=traceback.format_exc(),
+            message="Erreur lors de la génération du contenu du jeu.",
+            finished_at=timezone.now()
+        )
+        return None
+
+    if game is None:
+        GenerationJob.objects.filter(id=job.id).update(
+            status=GenerationJob.STATUS_FAILED,
+            message="Erreur lors de la génération du contenu du jeu.",
+            finished_at=timezone.now()
+        )
+        return None
+
+    return _finish_job(job, game)
+
+def _finish_job(job, game):
+    GenerationJob.objects.filter(id=job.id).update(
+        status=GenerationJob.STATUS_DONE,
+        game=game,
+        progress=100,
+        message="Votre concept de jeu a été généré avec succès!",
+        finished_at=timezone.now()
+    )
+    return game
+
+def iter_job_events(job_id, poll_interval=None):
+    """
+    Suit une tâche de génération et produit les mêmes événements (nom,
+    données) que stream_game_creation, à partir de l'état enregistré par le
+    worker: texte des champs au fur et à mesure, étapes, puis 'done' ou 'error'
+    """
+    poll_interval = poll_interval or settings.GENERATION_STREAM_INTERVAL
+    sent = {}
+    last_message = None
+
+    while True:
+        job = GenerationJob.objects.only('status', 'progress', 'message', 'preview', 'game_id').get(id=job_id)
+
+        fields = job.preview or {}
+        # Concept de secours après une réponse invalide: le texte déjà affiché est remplacé
+        if any(len(fields.get(name, '')) < length for name, length in sent.items()):
+            sent = {}
+            yield 'reset', {}
+        for name, text in fields.items():
+            if len(text) > sent.get(name, 0):
+                yield 'field', {'name': name, 'delta': text[sent.get(name, 0):]}
+                sent[name] = len(text)
+
+        if job.message != last_message:
+            last_message = job.message
+            yield 'status', {'message': job.message, 'progress': job.progress}
+
+        if job.status == GenerationJob.STATUS_DONE:
+            yield 'done', {'game_id': job.game_id}
+            return
+        if job.status == GenerationJob.STATUS_FAILED:
+            yield 'error', {'message': job.message}
+            return
+        time.sleep(poll_interval)
+
+def requeue_stale_jobs():
+    """
+    Remet en file les tâches dont le worker a disparu (crash, redémarrage):
+    sans progression signalée depuis GENERATION_JOB_TIMEOUT secondes. Une
+    génération longue mais vivante n'est pas relancée en parallèle.
+    Au-delà de GENERATION_JOB_MAX_ATTEMPTS tentatives, la tâche est marquée échouée.
+    """
+    deadline = timezone.now() - timedelta(seconds=settings.GENERATION_JOB_TIMEOUT)
+    stale = GenerationJob.objects.filter(status=GenerationJob.STATUS_RUNNING, heartbeat_at__lt=deadline)
+
+    failed = stale.filter(attempts__gte=settings.GENERATION_JOB_MAX_ATTEMPTS).update(
+        status=GenerationJob.STATUS_FAILED,
+        message="La génération a expiré.",
+        finished_at=timezone.now()
+    )
+    requeued = stale.update(
+        status=GenerationJob.STATUS_PENDING,
+        message="En attente d'un worker..."
+    )
+    return requeued, failed
+
+def run_worker(poll_interval=None, once=False):
+    """
+    Boucle principale du worker: réserve et exécute les tâches une par une
+    """
+    poll_interval = poll_interval or settings.GENERATION_WORKER_POLL_INTERVAL
+
+    while True:
+        close_old_connections()
+        requeue_stale_jobs()
+
+        job = claim_next_job()
+        if job is not None:
+            run_job(job)
+            print(f"Tâche {job.id} terminée - pool HTTP: {http_client.get_pool_stats()}")
+            print(f"Ordonnanceur IA: {scheduler.get_stats()}")
+            continue
+
+        if once:
+            return
+        time.sleep(poll_interval)
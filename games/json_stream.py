@@ -0,0 +1,189 @@
+import json
+from collections import namedtuple
+
+# Événement produit par ConceptStreamParser.feed():
+# - kind='field': nouveau texte (delta) d'un champ texte de premier niveau
+# - kind='entity': objet complet d'un tableau surveillé (name = nom du tableau)
+StreamEvent = namedtuple('StreamEvent', ['kind', 'name', 'index', 'value'])
+
+_JSON_ESCAPES = {'n': '\n', 't': '\t', 'r': '\r', 'b': '\b', 'f': '\f'}
+
+
+class ConceptStreamParser:
+    """
+    Analyseur JSON incrémental pour le concept produit par stream_game_creation.
+
+    Le texte est lu une seule fois, caractère par caractère, au fur et à mesure
+    des fragments reçus. Les champs texte de premier niveau sont restitués par
+    morceaux dès leur arrivée, et chaque élément des tableaux surveillés
+    (characters, locations) est renvoyé dès que son objet est syntaxiquement
+    complet, sans attendre la fin de la réponse.
+    """
+
+    def __init__(self, text_fields=(), entity_arrays=()):
+        self.text = ''
+        self.fields = {}
+        self._text_fields = set(text_fields)
+        self._entity_arrays = set(entity_arrays)
+        self._entity_counts = {}
+        self._pos = 0
+        self._started = False
+        # Pile des conteneurs ouverts: dict(type, key, expect_key)
+        self._stack = []
+        self._in_string = False
+        self._string_is_key = False
+        self._string_field = None
+        self._key_chars = []
+        self._escape = False
+        self._unicode_digits = None
+        # Moitié haute d'une paire \uD83D\uDE00 en attente de sa moitié basse
+        self._high_surrogate = None
+        self._entity_start = None
+
+    def feed(self, chunk):
+        """
+        Ajoute un fragment de texte et retourne la liste des événements produits
+        """
+        self.text += chunk
+        events = []
+        text = self.text
+
+        while self._pos < len(text):
+            char = text[self._pos]
+
+            if not self._started:
+                # Ignorer tout ce qui précède le premier objet (```json, texte...)
+                if char == '{':
+                    self._started = True
+                    self._stack.append({'type': 'object', 'key': None, 'expect_key': True})
+                self._pos += 1
+                continue
+
+            if self._in_string:
+                self._read_string_char(char, events)
+                self._pos += 1
+                continue
+
+            if not self._stack:
+                # L'objet racine est terminé: le reste est ignoré
+                self._pos += 1
+                continue
+
+            top = self._stack[-1]
+            if char == '"':
+                self._start_string(top)
+            elif char == '{':
+                if self._is_entity_container():
+                    self._entity_start = self._pos
+                self._stack.append({'type': 'object', 'key': None, 'expect_key': True})
+            elif char == '[':
+                key = top['key'] if top['type'] == 'object' else None
+                self._stack.append({'type': 'array', 'key': key, 'expect_key': False})
+            elif char in '}]':
+                self._stack.pop()
+                if char == '}' and self._entity_start is not None and self._is_entity_container():
+                    self._emit_entity(events)
+            elif char == ':' and top['type'] == 'object':
+                top['expect_key'] = False
+            elif char == ',' and top['type'] == 'object':
+                top['expect_key'] = True
+
+            self._pos += 1
+
+        return events
+
+    def _is_entity_container(self):
+        # Un élément de tableau surveillé: racine > tableau > objet
+        return (
+            len(self._stack) == 2
+            and self._stack[1]['type'] == 'array'
+            and self._stack[1]['key'] in self._entity_arrays
+        )
+
+    def _start_string(self, top):
+        self._in_string = True
+        self._string_is_key = top['type'] == 'object' and top['expect_key']
+        self._key_chars = []
+        self._string_field = None
+        if (
+            not self._string_is_key
+            and len(self._stack) == 1
+            and top['key'] in self._text_fields
+        ):
+            self._string_field = top['key']
+            self.fields.setdefault(self._string_field, '')
+
+    def _read_string_char(self, char, events):
+        if self._unicode_digits is not None:
+            self._unicode_digits += char
+            if len(self._unicode_digits) == 4:
+                self._read_unicode_escape(events)
+            return
+
+        if self._escape:
+            self._escape = False
+            if char == 'u':
+                self._unicode_digits = ''
+            else:
+                self._append_string_text(_JSON_ESCAPES.get(char, char), events)
+            return
+
+        if char == '\\':
+            self._escape = True
+        elif char == '"':
+            self._flush_high_surrogate(events)
+            self._in_string = False
+            if self._string_is_key:
+                self._stack[-1]['key'] = ''.join(self._key_chars)
+        else:
+            self._append_string_text(char, events)
+
+    def _read_unicode_escape(self, events):
+        digits, self._unicode_digits = self._unicode_digits, None
+        try:
+            code = int(digits, 16)
+        except ValueError:
+            # Échappement invalide: conservé tel quel plutôt que d'interrompre la lecture
+            self._append_string_text('\\u' + digits, events)
+            return
+
+        if 0xDC00 <= code <= 0xDFFF and self._high_surrogate is not None:
+            # Caractère hors du plan de base (emoji...) écrit en deux échappements
+            high, self._high_surrogate = self._high_surrogate, None
+            self._append_string_text(chr(0x10000 + ((high - 0xD800) << 10) + (code - 0xDC00)), events)
+        elif 0xD800 <= code <= 0xDBFF:
+            self._flush_high_surrogate(events)
+            self._high_surrogate = code
+        else:
+            self._append_string_text(chr(code), events)
+
+    def _flush_high_surrogate(self, events):
+        # Moitié haute sans moitié basse: restituée seule, comme json.loads
+        if self._high_surrogate is not None:
+            high, self._high_surrogate = self._high_surrogate, None
+            self._append_string_text(chr(high), events)
+
+    def _append_string_text(self, text, events):
+        if self._high_surrogate is not None:
+            self._flush_high_surrogate(events)
+        if self._string_is_key:
+            self._key_chars.append(text)
+        elif self._string_field is not None:
+            self.fields[self._string_field] += text
+            # Regrouper les caractères d'un même fragment en un seul événement
+            if events and events[-1].kind == 'field' and events[-1].name == self._string_field:
+                events[-1] = events[-1]._replace(value=events[-1].value + text)
+            else:
+                events.append(StreamEvent('field', self._string_field, None, text))
+
+    def _emit_entity(self, events):
+        name = self._stack[1]['key']
+        raw = self.text[self._entity_start:self._pos + 1]
+        self._entity_start = None
+        try:
+            value = json.loads(raw)
+        except json.JSONDecodeError:
+            return
+        index = self._entity_counts.get(name, 0)
+        self._entity_counts[name] = index + 1
+        events.append(StreamEvent('entity', name, index, value))
@@ -0,0 +1,174 @@
+import os
+import random
+import threading
+import time
+
+import httpx
+from django.conf import settings
+from openai import (APIConnectionError, DefaultHttpxClient, InternalServerError,
+                    OpenAI, RateLimitError)
+
+from . import rate_limit
+
+# Nom du fournisseur dans RATE_LIMITS
+PROVIDER = 'github_models'
+
+# Erreurs relancées (par nous, pas par le SDK: chaque tentative repasse par le limiteur)
+RETRYABLE_ERRORS = (RateLimitError, APIConnectionError, InternalServerError)
+
+_client = None
+_client_lock = threading.Lock()
+
+_stats_lock = threading.Lock()
+_stats = {'calls': 0, 'errors': 0, 'total_seconds': 0.0, 'last_seconds': 0.0}
+
+
+def get_client():
+    """
+    Retourne le client OpenAI partagé par le processus (créé au premier appel).
+    Le pool de connexions httpx sous-jacent est ainsi conservé entre les requêtes.
+    Retourne None si le token GitHub n'est pas configuré.
+    """
+    global _client
+    if _client is None:
+        github_token = os.getenv('GITHUB_TOKEN')
+        if not github_token:
+            return None
+
+        with _client_lock:
+            if _client is None:
+                _client = OpenAI(
+                    base_url=settings.LLM_BASE_URL,
+                    api_key=github_token,
+                    timeout=httpx.Timeout(settings.LLM_TIMEOUT, connect=settings.LLM_CONNECT_TIMEOUT),
+                    # Les relances du SDK renverraient l'appel sans passer par le limiteur
+                    max_retries=0,
+                    http_client=DefaultHttpxClient(
+                        limits=httpx.Limits(
+                            max_connections=settings.LLM_MAX_CONNECTIONS,
+                            max_keepalive_connections=settings.LLM_MAX_CONNECTIONS,
+                        )
+                    ),
+                )
+    return _client
+
+def chat_completion(messages, max_tokens, temperature=0.7, top_p=1, work=None):
+    """
+    Appelle l'API de chat avec le modèle configuré et retourne le texte généré.
+    Lève RuntimeError si le client n'est pas configuré ; les erreurs de l'API
+    sont propagées à l'appelant après LLM_MAX_RETRIES relances. Chaque
+    tentative attend son tour dans l'ordonnanceur (work: utilisateur et
+    classe, par défaut ceux du contexte courant) puis dans le limiteur.
+    """
+    client = get_client()
+    if client is None:
+        raise RuntimeError("Token GitHub non trouvé dans les variables d'environnement")
+
+    for attempt in range(settings.LLM_MAX_RETRIES + 1):
+        try:
+            return _chat_completion_once(client, messages, max_tokens, temperature, top_p, work)
+        except RETRYABLE_ERRORS as e:
+            _before_retry(e, attempt)
+
+def _chat_completion_once(client, messages, max_tokens, temperature, top_p, work):
+    # Réservation du quota avant l'appel (l'attente n'est pas comptée dans la durée)
+    reserved = rate_limit.estimate_tokens(messages, max_tokens)
+    with rate_limit.scheduled_call(PROVIDER, reserved, work):
+        started = time.monotonic()
+        try:
+            response = client.chat.completions.create(
+                model=settings.LLM_MODEL,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                top_p=top_p
+            )
+        except RateLimitError:
+            rate_limit.report_rate_limited(PROVIDER)
+            _record_call(time.monotonic() - started, failed=True)
+            raise
+        except Exception:
+            _record_call(time.monotonic() - started, failed=True)
+            raise
+
+    _record_call(time.monotonic() - started)
+    if response.usage is not None:
+        rate_limit.settle_tokens(PROVIDER, reserved, response.usage.total_tokens)
+    return response.choices[0].message.content
+
+def stream_chat_completion(messages, max_tokens, temperature=0.7, top_p=1, work=None):
+    """
+    Variante en streaming de chat_completion: produit les fragments de texte
+    au fur et à mesure qu'ils arrivent. Un flux n'est relancé que s'il a
+    échoué avant son premier fragment.
+    """
+    client = get_client()
+    if client is None:
+        raise RuntimeError("Token GitHub non trouvé dans les variables d'environnement")
+
+    for attempt in range(settings.LLM_MAX_RETRIES + 1):
+        started_streaming = False
+        try:
+            for text in _stream_chat_completion_once(client, messages, max_tokens, temperature, top_p, work):
+                started_streaming = True
+                yield text
+            return
+        except RETRYABLE_ERRORS as e:
+            if started_streaming:
+                raise
+            _before_retry(e, attempt)
+
+def _stream_chat_completion_once(client, messages, max_tokens, temperature, top_p, work):
+    # La place est gardée jusqu'à la fin du flux ; sans usage renvoyé par le
+    # flux, la réservation estimée est conservée
+    with rate_limit.scheduled_call(PROVIDER, rate_limit.estimate_tokens(messages, max_tokens), work):
+        started = time.monotonic()
+        try:
+            stream = client.chat.completions.create(
+                model=settings.LLM_MODEL,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                top_p=top_p,
+                stream=True
+            )
+            try:
+                for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+            finally:
+                stream.close()
+        except RateLimitError:
+            rate_limit.report_rate_limited(PROVIDER)
+            _record_call(time.monotonic() - started, failed=True)
+            raise
+        except Exception:
+            _record_call(time.monotonic() - started, failed=True)
+            raise
+
+    _record_call(time.monotonic() - started)
+
+def _before_retry(error, attempt):
+    """
+    Relève l'erreur si les relances sont épuisées (un 429 persistant devient
+    RateLimitExceeded), sinon attend avant la tentative suivante. Après un
+    429, c'est le limiteur (seau vidé) qui fait patienter.
+    """
+    if attempt >= settings.LLM_MAX_RETRIES:
+        if isinstance(error, RateLimitError):
+            raise rate_limit.RateLimitExceeded(f"Quota {PROVIDER} dépassé après {attempt + 1} tentative(s)") from error
+        raise error
+    if not isinstance(error, RateLimitError):
+        time.sleep(min(settings.LLM_RETRY_MAX_DELAY, 0.5 * 2 ** attempt) + random.uniform(0, 0.25))
+
+def _record_call(duration, failed=False):
+    with _stats_lock:
+        _stats['calls'] += 1
+        _stats['total_seconds'] += duration
+        _stats['last_seconds'] = duration
+        if failed:
+            _stats['errors'] += 1
+
+def get_stats():
+    with _stats_lock:
+        return dict(_stats)
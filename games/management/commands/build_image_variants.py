@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from games.image_variants import build_variants
+from games.models import Character, Location
+
+
+class Command(BaseCommand):
+    help = "Crée les déclinaisons responsives (WebP/JPEG) des images de personnages et de lieux existants"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help="Régénère aussi les déclinaisons des images qui en ont déjà"
+        )
+
+    def handle(self, *args, **options):
+        built = 0
+        for model in (Character, Location):
+            queryset = model.objects.exclude(image='').exclude(image__isnull=True)
+            if not options['force']:
+                queryset = queryset.filter(image_variants={})
+            for instance in queryset.only('id', 'image').iterator():
+                variants = build_variants(instance.image.name)
+                if variants:
+                    model.objects.filter(id=instance.id).update(image_variants=variants)
+                    built += 1
+        self.stdout.write(self.style.SUCCESS(f"{built} image(s) déclinée(s)."))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from games import blob_storage
+
+
+class Command(BaseCommand):
+    help = "Supprime les images stockées qu'aucun personnage, lieu ou entrée de cache ne référence"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace',
+            type=int,
+            default=None,
+            help="Âge minimal (secondes) d'un fichier non référencé avant suppression (défaut: BLOB_ORPHAN_GRACE)"
+        )
+
+    def handle(self, *args, **options):
+        removed = blob_storage.collect_orphans(grace=options['grace'])
+        self.stdout.write(self.style.SUCCESS(f"{removed} fichier(s) supprimé(s)."))
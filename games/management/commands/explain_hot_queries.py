@@ -0,0 +1,100 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Exists, OuterRef
+
+from games.models import Favorite, Game, NarrativeChoice, NarrativeHistory
+
+
+class Command(BaseCommand):
+    help = "Affiche le plan d'exécution (EXPLAIN) des requêtes fréquentes des vues et vérifie l'usage des index"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            default=None,
+            help="Nom de l'utilisateur utilisé pour les requêtes (défaut: premier propriétaire d'un jeu)"
+        )
+        parser.add_argument(
+            '--game',
+            type=int,
+            default=None,
+            help="Identifiant du jeu utilisé pour les requêtes narratives (défaut: premier jeu de l'utilisateur)"
+        )
+        parser.add_argument(
+            '--verbose-plan',
+            action='store_true',
+            help="Affiche le plan complet de chaque requête"
+        )
+
+    def handle(self, *args, **options):
+        user, game = self.get_targets(options['user'], options['game'])
+        missing = 0
+
+        for label, queryset, index_name in self.hot_queries(user, game):
+            plan = queryset.explain()
+            if index_name in plan:
+                self.stdout.write(self.style.SUCCESS(f"[OK] {label}: index {index_name} utilisé"))
+            else:
+                missing += 1
+                self.stdout.write(self.style.WARNING(f"[--] {label}: index {index_name} non utilisé"))
+            if options['verbose_plan'] or index_name not in plan:
+                for line in plan.splitlines():
+                    self.stdout.write(f"       {line}")
+
+        if missing:
+            self.stdout.write(
+                f"{missing} requête(s) sans l'index attendu. Sur de petites tables, "
+                "l'optimiseur peut préférer un parcours complet: relancer sur des données réelles."
+            )
+
+    def get_targets(self, username, game_id):
+        if username:
+            user = User.objects.filter(username=username).first()
+            if user is None:
+                raise CommandError(f"Utilisateur introuvable: {username}")
+        else:
+            user = User.objects.filter(games__isnull=False).first() or User.objects.first()
+            if user is None:
+                raise CommandError("Aucun utilisateur en base")
+
+        if game_id:
+            game = Game.objects.filter(id=game_id).first()
+            if game is None:
+                raise CommandError(f"Jeu introuvable: {game_id}")
+        else:
+            game = Game.objects.filter(owner=user).first() or Game.objects.first()
+            if game is None:
+                raise CommandError("Aucun jeu en base")
+
+        return user, game
+
+    def hot_queries(self, user, game):
+        """
+        Requêtes exécutées par games.views, avec l'index qui doit les servir
+        """
+        page_size = settings.GAMES_PAGE_SIZE + 1
+        return [
+            (
+                "dashboard: jeux de l'utilisateur",
+                Game.objects.filter(owner=user).only(*Game.CARD_FIELDS).annotate(
+                    is_favorited=Exists(Favorite.objects.filter(user=user, game=OuterRef('pk')))
+                ).order_by('-created_at', '-id')[:page_size],
+                'game_owner_created_idx',
+            ),
+            (
+                "favorites: favoris de l'utilisateur",
+                Favorite.objects.filter(user=user).select_related('game').order_by('-created_at', '-id')[:page_size],
+                'favorite_user_created_idx',
+            ),
+            (
+                "narrative_choices: historique du jeu",
+                NarrativeHistory.objects.filter(game=game),
+                'history_game_created_idx',
+            ),
+            (
+                "narrative_choices: choix de l'acte courant",
+                NarrativeChoice.objects.filter(game=game, act=1),
+                'narrativechoice_game_act_idx',
+            ),
+        ]
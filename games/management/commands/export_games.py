@@ -0,0 +1,57 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from games.bulk_export import shutdown_executor, write_games_zip
+from games.models import Game
+
+
+class Command(BaseCommand):
+    help = "Exporte des jeux dans une archive ZIP (un PDF et un document JSON par jeu)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help="Chemin de l'archive ZIP à créer")
+        parser.add_argument(
+            '--user',
+            default=None,
+            help="N'exporter que les jeux de cet utilisateur"
+        )
+        parser.add_argument(
+            '--ids',
+            default='',
+            help="Identifiants des jeux à exporter, séparés par des virgules"
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=None,
+            help="Nombre de processus de rendu des PDF (défaut: BULK_EXPORT_WORKERS)"
+        )
+
+    def handle(self, *args, **options):
+        games = Game.objects.order_by('created_at', 'id')
+
+        if options['user']:
+            user = User.objects.filter(username=options['user']).first()
+            if user is None:
+                raise CommandError(f"Utilisateur introuvable: {options['user']}")
+            games = games.filter(owner=user)
+
+        if options['ids']:
+            try:
+                ids = [int(value) for value in options['ids'].split(',') if value.strip()]
+            except ValueError:
+                raise CommandError("--ids doit contenir des identifiants numériques")
+            games = games.filter(id__in=ids)
+
+        game_ids = list(games.values_list('id', flat=True))
+        if not game_ids:
+            raise CommandError("Aucun jeu à exporter")
+
+        self.stdout.write(f"Export de {len(game_ids)} jeu(x)...")
+        try:
+            size = write_games_zip(game_ids, options['output'], workers=options['workers'])
+        finally:
+            shutdown_executor()
+        self.stdout.write(self.style.SUCCESS(
+            f"Archive créée: {options['output']} ({size / (1024 * 1024):.1f} Mo)"
+        ))
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+
+from games import image_cache
+from games.models import ImageCacheEntry
+
+
+class Command(BaseCommand):
+    help = "Affiche les statistiques du cache d'images et permet de le purger"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--prune',
+            action='store_true',
+            help="Évince les entrées les moins récemment utilisées au-delà de la taille maximale"
+        )
+        parser.add_argument(
+            '--max-bytes',
+            type=int,
+            default=None,
+            help="Taille cible pour --prune (défaut: IMAGE_CACHE_MAX_BYTES)"
+        )
+        parser.add_argument(
+            '--clear',
+            action='store_true',
+            help="Supprime toutes les entrées du cache"
+        )
+        parser.add_argument(
+            '--top',
+            type=int,
+            default=10,
+            help="Nombre d'entrées les plus utilisées à afficher"
+        )
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            removed = image_cache.clear()
+            self.stdout.write(self.style.SUCCESS(f"{removed} entrée(s) supprimée(s)."))
+        elif options['prune']:
+            evicted = image_cache.prune(max_bytes=options['max_bytes'])
+            self.stdout.write(self.style.SUCCESS(f"{evicted} entrée(s) évincée(s)."))
+
+        stats = image_cache.get_stats()
+        self.stdout.write(f"Entrées: {stats['entries']}")
+        self.stdout.write(f"Taille: {stats['total_bytes'] / (1024 * 1024):.1f} Mo / {stats['max_bytes'] / (1024 * 1024):.1f} Mo")
+        self.stdout.write(f"Hits cumulés: {stats['total_hits']}")
+
+        top_entries = ImageCacheEntry.objects.order_by('-hits')[:options['top']]
+        if top_entries:
+            self.stdout.write("Entrées les plus utilisées:")
+            for entry in top_entries:
+                self.stdout.write(f"  {entry.hits:>6} hits  {entry.size / 1024:>8.1f} Ko  {entry.prompt[:80]}")
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from games import rate_limit
+from games.models import RateLimitBucket
+
+
+class Command(BaseCommand):
+    help = "Affiche l'état du limiteur de débit des fournisseurs d'IA et le temps passé en attente"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset',
+            action='store_true',
+            help="Supprime les seaux (ils repartent pleins) et remet les métriques à zéro"
+        )
+
+    def handle(self, *args, **options):
+        if options['reset']:
+            removed, _ = RateLimitBucket.objects.all().delete()
+            self.stdout.write(self.style.SUCCESS(f"{removed} seau(x) supprimé(s)."))
+
+        providers = rate_limit.get_stats()['providers']
+        if not providers:
+            self.stdout.write("Aucun appel limité pour l'instant.")
+        for provider, stats in providers.items():
+            limits = stats['limits']
+            self.stdout.write(f"{provider}:")
+            self.stdout.write(f"  Requêtes disponibles: {stats['available_requests']:.1f} / {limits.get('requests_per_minute', 0)} par minute")
+            self.stdout.write(f"  Tokens disponibles: {stats['available_tokens']:.0f} / {limits.get('tokens_per_minute', 0)} par minute")
+            self.stdout.write(f"  Appels mis en attente: {stats['throttled_calls']} ({stats['throttled_seconds']:.1f} s au total)")
+            self.stdout.write(f"  Appels refusés (attente trop longue): {stats['rejected_calls']}")
+            self.stdout.write(f"  Réponses 429 du fournisseur: {stats['rate_limited_responses']}")
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from games import search
+from games.models import Game
+
+
+class Command(BaseCommand):
+    help = "Reconstruit l'index de recherche de tous les jeux"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            default=None,
+            help="Ne réindexer que les jeux de cet utilisateur"
+        )
+
+    def handle(self, *args, **options):
+        games = Game.objects.order_by('id')
+        if options['user']:
+            games = games.filter(owner__username=options['user'])
+
+        indexed = 0
+        for game in games.iterator(chunk_size=500):
+            search.index_game(game)
+            indexed += 1
+            if indexed % 1000 == 0:
+                self.stdout.write(f"{indexed} jeu(x) indexé(s)...")
+
+        backend = 'FULLTEXT' if search.use_fulltext() else 'index inversé'
+        self.stdout.write(self.style.SUCCESS(f"{indexed} jeu(x) indexé(s) ({backend})."))
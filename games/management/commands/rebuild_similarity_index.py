@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from games import similarity
+from games.models import Game
+
+
+class Command(BaseCommand):
+    help = "Reconstruit l'index des jeux similaires (supprime les lignes remplacées et les jeux supprimés)"
+
+    def handle(self, *args, **options):
+        indexed = similarity.rebuild_index(Game.objects.order_by('id'))
+        self.stdout.write(self.style.SUCCESS(f"{indexed} jeu(x) indexé(s)."))
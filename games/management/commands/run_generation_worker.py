@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from games.jobs import run_worker
+
+
+class Command(BaseCommand):
+    help = "Exécute les tâches de génération de concepts en attente (file stockée en base)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=None,
+            help="Délai en secondes entre deux vérifications de la file (défaut: GENERATION_WORKER_POLL_INTERVAL)"
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help="Vide la file puis s'arrête au lieu d'attendre de nouvelles tâches"
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write("Worker de génération démarré.")
+        try:
+            run_worker(poll_interval=options['poll_interval'], once=options['once'])
+        except KeyboardInterrupt:
+            self.stdout.write("Worker arrêté.")
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0008_imagecacheentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContentCacheKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('genre', models.CharField(max_length=20)),
+                ('ambiance', models.CharField(max_length=20)),
+                ('keywords', models.CharField(max_length=200)),
+                ('references', models.CharField(blank=True, max_length=200)),
+                ('model', models.CharField(max_length=100)),
+                ('hits', models.PositiveIntegerField(default=0)),
+                ('misses', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_hit_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['-hits'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ContentCacheVariant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('payload', models.JSONField()),
+                ('hits', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('cache_key', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='variants', to='games.contentcachekey')),
+            ],
+            options={
+                'ordering': ['created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0009_contentcachekey_contentcachevariant'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='choices_prefetch_started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='choices_prefetch_status',
+            field=models.CharField(blank=True, choices=[('pending', 'En cours'), ('ready', 'Prêts'), ('failed', 'Échec')], max_length=10),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='narrative_revision',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
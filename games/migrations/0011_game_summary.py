@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:22
+
+from django.db import migrations, models
+
+SUMMARY_LENGTH = 200
+
+
+def build_summary(universe_description, story_act1=''):
+    # Copie figée de games.models.build_summary à la date de la migration
+    text = ' '.join((universe_description or story_act1 or '').split())
+    if len(text) <= SUMMARY_LENGTH:
+        return text
+    return text[:SUMMARY_LENGTH - 1].rsplit(' ', 1)[0] + '…'
+
+def backfill_summaries(apps, schema_editor):
+    Game = apps.get_model('games', 'Game')
+    games = []
+    for game in Game.objects.only('id', 'universe_description', 'story_act1').iterator(chunk_size=500):
+        game.summary = build_summary(game.universe_description, game.story_act1)
+        games.append(game)
+        if len(games) >= 500:
+            Game.objects.bulk_update(games, ['summary'])
+            games = []
+    if games:
+        Game.objects.bulk_update(games, ['summary'])
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0010_game_narrative_prefetch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='summary',
+            field=models.CharField(blank=True, max_length=200),
+        ),
+        migrations.RunPython(backfill_summaries, migrations.RunPython.noop),
+    ]
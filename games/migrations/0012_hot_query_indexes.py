@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:23
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0011_game_summary'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='favorite',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='favorite_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='game',
+            index=models.Index(fields=['owner', '-created_at', '-id'], name='game_owner_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='narrativechoice',
+            index=models.Index(fields=['game', 'act'], name='narrativechoice_game_act_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='narrativehistory',
+            index=models.Index(fields=['game', 'created_at'], name='history_game_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='narrativehistory',
+            index=models.Index(fields=['game', 'act'], name='history_game_act_idx'),
+        ),
+    ]
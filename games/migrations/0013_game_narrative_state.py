@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:24
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def backfill_narrative_state(apps, schema_editor):
+    Game = apps.get_model('games', 'Game')
+    NarrativeHistory = apps.get_model('games', 'NarrativeHistory')
+    # Une seule requête agrégée pour tous les jeux ayant un historique
+    states = NarrativeHistory.objects.values('game_id').annotate(
+        steps=Count('id'), max_act=Max('act'), last_step=Max('created_at')
+    )
+    for state in states.iterator():
+        Game.objects.filter(id=state['game_id']).update(
+            current_act=3 if state['max_act'] >= 2 else 2,
+            narrative_steps=state['steps'],
+            last_step_at=state['last_step']
+        )
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0012_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='current_act',
+            field=models.PositiveSmallIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='last_step_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='narrative_steps',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_narrative_state, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0013_game_narrative_state'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='character',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
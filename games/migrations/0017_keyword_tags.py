@@ -0,0 +1,63 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:34
+
+from django.db import migrations, models
+from django.utils.text import slugify
+
+
+def parse_keywords(text):
+    # Copie figée de games.tags.parse_keywords à la date de la migration
+    parsed = {}
+    for name in (text or '').split(','):
+        name = ' '.join(name.split())[:100]
+        slug = slugify(name)[:100]
+        if slug and slug not in parsed:
+            parsed[slug] = name
+    return list(parsed.items())
+
+def parse_existing_keywords(apps, schema_editor):
+    Game = apps.get_model('games', 'Game')
+    Keyword = apps.get_model('games', 'Keyword')
+    Through = Game.tags.through
+
+    keywords = {}
+    links = []
+    for game_id, text in Game.objects.values_list('id', 'keywords').iterator(chunk_size=1000):
+        for slug, name in parse_keywords(text):
+            if slug not in keywords:
+                keywords[slug] = Keyword.objects.create(name=name, slug=slug)
+            keywords[slug].usage_count += 1
+            links.append(Through(game_id=game_id, keyword_id=keywords[slug].id))
+            if len(links) >= 1000:
+                Through.objects.bulk_create(links)
+                links = []
+    if links:
+        Through.objects.bulk_create(links)
+    Keyword.objects.bulk_update(keywords.values(), ['usage_count'], batch_size=1000)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0016_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Keyword',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('slug', models.SlugField(max_length=100, unique=True)),
+                ('usage_count', models.PositiveIntegerField(db_index=True, default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='tags',
+            field=models.ManyToManyField(blank=True, related_name='games', to='games.keyword'),
+        ),
+        migrations.RunPython(parse_existing_keywords, migrations.RunPython.noop),
+    ]
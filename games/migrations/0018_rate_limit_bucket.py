@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0017_keyword_tags'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RateLimitBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('provider', models.CharField(max_length=50, unique=True)),
+                ('available_requests', models.FloatField(default=0)),
+                ('available_tokens', models.FloatField(default=0)),
+                ('refilled_at', models.DateTimeField()),
+                ('throttled_calls', models.PositiveIntegerField(default=0)),
+                ('throttled_seconds', models.FloatField(default=0)),
+                ('rejected_calls', models.PositiveIntegerField(default=0)),
+                ('rate_limited_responses', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+    ]
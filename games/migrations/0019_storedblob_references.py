@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:51
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def recount_references(apps, schema_editor):
+    # Le compteur suivait les enregistrements de contenu: il compte désormais
+    # les personnages et lieux qui référencent réellement le fichier
+    StoredBlob = apps.get_model('games', 'StoredBlob')
+    references = {}
+    for model_name in ('Character', 'Location'):
+        model = apps.get_model('games', model_name)
+        for row in model.objects.exclude(image='').values('image').annotate(count=Count('id')):
+            references[row['image']] = references.get(row['image'], 0) + row['count']
+
+    blobs = []
+    for blob in StoredBlob.objects.only('id', 'path', 'refcount').iterator(chunk_size=1000):
+        blob.refcount = references.get(blob.path, 0)
+        blobs.append(blob)
+    StoredBlob.objects.bulk_update(blobs, ['refcount'], batch_size=1000)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0018_rate_limit_bucket'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='storedblob',
+            name='last_stored_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+        migrations.RunPython(recount_references, migrations.RunPython.noop),
+    ]
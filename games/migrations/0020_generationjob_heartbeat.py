@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:04
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def init_heartbeats(apps, schema_editor):
+    # Tâches en cours lors de la migration: leur démarrage tient lieu de dernier signe de vie
+    GenerationJob = apps.get_model('games', 'GenerationJob')
+    GenerationJob.objects.filter(heartbeat_at__isnull=True).update(heartbeat_at=F('started_at'))
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0019_storedblob_references'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generationjob',
+            name='concept',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='generationjob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(init_heartbeats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0020_generationjob_heartbeat'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generationjob',
+            name='preview',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
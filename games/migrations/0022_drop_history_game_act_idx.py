@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:07
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0021_generationjob_preview'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='narrativehistory',
+            name='history_game_act_idx',
+        ),
+    ]
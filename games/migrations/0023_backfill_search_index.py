@@ -0,0 +1,60 @@
+from collections import Counter
+
+from django.conf import settings
+from django.db import migrations
+
+from games.search import FIELD_WEIGHTS, tokenize
+
+
+def backfill_search_index(apps, schema_editor):
+    # Jeux créés avant l'index de recherche: sans document, ils n'apparaîtraient
+    # dans les résultats qu'après leur prochain enregistrement
+    Game = apps.get_model('games', 'Game')
+    Character = apps.get_model('games', 'Character')
+    Location = apps.get_model('games', 'Location')
+    SearchDocument = apps.get_model('games', 'SearchDocument')
+    SearchPosting = apps.get_model('games', 'SearchPosting')
+
+    if settings.SEARCH_BACKEND == 'auto':
+        fulltext = schema_editor.connection.vendor == 'mysql'
+    else:
+        fulltext = settings.SEARCH_BACKEND == 'fulltext'
+
+    games = Game.objects.filter(search_document__isnull=True).order_by('id')
+    for game in games.iterator(chunk_size=500):
+        names = list(Character.objects.filter(game=game).values_list('name', flat=True))
+        names += list(Location.objects.filter(game=game).values_list('name', flat=True))
+        fields = {
+            'title': game.title,
+            'keywords': game.keywords,
+            'names': ' '.join(names),
+            'universe_description': game.universe_description,
+            'story': ' '.join([game.story_act1, game.story_act2, game.story_act3]),
+        }
+        document = SearchDocument.objects.create(
+            game=game, owner_id=game.owner_id, content='\n'.join(fields.values())
+        )
+        if fulltext:
+            continue
+
+        weights = Counter()
+        for field, text in fields.items():
+            for term in tokenize(text):
+                weights[term] += FIELD_WEIGHTS[field]
+        SearchPosting.objects.bulk_create(
+            [
+                SearchPosting(document=document, owner_id=game.owner_id, term=term, weight=weight)
+                for term, weight in weights.items()
+            ],
+            batch_size=500
+        )
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0022_drop_history_game_act_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_search_index, migrations.RunPython.noop),
+    ]
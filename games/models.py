@@ -1,5 +1,20 @@
 from django.contrib.auth.models import User
 from django.db import models
+from django.utils import timezone
+
+SUMMARY_LENGTH = 200
+SUMMARY_SOURCE_FIELDS = {'universe_description', 'story_act1'}
+
+
+def build_summary(universe_description, story_act1=''):
+    """
+    Résumé d'un jeu pour les cartes: début de la description de l'univers
+    (ou du premier acte à défaut), coupé sur un mot
+    """
+    text = ' '.join((universe_description or story_act1 or '').split())
+    if len(text) <= SUMMARY_LENGTH:
+        return text
+    return text[:SUMMARY_LENGTH - 1].rsplit(' ', 1)[0] + '…'
 
 
 class Game(models.Model):
@@ -28,11 +43,22 @@ class Game(models.Model):
         ('other', 'Other'),
     ]
     
+    PREFETCH_PENDING = 'pending'
+    PREFETCH_READY = 'ready'
+    PREFETCH_FAILED = 'failed'
+    PREFETCH_STATUS_CHOICES = [
+        (PREFETCH_PENDING, 'En cours'),
+        (PREFETCH_READY, 'Prêts'),
+        (PREFETCH_FAILED, 'Échec'),
+    ]
+    
     owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='games')
     title = models.CharField(max_length=100)
     genre = models.CharField(max_length=20, choices=GENRE_CHOICES)
     ambiance = models.CharField(max_length=20, choices=AMBIANCE_CHOICES)
     keywords = models.CharField(max_length=200)
+    # Mots-clés normalisés (synchronisés depuis keywords, voir games.tags)
+    tags = models.ManyToManyField('Keyword', related_name='games', blank=True)
     references = models.CharField(max_length=200, blank=True)
     
     universe_description = models.TextField()
@@ -42,16 +68,44 @@ class Game(models.Model):
     
     # Champs pour le système de narration dynamique
     has_dynamic_narrative = models.BooleanField(default=False)
+    # Incrémentée à chaque changement de l'état narratif (invalide les préchargements)
+    narrative_revision = models.PositiveIntegerField(default=0)
+    choices_prefetch_status = models.CharField(max_length=10, choices=PREFETCH_STATUS_CHOICES, blank=True)
+    choices_prefetch_started_at = models.DateTimeField(null=True, blank=True)
+    # État narratif dénormalisé (mis à jour à chaque choix, voir record_narrative_step)
+    current_act = models.PositiveSmallIntegerField(default=1)
+    narrative_steps = models.PositiveIntegerField(default=0)
+    last_step_at = models.DateTimeField(null=True, blank=True)
+    
+    # Résumé court affiché sur les cartes des listes (recalculé à chaque sauvegarde)
+    summary = models.CharField(max_length=SUMMARY_LENGTH, blank=True)
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    # Colonnes nécessaires à l'affichage d'une carte de jeu dans les listes
+    CARD_FIELDS = ('id', 'owner_id', 'title', 'genre', 'ambiance', 'keywords', 'summary', 'created_at')
+    
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Tableau de bord: jeux d'un utilisateur paginés sur (created_at, id)
+            models.Index(fields=['owner', '-created_at', '-id'], name='game_owner_created_idx'),
+        ]
     
     def __str__(self):
         return self.title
     
+    def save(self, *args, **kwargs):
+        # Ne recalculer le résumé que si ses sources sont chargées (pas avec .only()/.defer())
+        deferred = self.get_deferred_fields()
+        if not deferred.intersection(SUMMARY_SOURCE_FIELDS):
+            self.summary = build_summary(self.universe_description, self.story_act1)
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None and set(update_fields).intersection(SUMMARY_SOURCE_FIELDS):
+                kwargs['update_fields'] = set(update_fields) | {'summary'}
+        super().save(*args, **kwargs)
+    
     @property
     def keyword_list(self):
         """Return keywords as a list of stripped strings"""
@@ -70,6 +124,21 @@ class Game(models.Model):
         return self.get_ambiance_display()
 
 
+# Mot-clé normalisé partagé entre les jeux
+class Keyword(models.Model):
+    name = models.CharField(max_length=100)
+    slug = models.SlugField(max_length=100, unique=True)
+    # Nombre de jeux portant ce mot-clé (maintenu à l'écriture, voir games.tags)
+    usage_count = models.PositiveIntegerField(default=0, db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['name']
+    
+    def __str__(self):
+        return self.name
+
+
 class Character(models.Model):
     game = models.ForeignKey(Game, on_delete=models.CASCADE, related_name='characters')
     name = models.CharField(max_length=100)
@@ -77,6 +146,8 @@ class Character(models.Model):
     background = models.TextField()
     abilities = models.TextField()
     image = models.ImageField(upload_to='characters/', blank=True, null=True)
+    # Déclinaisons redimensionnées de l'image (voir image_variants.build_variants)
+    image_variants = models.JSONField(default=dict, blank=True)
     
     def __str__(self):
         return f"{self.name} - {self.game.title}"
@@ -87,6 +158,7 @@ class Location(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField()
     image = models.ImageField(upload_to='locations/', blank=True, null=True)
+    image_variants = models.JSONField(default=dict, blank=True)
     
     def __str__(self):
         return f"{self.name} - {self.game.title}"
@@ -100,6 +172,9 @@ class Favorite(models.Model):
     class Meta:
         ordering = ['-created_at']
         unique_together = ('user', 'game')
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id'], name='favorite_user_created_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.username} - {self.game.title}"
@@ -112,6 +187,11 @@ class NarrativeChoice(models.Model):
     outcome_description = models.TextField()
     act = models.IntegerField(choices=[(1, 'Acte 1'), (2, 'Acte 2'), (3, 'Acte 3')])
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['game', 'act'], name='narrativechoice_game_act_idx'),
+        ]
+    
     def __str__(self):
         return f"{self.game.title} - Choix {self.id} (Acte {self.act})"
 
@@ -127,6 +207,180 @@ class NarrativeHistory(models.Model):
     class Meta:
         ordering = ['created_at']
         verbose_name_plural = "Narrative histories"
+        indexes = [
+            # Historique d'un jeu dans l'ordre chronologique
+            models.Index(fields=['game', 'created_at'], name='history_game_created_idx'),
+        ]
     
     def __str__(self):
-        return f"{self.game.title} - Acte {self.act} - {self.created_at.strftime('%d/%m/%Y')}"
\ No newline at end of file
+        return f"{self.game.title} - Acte {self.act} - {self.created_at.strftime('%d/%m/%Y')}"
+
+# Tâches de génération exécutées par le worker (voir run_generation_worker)
+class GenerationJob(models.Model):
+    KIND_CREATE = 'create'
+    KIND_RANDOM = 'random'
+    KIND_CHOICES = [
+        (KIND_CREATE, 'Concept personnalisé'),
+        (KIND_RANDOM, 'Concept aléatoire'),
+    ]
+
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'En attente'),
+        (STATUS_RUNNING, 'En cours'),
+        (STATUS_DONE, 'Terminée'),
+        (STATUS_FAILED, 'Échouée'),
+    ]
+
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='generation_jobs')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, default=KIND_CREATE)
+    params = models.JSONField(default=dict)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING, db_index=True)
+    progress = models.PositiveSmallIntegerField(default=0)
+    message = models.CharField(max_length=200, blank=True)
+    error = models.TextField(blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    game = models.ForeignKey(Game, on_delete=models.SET_NULL, null=True, blank=True, related_name='generation_jobs')
+    # Concept enregistré avec le jeu: une tentative suivante termine ce jeu au lieu d'en créer un autre
+    concept = models.JSONField(null=True, blank=True)
+    # Texte déjà généré des champs diffusés, relayé par le flux de la page de création
+    preview = models.JSONField(default=dict, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # Dernier signe de vie du worker (à chaque progression): une tâche sans nouvelles est remise en file
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+
+    def __str__(self):
+        return f"{self.get_kind_display()} #{self.id} - {self.get_status_display()}"
+
+    @property
+    def is_finished(self):
+        return self.status in (self.STATUS_DONE, self.STATUS_FAILED)
+
+
+# Index du cache d'images générées (les fichiers sont stockés sous MEDIA_ROOT)
+class ImageCacheEntry(models.Model):
+    key = models.CharField(max_length=64, unique=True)
+    prompt = models.TextField()
+    file = models.CharField(max_length=255)
+    size = models.PositiveIntegerField(default=0)
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        ordering = ['last_used_at']
+        verbose_name_plural = "Image cache entries"
+
+    def __str__(self):
+        return f"{self.key[:12]} - {self.prompt[:50]}"
+
+
+# Cache des concepts générés, une entrée par requête normalisée
+class ContentCacheKey(models.Model):
+    key = models.CharField(max_length=64, unique=True)
+    genre = models.CharField(max_length=20)
+    ambiance = models.CharField(max_length=20)
+    keywords = models.CharField(max_length=200)
+    references = models.CharField(max_length=200, blank=True)
+    model = models.CharField(max_length=100)
+    hits = models.PositiveIntegerField(default=0)
+    misses = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_hit_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-hits']
+
+    def __str__(self):
+        return f"{self.genre} / {self.ambiance} / {self.keywords}"
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class ContentCacheVariant(models.Model):
+    cache_key = models.ForeignKey(ContentCacheKey, on_delete=models.CASCADE, related_name='variants')
+    payload = models.JSONField()
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        ordering = ['created_at']
+
+    def __str__(self):
+        return f"{self.payload.get('title', 'Sans titre')} ({self.cache_key})"
+
+
+# Fichier média adressé par son contenu, partagé par toutes les images identiques
+class StoredBlob(models.Model):
+    sha256 = models.CharField(max_length=64, unique=True)
+    path = models.CharField(max_length=255, unique=True)
+    size = models.PositiveIntegerField(default=0)
+    # Nombre de modèles (personnages, lieux, entrées du cache d'images) qui référencent ce fichier
+    refcount = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Dernier enregistrement du contenu: un fichier non référencé n'est ramassé qu'après un délai
+    last_stored_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.path} ({self.refcount} réf.)"
+
+
+# Index de recherche: un document par jeu (titre, mots-clés, univers, histoire, personnages, lieux)
+class SearchDocument(models.Model):
+    game = models.OneToOneField(Game, on_delete=models.CASCADE, related_name='search_document')
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='search_documents')
+    # Texte indexé (index FULLTEXT sous MySQL, voir la migration)
+    content = models.TextField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Index de {self.game}"
+
+
+# Index inversé utilisé lorsque la base ne fournit pas de recherche plein texte
+class SearchPosting(models.Model):
+    document = models.ForeignKey(SearchDocument, on_delete=models.CASCADE, related_name='postings')
+    # Propriétaire dénormalisé: la recherche se fait toujours dans les jeux d'un utilisateur
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    term = models.CharField(max_length=64)
+    weight = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['owner', 'term'], name='searchposting_owner_term_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.term} ({self.weight})"
+
+
+# Seau de jetons partagé par tous les processus pour un fournisseur d'IA
+# (requêtes et tokens disponibles, rechargés en continu jusqu'au quota par minute)
+class RateLimitBucket(models.Model):
+    provider = models.CharField(max_length=50, unique=True)
+    available_requests = models.FloatField(default=0)
+    available_tokens = models.FloatField(default=0)
+    refilled_at = models.DateTimeField()
+    # Métriques cumulées
+    throttled_calls = models.PositiveIntegerField(default=0)
+    throttled_seconds = models.FloatField(default=0)
+    rejected_calls = models.PositiveIntegerField(default=0)
+    rate_limited_responses = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return self.provider
@@ -0,0 +1,423 @@
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import llm, scheduler
+from .models import Game, NarrativeChoice, NarrativeHistory
+
+ACT_NAMES = {1: "Introduction", 2: "Développement", 3: "Conclusion"}
+
+# Préchargement des choix de l'acte suivant, hors du cycle requête/réponse
+_prefetch_executor = ThreadPoolExecutor(max_workers=settings.NARRATIVE_PREFETCH_WORKERS)
+_prefetch_futures = {}
+_prefetch_lock = threading.Lock()
+
+
+def get_current_act(game):
+    """
+    Acte actuel du jeu, tenu à jour par record_narrative_step
+    """
+    return game.current_act
+
+def next_act_after(current_act, choice_act):
+    """
+    Acte atteint après un choix: le premier choix mène à l'acte 2, tout choix
+    fait à partir de l'acte 2 mène à l'acte 3 (la conclusion)
+    """
+    if current_act >= 3 or choice_act >= 2:
+        return 3
+    return 2
+
+def record_narrative_step(game, choice):
+    """
+    Enregistre un choix dans l'historique et met à jour l'état narratif du jeu
+    (acte courant, nombre d'étapes, révision). À appeler dans une transaction.
+    """
+    NarrativeHistory.objects.create(
+        game=game,
+        act=choice.act,
+        choice_text=choice.choice_text,
+        outcome_description=choice.outcome_description
+    )
+    
+    # Verrouiller le jeu: deux choix simultanés ne doivent pas perdre d'étape
+    current_act = Game.objects.select_for_update().values_list('current_act', flat=True).get(id=game.id)
+    _cancel_prefetch(game)
+    Game.objects.filter(id=game.id).update(
+        current_act=next_act_after(current_act, choice.act),
+        narrative_steps=F('narrative_steps') + 1,
+        last_step_at=timezone.now(),
+        # L'état de l'histoire change: les choix préchargés ne sont plus valables
+        narrative_revision=F('narrative_revision') + 1,
+        choices_prefetch_status=''
+    )
+    game.refresh_from_db(fields=[
+        'current_act', 'narrative_steps', 'last_step_at', 'narrative_revision', 'choices_prefetch_status'
+    ])
+
+def save_narrative_choices(game, act, choices):
+    """
+    Remplace les choix narratifs d'un acte par ceux générés
+    """
+    # Supprimer les anciens choix pour cet acte
+    NarrativeChoice.objects.filter(game=game, act=act).delete()
+    
+    # Créer les nouveaux choix
+    NarrativeChoice.objects.bulk_create([
+        NarrativeChoice(
+            game=game,
+            act=act,
+            choice_text=choice_data.get('choice_text', ''),
+            outcome_description=choice_data.get('outcome_description', '')
+        )
+        for choice_data in choices
+    ])
+
+def invalidate_choices_prefetch(game):
+    """
+    Fait évoluer la révision narrative du jeu: tout préchargement en cours
+    devient obsolète et ses résultats seront ignorés
+    """
+    _cancel_prefetch(game)
+    Game.objects.filter(id=game.id).update(
+        narrative_revision=F('narrative_revision') + 1,
+        choices_prefetch_status=''
+    )
+    game.refresh_from_db(fields=['narrative_revision', 'choices_prefetch_status'])
+
+def _cancel_prefetch(game):
+    with _prefetch_lock:
+        future = _prefetch_futures.pop(game.id, None)
+    if future is not None:
+        future.cancel()
+
+def schedule_choices_prefetch(game):
+    """
+    Lance en arrière-plan la génération des choix de l'acte courant, une fois
+    la transaction en cours validée
+    """
+    if not settings.NARRATIVE_PREFETCH_ENABLED:
+        return
+    
+    act = get_current_act(game)
+    revision = game.narrative_revision
+    updated = Game.objects.filter(id=game.id, narrative_revision=revision).update(
+        choices_prefetch_status=Game.PREFETCH_PENDING,
+        choices_prefetch_started_at=timezone.now()
+    )
+    if not updated:
+        return
+    
+    def submit():
+        # Préchargement spéculatif: moins prioritaire que les choix demandés par l'utilisateur
+        future = _prefetch_executor.submit(
+            scheduler.run_as, scheduler.Work(game.owner_id, scheduler.BULK),
+            prefetch_narrative_choices, game.id, act, revision
+        )
+        with _prefetch_lock:
+            _prefetch_futures[game.id] = future
+    
+    transaction.on_commit(submit)
+
+def prefetch_narrative_choices(game_id, act, revision):
+    """
+    Génère et enregistre les choix d'un acte si la révision narrative du jeu
+    n'a pas changé entre-temps (nouveau choix, génération manuelle...)
+    """
+    try:
+        game = Game.objects.filter(id=game_id, narrative_revision=revision).first()
+        if game is None:
+            return
+        
+        history = NarrativeHistory.objects.filter(game=game)
+        choices = generate_narrative_choices(game, act, history)
+        
+        with transaction.atomic():
+            # Verrouiller le jeu pour que la vérification de révision et l'écriture soient atomiques
+            current = Game.objects.select_for_update().filter(id=game_id, narrative_revision=revision).first()
+            if current is None:
+                return
+            
+            if choices:
+                save_narrative_choices(current, act, choices)
+                status = Game.PREFETCH_READY
+            else:
+                status = Game.PREFETCH_FAILED
+            Game.objects.filter(id=game_id).update(choices_prefetch_status=status)
+    except Exception as e:
+        print(f"Erreur lors du préchargement des choix narratifs: {e}")
+    finally:
+        with _prefetch_lock:
+            _prefetch_futures.pop(game_id, None)
+        connection.close()
+
+def is_prefetch_pending(game):
+    """
+    Un préchargement est considéré en cours tant qu'il n'a pas dépassé
+    NARRATIVE_PREFETCH_TIMEOUT (le processus a pu redémarrer entre-temps)
+    """
+    if game.choices_prefetch_status != Game.PREFETCH_PENDING or game.choices_prefetch_started_at is None:
+        return False
+    deadline = game.choices_prefetch_started_at + timedelta(seconds=settings.NARRATIVE_PREFETCH_TIMEOUT)
+    return timezone.now() < deadline
+
+def generate_narrative_choices(game, act, history):
+    """
+    Utilise l'API OpenAI pour générer des choix narratifs cohérents avec l'histoire du jeu
+    """
+    if llm.get_client() is None:
+        return None
+    
+    # Construire le contexte de l'histoire actuelle
+    context = f"Titre: {game.title}\nGenre: {game.get_genre_display()}\nAmbiance: {game.get_ambiance_display()}\n\n"
+    context += f"Description de l'univers: {game.universe_description}\n\n"
+    
+    if act == 1:
+        context += f"Début de l'histoire: {game.story_act1}\n\n"
+    elif act == 2:
+        context += f"Début de l'histoire: {game.story_act1}\n\n"
+        context += f"Développement: {game.story_act2}\n\n"
+    elif act == 3:
+        context += f"Début de l'histoire: {game.story_act1}\n\n"
+        context += f"Développement: {game.story_act2}\n\n"
+        context += f"Vers la conclusion: {game.story_act3}\n\n"
+    
+    # Ajouter l'historique des choix précédents
+    if history.exists():
+        context += "Historique des choix:\n"
+        for entry in history:
+            context += f"- Acte {entry.act}: {entry.choice_text} → {entry.outcome_description}\n"
+    
+    prompt = f"""
+    {context}
+    
+    Générez 3 choix narratifs significatifs pour l'Acte {act} de cette histoire. Chaque choix doit être mémorable 
+    et avoir un impact significatif sur l'histoire. Pour chaque choix, fournissez:
+    1. Un texte de choix clair (ce que le joueur déciderait)
+    2. Une description détaillée de l'impact de ce choix sur l'histoire
+    
+    Format attendu (JSON uniquement):
+    [
+        {{
+            "choice_text": "Premier choix possible",
+            "outcome_description": "Description de la conséquence du premier choix"
+        }},
+        {{
+            "choice_text": "Second choix possible",
+            "outcome_description": "Description de la conséquence du second choix"
+        }},
+        {{
+            "choice_text": "Troisième choix possible",
+            "outcome_description": "Description de la conséquence du troisième choix"
+        }}
+    ]
+    """
+    
+    try:
+        result_text = llm.chat_completion(
+            messages=[
+                {"role": "system", "content": "Tu es un concepteur narratif de jeux vidéo expert dans la création d'histoires interactives avec des choix significatifs."},
+                {"role": "user", "content": prompt}
+            ],
+            max_tokens=1000
+        )
+        
+        # Trouver le début et la fin du JSON dans la réponse
+        json_start = result_text.find('[')
+        json_end = result_text.rfind(']') + 1
+        
+        if json_start >= 0 and json_end > json_start:
+            json_text = result_text[json_start:json_end]
+            try:
+                choices_data = json.loads(json_text)
+                return choices_data
+            except json.JSONDecodeError:
+                print("Erreur: La réponse de l'API n'est pas au format JSON valide")
+        else:
+            print("Erreur: Impossible de trouver du JSON dans la réponse")
+    
+    except Exception as e:
+        print(f"Erreur lors de l'appel à l'API OpenAI: {e}")
+    
+    return None
+
+def update_game_story_with_choice(game, choice):
+    """
+    Met à jour l'histoire du jeu basée sur le choix narratif sélectionné
+    """
+    if llm.get_client() is None:
+        return
+    
+    # Construire le contexte de l'histoire actuelle
+    context = f"Titre: {game.title}\nGenre: {game.get_genre_display()}\nAmbiance: {game.get_ambiance_display()}\n\n"
+    context += f"Description de l'univers: {game.universe_description}\n\n"
+    context += f"Histoire actuelle - Acte 1: {game.story_act1}\n\n"
+    
+    if choice.act >= 2:
+        context += f"Histoire actuelle - Acte 2: {game.story_act2}\n\n"
+    
+    if choice.act >= 3:
+        context += f"Histoire actuelle - Acte 3: {game.story_act3}\n\n"
+    
+    # Récupérer tous les choix précédents
+    history = NarrativeHistory.objects.filter(game=game)
+    
+    if history.exists():
+        context += "Historique des choix narratifs:\n"
+        for entry in history:
+            context += f"- Acte {entry.act}: {entry.choice_text} → {entry.outcome_description}\n"
+    
+    # Ajouter le choix actuel
+    context += f"\nChoix actuel (Acte {choice.act}): {choice.choice_text}\n"
+    context += f"Conséquence attendue: {choice.outcome_description}\n"
+    
+    if choice.act not in (1, 2, 3):
+        return
+    
+    # Demande à l'IA de mettre à jour la partie correspondante de l'histoire
+    act_label = "l'Acte 3 (conclusion)" if choice.act == 3 else f"l'Acte {choice.act}"
+    prompt = f"""
+        {context}
+        
+        Basé sur ce choix narratif important, réécris {act_label} de l'histoire pour intégrer ce choix et ses conséquences.
+        La nouvelle version doit être cohérente avec l'univers et le ton du jeu, tout en reflétant l'impact du choix.
+        
+        Renvoie uniquement le texte mis à jour pour l'Acte {choice.act}.
+        """
+    
+    try:
+        updated_story = llm.chat_completion(
+            messages=[
+                {"role": "system", "content": "Tu es un écrivain narratif de jeux vidéo expert dans l'adaptation d'histoires selon les choix des joueurs."},
+                {"role": "user", "content": prompt}
+            ],
+            max_tokens=1000
+        )
+        
+        story_field = f'story_act{choice.act}'
+        setattr(game, story_field, updated_story)
+        # Ne pas écraser les champs d'état narratif modifiés en parallèle
+        game.save(update_fields=[story_field, 'updated_at'])
+        
+    except Exception as e:
+        print(f"Erreur lors de la mise à jour de l'histoire: {e}")
+
+def apply_narrative_step(game, choice):
+    """
+    Réécrit l'acte du choix sélectionné et génère les choix de l'acte suivant
+    en un seul appel à l'API, puis enregistre le tout dans une même transaction.
+    Retourne False si l'appel ou la réponse échoue: l'appelant doit alors
+    revenir aux deux appels séparés (update_game_story_with_choice puis
+    génération des choix).
+    """
+    if not settings.NARRATIVE_COMBINED_STEP or llm.get_client() is None:
+        return False
+    if choice.act not in (1, 2, 3):
+        return False
+    
+    next_act = get_current_act(game)
+    revision = game.narrative_revision
+    
+    # Construire le contexte de l'histoire actuelle
+    context = f"Titre: {game.title}\nGenre: {game.get_genre_display()}\nAmbiance: {game.get_ambiance_display()}\n\n"
+    context += f"Description de l'univers: {game.universe_description}\n\n"
+    for act in range(1, max(choice.act, next_act) + 1):
+        context += f"Histoire actuelle - Acte {act}: {getattr(game, f'story_act{act}')}\n\n"
+    
+    history = NarrativeHistory.objects.filter(game=game)
+    if history.exists():
+        context += "Historique des choix narratifs:\n"
+        for entry in history:
+            context += f"- Acte {entry.act}: {entry.choice_text} → {entry.outcome_description}\n"
+    
+    context += f"\nChoix actuel (Acte {choice.act}): {choice.choice_text}\n"
+    context += f"Conséquence attendue: {choice.outcome_description}\n"
+    
+    act_label = "l'Acte 3 (conclusion)" if choice.act == 3 else f"l'Acte {choice.act}"
+    prompt = f"""
+        {context}
+        
+        1. Basé sur ce choix narratif important, réécris {act_label} de l'histoire pour intégrer ce choix et ses conséquences.
+        La nouvelle version doit être cohérente avec l'univers et le ton du jeu, tout en reflétant l'impact du choix.
+        
+        2. En t'appuyant sur cette nouvelle version, génère 3 choix narratifs significatifs pour l'Acte {next_act}.
+        Chaque choix doit être mémorable et avoir un impact significatif sur l'histoire.
+        
+        Format attendu (JSON uniquement):
+        {{
+            "story": "Texte mis à jour de l'Acte {choice.act}",
+            "next_choices": [
+                {{
+                    "choice_text": "Choix possible",
+                    "outcome_description": "Description de la conséquence de ce choix"
+                }}
+            ]
+        }}
+        """
+    
+    try:
+        result_text = llm.chat_completion(
+            messages=[
+                {"role": "system", "content": "Tu es un concepteur narratif de jeux vidéo expert dans l'adaptation d'histoires selon les choix des joueurs et la création de choix significatifs."},
+                {"role": "user", "content": prompt}
+            ],
+            max_tokens=settings.NARRATIVE_STEP_MAX_TOKENS
+        )
+    except Exception as e:
+        print(f"Erreur lors de l'appel à l'API OpenAI: {e}")
+        return False
+    
+    step = parse_narrative_step(result_text)
+    if step is None:
+        return False
+    updated_story, next_choices = step
+    
+    story_field = f'story_act{choice.act}'
+    with transaction.atomic():
+        # Un autre choix a pu être validé entre-temps: ne rien écrire dans ce cas
+        current = Game.objects.select_for_update().filter(id=game.id, narrative_revision=revision).first()
+        if current is None:
+            return True
+        
+        setattr(current, story_field, updated_story)
+        current.choices_prefetch_status = Game.PREFETCH_READY
+        current.save(update_fields=[story_field, 'choices_prefetch_status', 'updated_at'])
+        save_narrative_choices(current, next_act, next_choices)
+    
+    setattr(game, story_field, updated_story)
+    game.choices_prefetch_status = Game.PREFETCH_READY
+    return True
+
+def parse_narrative_step(result_text):
+    """
+    Extrait (histoire réécrite, choix suivants) de la réponse combinée,
+    ou None si elle est incomplète
+    """
+    json_start = result_text.find('{')
+    json_end = result_text.rfind('}') + 1
+    if json_start < 0 or json_end <= json_start:
+        print("Erreur: Impossible de trouver du JSON dans la réponse")
+        return None
+    
+    try:
+        data = json.loads(result_text[json_start:json_end])
+    except json.JSONDecodeError:
+        print("Erreur: La réponse de l'API n'est pas au format JSON valide")
+        return None
+    
+    story = data.get('story') if isinstance(data, dict) else None
+    choices = data.get('next_choices') if isinstance(data, dict) else None
+    if not isinstance(story, str) or not story.strip():
+        print("Erreur: Histoire mise à jour absente de la réponse")
+        return None
+    if not isinstance(choices, list) or not choices or not all(isinstance(c, dict) and c.get('choice_text') for c in choices):
+        print("Erreur: Choix suivants absents de la réponse")
+        return None
+    
+    return story.strip(), choices
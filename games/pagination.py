@@ -0,0 +1,55 @@
+import base64
+from collections import namedtuple
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+# Page de résultats paginée par curseur (keyset)
+KeysetPage = namedtuple('KeysetPage', ['items', 'next_cursor', 'is_first'])
+
+
+def encode_cursor(created_at, pk):
+    raw = f"{created_at.isoformat()}|{pk}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    """
+    Retourne (created_at, id) ou None si le curseur est absent ou invalide
+    """
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+        created_at, pk = raw.rsplit('|', 1)
+        created_at = parse_datetime(created_at)
+        pk = int(pk)
+    except (ValueError, UnicodeError):
+        return None
+    if created_at is None:
+        return None
+    return created_at, pk
+
+def paginate_keyset(queryset, cursor, page_size, field='created_at'):
+    """
+    Pagine un queryset du plus récent au plus ancien sur (field, id).
+    Contrairement à OFFSET, le coût d'une page ne dépend pas de sa position:
+    la base reprend directement après le dernier élément de la page précédente.
+    """
+    queryset = queryset.order_by(f'-{field}', '-id')
+    
+    position = decode_cursor(cursor)
+    if position is not None:
+        created_at, pk = position
+        queryset = queryset.filter(
+            Q(**{f'{field}__lt': created_at}) | Q(**{field: created_at, 'id__lt': pk})
+        )
+    
+    # Un élément de plus pour savoir s'il existe une page suivante
+    items = list(queryset[:page_size + 1])
+    next_cursor = None
+    if len(items) > page_size:
+        items = items[:page_size]
+        last = items[-1]
+        next_cursor = encode_cursor(getattr(last, field), last.id)
+    
+    return KeysetPage(items, next_cursor, position is None)
@@ -0,0 +1,215 @@
+import hashlib
+import io
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import unquote
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.db import connection, transaction
+from django.template.loader import get_template
+from django.utils import timezone
+from PIL import Image
+from xhtml2pdf import pisa
+
+from .models import Character, Game, Location
+
+# À incrémenter quand le gabarit PDF change, pour invalider les fichiers en cache
+PDF_TEMPLATE_VERSION = 2
+
+# Pré-rendu des PDF après la création d'un jeu, hors du cycle requête/réponse
+_prerender_executor = ThreadPoolExecutor(max_workers=1)
+
+
+# Ajouter cette fonction pour aider xhtml2pdf à trouver les fichiers statiques
+def link_callback(uri, rel):
+    """
+    Convert HTML URIs to absolute system paths so xhtml2pdf can access those resources
+    """
+    # Utiliser Django's static finder pour trouver les fichiers
+    if uri.startswith(settings.STATIC_URL):
+        path = finders.find(uri.replace(settings.STATIC_URL, ""))
+        return path
+    
+    # Gérer les fichiers média: lus sur le disque, en version réduite pour l'impression
+    elif uri.startswith(settings.MEDIA_URL):
+        return print_image_path(uri.replace(settings.MEDIA_URL, "", 1))
+    
+    # Gérer les urls absolues
+    elif uri.startswith("http"):
+        return uri
+    
+    # Gestion par défaut
+    return uri
+
+def html_to_pdf(html_string, output, link_callback=None):
+    """
+    Simple function to convert HTML to PDF using xhtml2pdf
+    """
+    # Convert external URLs in the HTML string to base64 for images
+    pisa_status = pisa.CreatePDF(
+        src=html_string,
+        dest=output,
+        encoding='utf-8',
+        link_callback=link_callback
+    )
+    
+    # Return True if PDF generation was successful
+    return pisa_status.err == 0
+
+def print_image_path(relative_path):
+    """
+    Chemin local d'une version JPEG réduite (taille d'impression) d'une image
+    de MEDIA_ROOT, créée à la demande et régénérée si l'original change.
+    Retourne le chemin de l'original si la réduction échoue.
+    """
+    media_root = os.path.realpath(settings.MEDIA_ROOT)
+    source = os.path.realpath(os.path.join(media_root, unquote(relative_path)))
+    # Refuser les chemins qui sortent de MEDIA_ROOT
+    if os.path.commonpath([media_root, source]) != media_root or not os.path.isfile(source):
+        return None
+    
+    source_mtime = os.path.getmtime(source)
+    digest = hashlib.sha256(os.path.relpath(source, media_root).encode('utf-8')).hexdigest()
+    derived = os.path.join(settings.PDF_CACHE_DIR, 'images', digest[:2], f"{digest}.jpg")
+    if os.path.exists(derived) and os.path.getmtime(derived) >= source_mtime:
+        return derived
+    
+    os.makedirs(os.path.dirname(derived), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(derived), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f, Image.open(source) as image:
+            image.thumbnail((settings.PDF_IMAGE_MAX_SIZE, settings.PDF_IMAGE_MAX_SIZE))
+            image.convert('RGB').save(f, 'JPEG', quality=settings.PDF_IMAGE_QUALITY, optimize=True)
+        os.replace(tmp_path, derived)
+    except (OSError, ValueError) as e:
+        print(f"Error while downscaling image for PDF: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return source
+    return derived
+
+def pdf_fingerprint(game):
+    """
+    Empreinte du contenu exporté: change dès que l'histoire (updated_at),
+    les personnages ou les lieux du jeu sont modifiés
+    """
+    digest = hashlib.sha256()
+    digest.update(f"{PDF_TEMPLATE_VERSION}|{game.id}|{game.updated_at.isoformat()}".encode('utf-8'))
+    for row in Character.objects.filter(game=game).order_by('id').values_list(
+        'id', 'name', 'role', 'background', 'abilities', 'image'
+    ):
+        digest.update(repr(row).encode('utf-8'))
+    digest.update(b'|locations|')
+    for row in Location.objects.filter(game=game).order_by('id').values_list('id', 'name', 'description', 'image'):
+        digest.update(repr(row).encode('utf-8'))
+    return digest.hexdigest()[:32]
+
+def render_game_pdf(game):
+    """
+    Génère le PDF d'un jeu et retourne son contenu, ou None en cas d'erreur.
+    Les images sont lues sur le disque par link_callback (jamais par HTTP).
+    """
+    keywords = [tag.name for tag in game.tags.all()]
+    
+    # Prepare the context for the template
+    context = {
+        'game': game,
+        'characters': Character.objects.filter(game=game),
+        'locations': Location.objects.filter(game=game),
+        'keywords': keywords,
+        # Date du contenu, pas du rendu: le PDF en cache reste identique à un rendu à neuf
+        'generation_date': timezone.localtime(game.updated_at).strftime("%d/%m/%Y"),
+        'STATIC_URL': settings.STATIC_URL
+    }
+    
+    # Render the template
+    template = get_template('games/game_pdf.html')
+    html_string = template.render(context)
+    
+    output = io.BytesIO()
+    if not html_to_pdf(html_string, output, link_callback):
+        return None
+    return output.getvalue()
+
+def _game_cache_dir(game_id):
+    return os.path.join(settings.PDF_CACHE_DIR, str(game_id))
+
+def get_cached_pdf(game, fingerprint):
+    """
+    Chemin du PDF en cache pour cette empreinte, ou None
+    """
+    if not settings.PDF_CACHE_ENABLED:
+        return None
+    path = os.path.join(_game_cache_dir(game.id), f"{fingerprint}.pdf")
+    return path if os.path.exists(path) else None
+
+def get_or_render_pdf(game, fingerprint=None):
+    """
+    Retourne (contenu ou chemin, empreinte) du PDF d'un jeu, en le générant
+    si la version en cache est absente ou obsolète. Le premier élément est un
+    chemin de fichier si le cache est actif, sinon les octets du PDF ; None en
+    cas d'échec de la génération.
+    """
+    fingerprint = fingerprint or pdf_fingerprint(game)
+    cached_path = get_cached_pdf(game, fingerprint)
+    if cached_path:
+        return cached_path, fingerprint
+    
+    data = render_game_pdf(game)
+    if data is None or not settings.PDF_CACHE_ENABLED:
+        return data, fingerprint
+    
+    return _store_pdf(game, fingerprint, data) or data, fingerprint
+
+def _store_pdf(game, fingerprint, data):
+    directory = _game_cache_dir(game.id)
+    path = os.path.join(directory, f"{fingerprint}.pdf")
+    os.makedirs(directory, exist_ok=True)
+    
+    # Écriture atomique: fichier temporaire puis renommage
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Error while writing PDF cache entry: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return None
+    
+    # Seule la version correspondant au contenu actuel du jeu est conservée: un
+    # rendu plus lent, lancé avant une modification, ne supprime pas le PDF à jour
+    current = Game.objects.filter(id=game.id).first()
+    current_name = f"{pdf_fingerprint(current)}.pdf" if current is not None else None
+    for name in os.listdir(directory):
+        if name.endswith('.pdf') and name != current_name:
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                # Absent, ou encore ouvert par un téléchargement en cours
+                pass
+    return path if os.path.exists(path) else None
+
+def schedule_pdf_prerender(game):
+    """
+    Génère en arrière-plan le PDF d'un jeu qui vient d'être créé, pour que le
+    premier téléchargement soit servi depuis le cache
+    """
+    if not settings.PDF_PRERENDER_ENABLED or not settings.PDF_CACHE_ENABLED:
+        return
+    
+    game_id = game.id
+    transaction.on_commit(lambda: _prerender_executor.submit(_prerender_pdf, game_id))
+
+def _prerender_pdf(game_id):
+    try:
+        game = Game.objects.filter(id=game_id).first()
+        if game is not None:
+            get_or_render_pdf(game)
+    except Exception as e:
+        print(f"Erreur lors du pré-rendu du PDF: {e}")
+    finally:
+        connection.close()
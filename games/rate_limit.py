@@ -0,0 +1,194 @@
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import scheduler
+from .models import RateLimitBucket
+
+# Compteurs du processus courant (les totaux sont aussi stockés en base)
+_stats_lock = threading.Lock()
+_stats = {'acquired': 0, 'throttled': 0, 'throttled_seconds': 0.0, 'rejected': 0}
+
+
+class RateLimitExceeded(RuntimeError):
+    """
+    Le quota du fournisseur ne se libère pas dans le délai d'attente autorisé
+    """
+
+
+def _count(name, value=1):
+    with _stats_lock:
+        _stats[name] += value
+
+def _limits(provider):
+    if not settings.RATE_LIMIT_ENABLED:
+        return None
+    return settings.RATE_LIMITS.get(provider)
+
+def estimate_tokens(messages, max_tokens):
+    """
+    Estimation des tokens d'un appel de chat (environ 4 caractères par token
+    pour le prompt, plus le maximum de la réponse), corrigée après l'appel
+    """
+    prompt_chars = sum(len(message.get('content') or '') for message in messages)
+    return prompt_chars // 4 + max_tokens
+
+def _locked_bucket(provider, limits, now):
+    bucket = RateLimitBucket.objects.select_for_update().filter(provider=provider).first()
+    if bucket is not None:
+        return bucket
+    try:
+        # Premier appel: le seau démarre plein
+        with transaction.atomic():
+            RateLimitBucket.objects.create(
+                provider=provider,
+                available_requests=limits.get('requests_per_minute', 0),
+                available_tokens=limits.get('tokens_per_minute', 0),
+                refilled_at=now,
+            )
+    except IntegrityError:
+        # Créé en parallèle par un autre processus
+        pass
+    return RateLimitBucket.objects.select_for_update().get(provider=provider)
+
+def _try_take(provider, limits, tokens):
+    """
+    Recharge le seau puis prélève une requête et `tokens` tokens s'ils sont
+    disponibles. Retourne 0 en cas de succès, sinon le nombre de secondes à
+    attendre avant que le quota ne le permette.
+    """
+    requests_per_minute = limits.get('requests_per_minute', 0)
+    tokens_per_minute = limits.get('tokens_per_minute', 0)
+    # Un appel plus gros que le quota ne doit pas attendre indéfiniment
+    tokens = min(tokens, tokens_per_minute)
+
+    with transaction.atomic():
+        now = timezone.now()
+        bucket = _locked_bucket(provider, limits, now)
+        elapsed = max(0.0, (now - bucket.refilled_at).total_seconds())
+        bucket.refilled_at = now
+
+        wait = 0.0
+        if requests_per_minute:
+            bucket.available_requests = min(
+                requests_per_minute, bucket.available_requests + elapsed * requests_per_minute / 60
+            )
+            if bucket.available_requests < 1:
+                wait = (1 - bucket.available_requests) * 60 / requests_per_minute
+        if tokens_per_minute:
+            bucket.available_tokens = min(
+                tokens_per_minute, bucket.available_tokens + elapsed * tokens_per_minute / 60
+            )
+            if bucket.available_tokens < tokens:
+                wait = max(wait, (tokens - bucket.available_tokens) * 60 / tokens_per_minute)
+
+        if not wait:
+            if requests_per_minute:
+                bucket.available_requests -= 1
+            if tokens_per_minute:
+                bucket.available_tokens -= tokens
+        bucket.save(update_fields=['available_requests', 'available_tokens', 'refilled_at'])
+    return wait
+
+@contextmanager
+def scheduled_call(provider, tokens=0, work=None, max_wait=None):
+    """
+    Réserve une place dans l'ordonnanceur (scheduler.slot) puis le quota du
+    fournisseur pour un appel fait dans le bloc. Un appel freiné par le quota
+    rend sa place pendant qu'il attend: un appel interactif n'est pas bloqué
+    derrière un appel BULK ou IMAGE qui patiente, et les places libérées par
+    le quota reviennent d'abord aux classes prioritaires.
+    """
+    limits = _limits(provider)
+    max_wait = settings.RATE_LIMIT_MAX_WAIT if max_wait is None else max_wait
+    started = time.monotonic()
+    throttled = False
+    while True:
+        with scheduler.slot(work):
+            wait = _try_take(provider, limits, tokens) if limits else 0
+            if not wait:
+                if limits:
+                    _record_acquired(provider, started, throttled)
+                yield
+                return
+        _wait_for_quota(provider, started, wait, max_wait)
+        throttled = True
+
+def _wait_for_quota(provider, started, wait, max_wait):
+    if time.monotonic() - started + wait > max_wait:
+        _count('rejected')
+        RateLimitBucket.objects.filter(provider=provider).update(rejected_calls=F('rejected_calls') + 1)
+        raise RateLimitExceeded(f"Quota {provider} épuisé (attente estimée {wait:.1f} s)")
+    # Décalage aléatoire: les appelants en attente ne se réveillent pas tous ensemble
+    time.sleep(wait + random.uniform(0, 0.05))
+
+def _record_acquired(provider, started, throttled):
+    waited = time.monotonic() - started if throttled else 0.0
+    _count('acquired')
+    if throttled:
+        _count('throttled')
+        _count('throttled_seconds', waited)
+        RateLimitBucket.objects.filter(provider=provider).update(
+            throttled_calls=F('throttled_calls') + 1,
+            throttled_seconds=F('throttled_seconds') + waited,
+        )
+
+def settle_tokens(provider, reserved, used):
+    """
+    Rend au seau la différence entre les tokens réservés (estimation) et ceux
+    réellement consommés par l'appel
+    """
+    limits = _limits(provider)
+    if not limits or not limits.get('tokens_per_minute') or used is None:
+        return
+    reserved = min(reserved, limits['tokens_per_minute'])
+    if reserved != used:
+        RateLimitBucket.objects.filter(provider=provider).update(
+            available_tokens=F('available_tokens') + (reserved - used)
+        )
+
+def report_rate_limited(provider):
+    """
+    Le fournisseur a répondu 429 malgré le limiteur: le seau est vidé pour que
+    tous les processus patientent le temps d'une recharge
+    """
+    if not _limits(provider):
+        return
+    RateLimitBucket.objects.filter(provider=provider).update(
+        available_requests=0,
+        available_tokens=0,
+        refilled_at=timezone.now(),
+        rate_limited_responses=F('rate_limited_responses') + 1,
+    )
+
+def provider_for_host(host):
+    return settings.RATE_LIMIT_HOSTS.get(host)
+
+def get_stats():
+    """
+    État des seaux et métriques cumulées par fournisseur, plus les compteurs
+    du processus courant
+    """
+    with _stats_lock:
+        process_stats = dict(_stats)
+    return {
+        'providers': {
+            bucket.provider: {
+                'available_requests': bucket.available_requests,
+                'available_tokens': bucket.available_tokens,
+                'limits': settings.RATE_LIMITS.get(bucket.provider, {}),
+                'throttled_calls': bucket.throttled_calls,
+                'throttled_seconds': bucket.throttled_seconds,
+                'rejected_calls': bucket.rejected_calls,
+                'rate_limited_responses': bucket.rate_limited_responses,
+            }
+            for bucket in RateLimitBucket.objects.order_by('provider')
+        },
+        'process': process_stats,
+    }
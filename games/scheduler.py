@@ -0,0 +1,237 @@
+import contextvars
+import functools
+import itertools
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+from django.conf import settings
+
+# Classes de travail, de la plus prioritaire à la moins prioritaire
+INTERACTIVE = 'interactive'
+BULK = 'bulk'
+IMAGE = 'image'
+WORK_CLASSES = (INTERACTIVE, BULK, IMAGE)
+
+# Appel à un fournisseur d'IA pour le compte d'un utilisateur (None: tâche système)
+Work = namedtuple('Work', ['user_id', 'work_class'])
+
+# Travail en cours dans ce thread / cette tâche asynchrone
+_current_work = contextvars.ContextVar('ai_work', default=None)
+
+
+class QueueTimeout(RuntimeError):
+    """
+    L'appel est resté en file plus longtemps que AI_SCHEDULER_MAX_WAIT
+    """
+
+
+class _Ticket:
+    __slots__ = ('work', 'start_tag', 'sequence', 'enqueued_at', 'granted')
+
+    def __init__(self, work, start_tag, sequence):
+        self.work = work
+        self.start_tag = start_tag
+        self.sequence = sequence
+        self.enqueued_at = time.monotonic()
+        self.granted = False
+
+
+class FairScheduler:
+    """
+    Répartit les appels aux fournisseurs d'IA du processus entre les
+    utilisateurs. Au plus `capacity` appels s'exécutent en même temps ; une
+    place libérée va d'abord à la classe la plus prioritaire qui attend, puis,
+    dans cette classe, à l'utilisateur le moins servi au regard de son poids
+    (file équitable pondérée par étiquettes de début). Un utilisateur qui a
+    atteint son plafond d'appels simultanés pour une classe laisse passer les
+    autres.
+
+    L'état est propre au processus: les priorités ne s'appliquent pas entre
+    les processus web et les workers, qui ne se partagent que le quota des
+    fournisseurs (rate_limit, en base).
+    """
+
+    def __init__(self, capacity, user_caps, user_weights):
+        self.capacity = capacity
+        self.user_caps = user_caps
+        self.user_weights = user_weights
+        self._condition = threading.Condition()
+        self._sequence = itertools.count()
+        self._queues = {work_class: [] for work_class in WORK_CLASSES}
+        # Horloge virtuelle par classe et dernière étiquette de fin par utilisateur
+        self._virtual_time = dict.fromkeys(WORK_CLASSES, 0.0)
+        self._finish_tags = {}
+        self._running = 0
+        self._running_by_work = {}
+        self._stats = {
+            work_class: {'granted': 0, 'timeouts': 0, 'total_wait': 0.0, 'max_wait': 0.0}
+            for work_class in WORK_CLASSES
+        }
+
+    def acquire(self, work, timeout=None):
+        """
+        Attend une place pour ce travail. Retourne le temps passé en file ;
+        lève QueueTimeout au-delà de `timeout` secondes.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            weight = self.user_weights.get(work.user_id, 1)
+            start_tag = max(self._virtual_time[work.work_class], self._finish_tags.get(work, 0.0))
+            self._finish_tags[work] = start_tag + 1 / weight
+            ticket = _Ticket(work, start_tag, next(self._sequence))
+            self._queues[work.work_class].append(ticket)
+            self._dispatch()
+
+            while not ticket.granted:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    self._queues[work.work_class].remove(ticket)
+                    self._stats[work.work_class]['timeouts'] += 1
+                    raise QueueTimeout(f"Pas de place pour un appel {work.work_class} après {timeout:.0f} s")
+                self._condition.wait(remaining)
+
+            waited = time.monotonic() - ticket.enqueued_at
+            stats = self._stats[work.work_class]
+            stats['granted'] += 1
+            stats['total_wait'] += waited
+            stats['max_wait'] = max(stats['max_wait'], waited)
+            return waited
+
+    def release(self, work):
+        with self._condition:
+            self._running -= 1
+            self._running_by_work[work] -= 1
+            if not self._running_by_work[work]:
+                del self._running_by_work[work]
+            # Une étiquette dépassée par l'horloge virtuelle n'a plus d'effet
+            self._finish_tags = {
+                work: tag for work, tag in self._finish_tags.items()
+                if tag > self._virtual_time[work.work_class]
+            }
+            self._dispatch()
+
+    def _dispatch(self):
+        granted = False
+        while self._running < self.capacity:
+            ticket = self._next_ticket()
+            if ticket is None:
+                break
+            self._queues[ticket.work.work_class].remove(ticket)
+            self._virtual_time[ticket.work.work_class] = ticket.start_tag
+            self._running += 1
+            self._running_by_work[ticket.work] = self._running_by_work.get(ticket.work, 0) + 1
+            ticket.granted = True
+            granted = True
+        if granted:
+            self._condition.notify_all()
+
+    def _next_ticket(self):
+        for work_class in WORK_CLASSES:
+            cap = self.user_caps.get(work_class)
+            eligible = [
+                ticket for ticket in self._queues[work_class]
+                if ticket.work.user_id is None or not cap or self._running_by_work.get(ticket.work, 0) < cap
+            ]
+            if eligible:
+                return min(eligible, key=lambda ticket: (ticket.start_tag, ticket.sequence))
+        return None
+
+    def get_stats(self):
+        """
+        Par classe: appels en file, en cours, servis, et temps d'attente
+        (moyen, maximal, et le plus ancien appel encore en file)
+        """
+        now = time.monotonic()
+        with self._condition:
+            stats = {}
+            for work_class in WORK_CLASSES:
+                class_stats = self._stats[work_class]
+                queue = self._queues[work_class]
+                stats[work_class] = {
+                    'queued': len(queue),
+                    'running': sum(
+                        count for work, count in self._running_by_work.items() if work.work_class == work_class
+                    ),
+                    'granted': class_stats['granted'],
+                    'timeouts': class_stats['timeouts'],
+                    'avg_wait': class_stats['total_wait'] / class_stats['granted'] if class_stats['granted'] else 0.0,
+                    'max_wait': class_stats['max_wait'],
+                    'oldest_wait': max((now - ticket.enqueued_at for ticket in queue), default=0.0),
+                }
+            return {'capacity': self.capacity, 'running': self._running, 'classes': stats}
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = FairScheduler(
+                    capacity=settings.AI_SCHEDULER_MAX_CONCURRENT,
+                    user_caps=settings.AI_SCHEDULER_USER_MAX_CONCURRENT,
+                    user_weights=settings.AI_SCHEDULER_USER_WEIGHTS,
+                )
+    return _scheduler
+
+def current_work():
+    return _current_work.get()
+
+@contextmanager
+def work_context(user_id, work_class):
+    """
+    Attribue les appels d'IA faits dans ce bloc à un utilisateur et une classe
+    """
+    token = _current_work.set(Work(user_id, work_class))
+    try:
+        yield
+    finally:
+        _current_work.reset(token)
+
+def run_as(work, function, *args, **kwargs):
+    """
+    Exécute function pour le compte de `work` (utile dans les threads d'un
+    pool, qui n'héritent pas du contexte de l'appelant)
+    """
+    with work_context(work.user_id, work.work_class):
+        return function(*args, **kwargs)
+
+def scheduled_view(work_class):
+    """
+    Décorateur de vue: les appels d'IA de la vue sont attribués à
+    l'utilisateur connecté dans la classe donnée
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            with work_context(request.user.id, work_class):
+                return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+@contextmanager
+def slot(work=None):
+    """
+    Réserve une place pour un appel à un fournisseur d'IA. Sans `work`
+    explicite, le travail du contexte courant est utilisé (à défaut: tâche
+    système de la classe BULK).
+    """
+    if not settings.AI_SCHEDULER_ENABLED:
+        yield
+        return
+
+    work = work or current_work() or Work(None, BULK)
+    scheduler = get_scheduler()
+    scheduler.acquire(work, timeout=settings.AI_SCHEDULER_MAX_WAIT)
+    try:
+        yield
+    finally:
+        scheduler.release(work)
+
+def get_stats():
+    return get_scheduler().get_stats()
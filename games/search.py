@@ -0,0 +1,133 @@
+import re
+import unicodedata
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+from django.db.models.expressions import RawSQL
+
+from .models import Character, Game, Location, SearchDocument, SearchPosting
+
+# Poids de chaque champ dans le score d'un document
+FIELD_WEIGHTS = {
+    'title': 8,
+    'keywords': 5,
+    'names': 4,
+    'universe_description': 2,
+    'story': 1,
+}
+
+# Mots trop fréquents pour être utiles à la recherche
+STOPWORDS = {
+    'au', 'aux', 'avec', 'ce', 'ces', 'dans', 'de', 'des', 'du', 'elle', 'en', 'et', 'est', 'il', 'ils',
+    'la', 'le', 'les', 'leur', 'leurs', 'mais', 'ne', 'ou', 'par', 'pas', 'pour', 'qu', 'que', 'qui',
+    'sa', 'se', 'ses', 'son', 'sur', 'un', 'une', 'the', 'and', 'of', 'to', 'in', 'a', 'an', 'is', 'on',
+}
+
+_WORD_RE = re.compile(r'\w+')
+
+
+def tokenize(text):
+    """
+    Découpe un texte en termes normalisés (minuscules, sans accents, sans mots vides)
+    """
+    text = unicodedata.normalize('NFKD', (text or '').lower())
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return [
+        word[:64]
+        for word in _WORD_RE.findall(text)
+        if len(word) > 1 and word not in STOPWORDS
+    ]
+
+def use_fulltext():
+    """
+    Recherche plein texte native (MySQL FULLTEXT) ou index inversé SearchPosting
+    """
+    if settings.SEARCH_BACKEND == 'auto':
+        return connection.vendor == 'mysql'
+    return settings.SEARCH_BACKEND == 'fulltext'
+
+def _game_fields(game):
+    names = list(Character.objects.filter(game=game).values_list('name', flat=True))
+    names += list(Location.objects.filter(game=game).values_list('name', flat=True))
+    return {
+        'title': game.title,
+        'keywords': game.keywords,
+        'names': ' '.join(names),
+        'universe_description': game.universe_description,
+        'story': ' '.join([game.story_act1, game.story_act2, game.story_act3]),
+    }
+
+def index_game(game):
+    """
+    (Ré)indexe un jeu: met à jour son document et, sans recherche plein texte
+    native, ses entrées de l'index inversé
+    """
+    fields = _game_fields(game)
+    content = '\n'.join(fields.values())
+
+    with transaction.atomic():
+        document, created = SearchDocument.objects.update_or_create(
+            game=game, defaults={'owner_id': game.owner_id, 'content': content}
+        )
+        if use_fulltext():
+            return document
+
+        weights = Counter()
+        for field, text in fields.items():
+            for term in tokenize(text):
+                weights[term] += FIELD_WEIGHTS[field]
+
+        if not created:
+            SearchPosting.objects.filter(document=document).delete()
+        SearchPosting.objects.bulk_create(
+            [
+                SearchPosting(document=document, owner_id=game.owner_id, term=term, weight=weight)
+                for term, weight in weights.items()
+            ],
+            batch_size=500
+        )
+    return document
+
+def index_game_by_id(game_id):
+    game = Game.objects.filter(id=game_id).first()
+    if game is not None:
+        index_game(game)
+
+def search_games(owner, query, offset=0, limit=20):
+    """
+    Recherche dans les jeux d'un utilisateur. Retourne (jeux classés par
+    pertinence, il_y_a_une_suite). Les jeux contenant tous les termes de la
+    requête sont classés avant ceux qui n'en contiennent qu'une partie.
+    """
+    terms = list(dict.fromkeys(tokenize(query)))
+    if not terms:
+        return [], False
+
+    if use_fulltext():
+        ranked = (
+            SearchDocument.objects.filter(owner=owner)
+            .annotate(score=RawSQL(
+                'MATCH(games_searchdocument.content) AGAINST (%s IN NATURAL LANGUAGE MODE)', (' '.join(terms),)
+            ))
+            .filter(score__gt=0)
+            .order_by('-score', '-id')
+            .values_list('game_id', flat=True)
+        )
+    else:
+        ranked = (
+            SearchPosting.objects.filter(owner=owner, term__in=terms)
+            .values('document__game_id')
+            .annotate(matched=Count('term'), score=Sum('weight'))
+            .order_by('-matched', '-score', '-document__game_id')
+            .values_list('document__game_id', flat=True)
+        )
+
+    # Un résultat de plus pour savoir s'il existe une page suivante
+    game_ids = list(ranked[offset:offset + limit + 1])
+    has_next = len(game_ids) > limit
+    game_ids = game_ids[:limit]
+
+    games = Game.objects.only(*Game.CARD_FIELDS).prefetch_related('tags').in_bulk(game_ids)
+    return [games[game_id] for game_id in game_ids if game_id in games], has_next
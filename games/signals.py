@@ -0,0 +1,74 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import blob_storage, image_cache, search, similarity, tags
+from .models import Character, Game, ImageCacheEntry, Location
+
+# Champs du jeu pris en compte par l'index de recherche
+INDEXED_GAME_FIELDS = {'title', 'keywords', 'universe_description', 'story_act1', 'story_act2', 'story_act3'}
+# Champs du jeu pris en compte par l'index de similarité
+SIMILARITY_GAME_FIELDS = INDEXED_GAME_FIELDS | {'genre', 'ambiance'}
+
+
+def variant_paths(variants):
+    """
+    Chemins de toutes les déclinaisons enregistrées dans image_variants
+    """
+    return [
+        path
+        for key, paths in (variants or {}).items()
+        if isinstance(paths, dict)
+        for path in paths.values()
+    ]
+
+def schedule_reindex(game_id):
+    # Après validation de la transaction: le jeu a pu être supprimé entre-temps
+    transaction.on_commit(lambda: search.index_game_by_id(game_id))
+
+@receiver(post_delete, sender=Character)
+@receiver(post_delete, sender=Location)
+def release_image(sender, instance, **kwargs):
+    # Le fichier n'est supprimé que lorsque plus aucune image ne le référence
+    if instance.image:
+        blob_storage.release(instance.image.name, variant_paths(instance.image_variants))
+
+@receiver(post_delete, sender=ImageCacheEntry)
+def release_cached_image(sender, instance, **kwargs):
+    image_cache.release_file(instance.file)
+
+@receiver(post_save, sender=Game)
+def reindex_game(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not INDEXED_GAME_FIELDS.intersection(update_fields):
+        return
+    schedule_reindex(instance.id)
+
+@receiver(post_save, sender=Character)
+@receiver(post_save, sender=Location)
+@receiver(post_delete, sender=Character)
+@receiver(post_delete, sender=Location)
+def reindex_game_assets(sender, instance, **kwargs):
+    # bulk_create n'émet pas ce signal: voir stream_game_creation
+    schedule_reindex(instance.game_id)
+
+@receiver(post_save, sender=Game)
+def sync_tags(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or 'keywords' in update_fields:
+        tags.sync_game_tags(instance)
+
+@receiver(pre_delete, sender=Game)
+def release_tags(sender, instance, **kwargs):
+    # Les liens vers les mots-clés sont supprimés en cascade sans signal m2m_changed
+    tags.release_game_tags(instance)
+
+@receiver(post_save, sender=Game)
+def update_similarity(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not SIMILARITY_GAME_FIELDS.intersection(update_fields):
+        return
+    game_id = instance.id
+    transaction.on_commit(lambda: similarity.index_game_by_id(game_id))
+
+@receiver(post_delete, sender=Game)
+def remove_similarity(sender, instance, **kwargs):
+    game_id, owner_id = instance.id, instance.owner_id
+    transaction.on_commit(lambda: similarity.remove_game(game_id, owner_id))
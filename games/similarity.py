@@ -0,0 +1,330 @@
+import hashlib
+import math
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+import numpy as np
+from django.conf import settings
+
+from .models import Game
+from .search import tokenize
+
+# Verrou entre processus: flock sous Unix, msvcrt sous Windows (verrou exclusif seulement)
+if os.name == 'nt':
+    import msvcrt
+    fcntl = None
+else:
+    import fcntl
+    msvcrt = None
+
+# Poids de chaque champ dans le vecteur d'un jeu
+FIELD_WEIGHTS = {
+    'title': 3,
+    'keywords': 3,
+    'universe_description': 2,
+    'story': 1,
+}
+# Le genre et l'ambiance sont des caractéristiques à part entière
+CATEGORY_WEIGHT = 4
+
+# Champs du jeu qui entrent dans son vecteur
+VECTOR_FIELDS = (
+    'id', 'owner_id', 'title', 'genre', 'ambiance', 'keywords',
+    'universe_description', 'story_act1', 'story_act2', 'story_act3',
+)
+
+ROW_DTYPE = np.dtype([('game_id', '<i8'), ('owner_id', '<i8')])
+VECTOR_DTYPE = np.dtype('<f2')
+
+# Index ouvert par le processus, rechargé lorsque les fichiers changent
+_index_lock = threading.Lock()
+_index = {'key': None, 'rows': None, 'vectors': None}
+
+# Lignes ajoutées par ce processus depuis la dernière vérification de compactage
+_appends_lock = threading.Lock()
+_appends = {'count': 0}
+
+
+def _paths():
+    # La dimension fait partie du nom: en changer repart d'un index vide
+    dimensions = settings.SIMILARITY_DIMENSIONS
+    directory = settings.SIMILARITY_INDEX_DIR
+    return (
+        os.path.join(directory, f"rows-{dimensions}.bin"),
+        os.path.join(directory, f"vectors-{dimensions}.bin"),
+        os.path.join(directory, '.lock'),
+    )
+
+@contextmanager
+def _locked(lock_path, exclusive):
+    os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+    with open(lock_path, 'a+b') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            yield
+            return
+
+        # msvcrt.locking abandonne après une dizaine de secondes: on réessaie
+        lock_file.seek(0)
+        while True:
+            try:
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+                break
+            except OSError:
+                time.sleep(0.1)
+        try:
+            yield
+        finally:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+def _feature_slot(feature, dimensions):
+    # Hachage stable entre processus (contrairement à hash())
+    digest = int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest(), 'little')
+    return digest % dimensions, (1.0 if digest >> 63 else -1.0)
+
+def game_vector(game):
+    """
+    Vecteur normalisé d'un jeu: termes de ses textes hachés dans un nombre fixe
+    de dimensions (fréquences amorties par un logarithme), plus son genre et
+    son ambiance. Ne dépend d'aucun autre jeu, ce qui permet de l'ajouter à
+    l'index sans recalculer les autres.
+    """
+    dimensions = settings.SIMILARITY_DIMENSIONS
+    fields = {
+        'title': game.title,
+        'keywords': game.keywords,
+        'universe_description': game.universe_description,
+        'story': ' '.join([game.story_act1, game.story_act2, game.story_act3]),
+    }
+
+    features = Counter()
+    for field, text in fields.items():
+        for term, count in Counter(tokenize(text)).items():
+            features[term] += FIELD_WEIGHTS[field] * (1 + math.log(count))
+    features[f"genre={game.genre}"] += CATEGORY_WEIGHT
+    features[f"ambiance={game.ambiance}"] += CATEGORY_WEIGHT
+
+    vector = np.zeros(dimensions, dtype=np.float32)
+    for feature, weight in features.items():
+        slot, sign = _feature_slot(feature, dimensions)
+        vector[slot] += sign * weight
+
+    norm = np.linalg.norm(vector)
+    if norm > 0:
+        vector /= norm
+    return vector
+
+def _append(entries):
+    """
+    Ajoute des lignes (game_id, owner_id, vecteur) en fin d'index. Une ligne
+    plus récente remplace les précédentes du même jeu ; un vecteur nul marque
+    un jeu supprimé.
+    """
+    rows_path, vectors_path, lock_path = _paths()
+    rows = np.array([(game_id, owner_id) for game_id, owner_id, vector in entries], dtype=ROW_DTYPE)
+    vectors = np.array([vector for game_id, owner_id, vector in entries], dtype=VECTOR_DTYPE)
+
+    with _locked(lock_path, exclusive=True):
+        # Vecteurs d'abord: une ligne n'est visible qu'une fois son vecteur écrit
+        with open(vectors_path, 'ab') as f:
+            f.write(vectors.tobytes())
+        with open(rows_path, 'ab') as f:
+            f.write(rows.tobytes())
+
+    # Les lignes remplacées s'accumulent: l'index est compacté de temps en temps
+    with _appends_lock:
+        _appends['count'] += len(entries)
+        should_check = _appends['count'] >= settings.SIMILARITY_COMPACT_INTERVAL
+        if should_check:
+            _appends['count'] = 0
+    if should_check:
+        compact_index()
+
+def _release_index():
+    # Sous Windows, un fichier projeté en mémoire ne peut pas être remplacé
+    with _index_lock:
+        _index.update(key=None, rows=None, vectors=None)
+
+def _latest_vector(game_id):
+    rows, vectors = _load()
+    if rows is None:
+        return None
+    positions = np.flatnonzero(rows['game_id'] == game_id)
+    return vectors[positions[-1]] if len(positions) else None
+
+def index_game(game):
+    if not settings.SIMILARITY_ENABLED:
+        return
+    try:
+        vector = game_vector(game)
+        # Une sauvegarde qui ne change pas le vecteur (dernière ligne identique) n'ajoute rien
+        latest = _latest_vector(game.id)
+        if latest is not None and np.array_equal(latest, vector.astype(VECTOR_DTYPE)):
+            return
+        _append([(game.id, game.owner_id, vector)])
+    except OSError as e:
+        print(f"Error while indexing game {game.id} for similarity: {e}")
+
+def index_game_by_id(game_id):
+    game = Game.objects.filter(id=game_id).only(*VECTOR_FIELDS).first()
+    if game is not None:
+        index_game(game)
+
+def remove_game(game_id, owner_id):
+    if not settings.SIMILARITY_ENABLED:
+        return
+    try:
+        _append([(game_id, owner_id, np.zeros(settings.SIMILARITY_DIMENSIONS, dtype=np.float32))])
+    except OSError as e:
+        print(f"Error while removing game {game_id} from similarity index: {e}")
+
+def rebuild_index(games, batch_size=1000):
+    """
+    Réécrit l'index à partir des jeux donnés, sans les lignes remplacées ni
+    les jeux supprimés. Le verrou exclusif est gardé pendant toute la
+    reconstruction: les ajouts concurrents attendent au lieu d'être perdus au
+    remplacement des fichiers. Retourne le nombre de jeux indexés.
+    """
+    rows_path, vectors_path, lock_path = _paths()
+    tmp_rows_path, tmp_vectors_path = rows_path + '.tmp', vectors_path + '.tmp'
+
+    indexed = 0
+    with _locked(lock_path, exclusive=True):
+        with open(tmp_rows_path, 'wb') as rows_file, open(tmp_vectors_path, 'wb') as vectors_file:
+            batch = []
+            for game in games.only(*VECTOR_FIELDS).iterator(chunk_size=batch_size):
+                batch.append(game)
+                if len(batch) == batch_size:
+                    indexed += _write_batch(batch, rows_file, vectors_file)
+                    batch = []
+            indexed += _write_batch(batch, rows_file, vectors_file)
+
+        _release_index()
+        os.replace(tmp_vectors_path, vectors_path)
+        os.replace(tmp_rows_path, rows_path)
+    return indexed
+
+def compact_index():
+    """
+    Réécrit l'index sans les lignes remplacées ni les jeux supprimés, à partir
+    des fichiers eux-mêmes (sans relire la base), si elles dépassent
+    SIMILARITY_COMPACT_RATIO fois le nombre de jeux indexés. Retourne le
+    nombre de lignes supprimées.
+    """
+    rows_path, vectors_path, lock_path = _paths()
+    dimensions = settings.SIMILARITY_DIMENSIONS
+    try:
+        with _locked(lock_path, exclusive=True):
+            if not os.path.exists(rows_path):
+                return 0
+            rows = np.fromfile(rows_path, dtype=ROW_DTYPE)
+            vectors = np.fromfile(vectors_path, dtype=VECTOR_DTYPE)
+            count = min(len(rows), len(vectors) // dimensions)
+            rows, vectors = rows[:count], vectors[:count * dimensions].reshape(count, dimensions)
+
+            # Dernière ligne de chaque jeu, sauf les marques de suppression (vecteur nul)
+            game_ids, first = np.unique(rows['game_id'][::-1], return_index=True)
+            if count <= len(game_ids) * settings.SIMILARITY_COMPACT_RATIO:
+                return 0
+            latest = np.sort(count - 1 - first)
+            latest = latest[np.any(vectors[latest] != 0, axis=1)]
+
+            tmp_rows_path, tmp_vectors_path = rows_path + '.tmp', vectors_path + '.tmp'
+            rows[latest].tofile(tmp_rows_path)
+            vectors[latest].tofile(tmp_vectors_path)
+            _release_index()
+            os.replace(tmp_vectors_path, vectors_path)
+            os.replace(tmp_rows_path, rows_path)
+            return count - len(latest)
+    except OSError as e:
+        # Fichiers encore projetés en mémoire par un autre processus (Windows): nouvel essai plus tard
+        print(f"Error while compacting similarity index: {e}")
+        return 0
+
+def _write_batch(games, rows_file, vectors_file):
+    if not games:
+        return 0
+    rows = np.array([(game.id, game.owner_id) for game in games], dtype=ROW_DTYPE)
+    vectors = np.array([game_vector(game) for game in games], dtype=VECTOR_DTYPE)
+    vectors_file.write(vectors.tobytes())
+    rows_file.write(rows.tobytes())
+    return len(games)
+
+def _load():
+    """
+    Retourne (lignes, vecteurs) projetés en mémoire, rechargés seulement si les
+    fichiers ont été remplacés ou allongés depuis le dernier appel
+    """
+    rows_path, vectors_path, lock_path = _paths()
+    dimensions = settings.SIMILARITY_DIMENSIONS
+    if not os.path.exists(rows_path):
+        return None, None
+
+    with _locked(lock_path, exclusive=False):
+        rows_stat, vectors_stat = os.stat(rows_path), os.stat(vectors_path)
+        key = (dimensions, rows_stat.st_ino, rows_stat.st_size, vectors_stat.st_ino, vectors_stat.st_size)
+        with _index_lock:
+            if _index['key'] != key:
+                count = min(
+                    rows_stat.st_size // ROW_DTYPE.itemsize,
+                    vectors_stat.st_size // (VECTOR_DTYPE.itemsize * dimensions),
+                )
+                if count:
+                    _index['rows'] = np.memmap(rows_path, dtype=ROW_DTYPE, mode='r', shape=(count,))
+                    _index['vectors'] = np.memmap(vectors_path, dtype=VECTOR_DTYPE, mode='r', shape=(count, dimensions))
+                else:
+                    _index['rows'], _index['vectors'] = None, None
+                _index['key'] = key
+            return _index['rows'], _index['vectors']
+
+def similar_game_ids(game, limit=None):
+    """
+    Identifiants des jeux du même utilisateur les plus proches de ce jeu,
+    du plus au moins similaire, avec leur score (cosinus)
+    """
+    limit = settings.SIMILARITY_RESULTS if limit is None else limit
+    rows, vectors = _load()
+    if rows is None:
+        return []
+
+    # Dernière ligne de chaque jeu de l'utilisateur
+    positions = np.flatnonzero(rows['owner_id'] == game.owner_id)[::-1]
+    game_ids, first = np.unique(rows['game_id'][positions], return_index=True)
+    positions = positions[first]
+    if not len(positions):
+        return []
+
+    candidates = vectors[positions].astype(np.float32)
+    own = np.flatnonzero(game_ids == game.id)
+    query = candidates[own[0]] if len(own) else game_vector(game)
+
+    scores = candidates @ query
+    scores[game_ids == game.id] = 0
+    keep = min(limit, len(scores))
+    top = np.argpartition(-scores, keep - 1)[:keep]
+    top = top[np.argsort(-scores[top])]
+    return [
+        (int(game_ids[i]), float(scores[i]))
+        for i in top
+        if scores[i] >= settings.SIMILARITY_MIN_SCORE
+    ]
+
+def similar_games(game, limit=None):
+    """
+    Jeux similaires à afficher sur la fiche d'un jeu (champs des cartes seulement)
+    """
+    if not settings.SIMILARITY_ENABLED:
+        return []
+    try:
+        ranked = similar_game_ids(game, limit)
+    except (OSError, ValueError) as e:
+        print(f"Error while reading similarity index: {e}")
+        return []
+
+    # Les jeux supprimés sans passer par le signal sont ignorés
+    games = Game.objects.only(*Game.CARD_FIELDS).in_bulk([game_id for game_id, score in ranked])
+    return [games[game_id] for game_id, score in ranked if game_id in games]
@@ -0,0 +1,60 @@
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils.text import slugify
+
+from .models import Keyword
+
+
+def parse_keywords(text):
+    """
+    Découpe la chaîne de mots-clés d'un jeu en [(slug, nom)], sans doublons
+    """
+    parsed = {}
+    for name in (text or '').split(','):
+        name = ' '.join(name.split())[:100]
+        slug = slugify(name)[:100]
+        if slug and slug not in parsed:
+            parsed[slug] = name
+    return list(parsed.items())
+
+def get_or_create_keywords(parsed):
+    """
+    Retourne {slug: Keyword} pour les mots-clés analysés, en créant les manquants
+    """
+    keywords = Keyword.objects.in_bulk([slug for slug, name in parsed], field_name='slug')
+    for slug, name in parsed:
+        if slug in keywords:
+            continue
+        try:
+            with transaction.atomic():
+                keywords[slug] = Keyword.objects.create(name=name, slug=slug)
+        except IntegrityError:
+            # Créé en parallèle par une autre requête
+            keywords[slug] = Keyword.objects.get(slug=slug)
+    return keywords
+
+def sync_game_tags(game):
+    """
+    Aligne les mots-clés normalisés d'un jeu sur sa chaîne keywords et met à
+    jour les compteurs d'utilisation des mots-clés ajoutés ou retirés
+    """
+    parsed = parse_keywords(game.keywords)
+    with transaction.atomic():
+        keywords = get_or_create_keywords(parsed)
+        wanted = {keyword.id for keyword in keywords.values()}
+        current = set(game.tags.values_list('id', flat=True))
+
+        added = wanted - current
+        removed = current - wanted
+        if added:
+            game.tags.add(*added)
+            Keyword.objects.filter(id__in=added).update(usage_count=F('usage_count') + 1)
+        if removed:
+            game.tags.remove(*removed)
+            Keyword.objects.filter(id__in=removed, usage_count__gt=0).update(usage_count=F('usage_count') - 1)
+
+def release_game_tags(game):
+    """
+    Décrémente les compteurs des mots-clés d'un jeu sur le point d'être supprimé
+    """
+    Keyword.objects.filter(games=game, usage_count__gt=0).update(usage_count=F('usage_count') - 1)
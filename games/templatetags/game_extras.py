@@ -1,4 +1,6 @@
 from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html
 
 register = template.Library()
 
@@ -16,4 +18,45 @@ def strip(value):
     Strips whitespace from a string
     Usage: {{ value|strip }}
     """
-    return value.strip()
\ No newline at end of file
+    return value.strip()
+
+
+@register.simple_tag
+def responsive_image(image, variants, alt='', sizes='100vw', css_class=''):
+    """
+    Renders a <picture> with WebP and JPEG srcset built from image_variants,
+    or a plain <img> when the image has no variants
+    Usage: {% responsive_image character.image character.image_variants alt=character.name sizes="50vw" %}
+    """
+    if not image:
+        return ''
+    if not variants or not variants.get('jpeg'):
+        return format_html('<img src="{}" class="{}" alt="{}" loading="lazy">', image.url, css_class, alt)
+
+    def srcset(paths):
+        return ', '.join(
+            f"{default_storage.url(path)} {width}w"
+            for width, path in sorted(paths.items(), key=lambda item: int(item[0]))
+        )
+
+    # Image de repli pour les navigateurs sans srcset: la plus grande n'excédant pas 640px
+    jpeg = variants['jpeg']
+    widths = sorted(int(width) for width in jpeg)
+    fallback = max([width for width in widths if width <= 640] or widths[:1])
+
+    webp_source = ''
+    if variants.get('webp'):
+        webp_source = format_html(
+            '<source type="image/webp" srcset="{}" sizes="{}">', srcset(variants['webp']), sizes
+        )
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}" class="{}" alt="{}" loading="lazy"></picture>',
+        webp_source,
+        default_storage.url(jpeg[str(fallback)]),
+        srcset(jpeg),
+        sizes,
+        variants.get('width', ''),
+        variants.get('height', ''),
+        css_class,
+        alt
+    )
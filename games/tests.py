@@ -1,3 +1,1293 @@
-from django.test import TestCase
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import Future
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import httpx
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from openai import RateLimitError
+from PIL import Image
+
+from . import (blob_storage, bulk_export, content_cache, generation,
+               http_client, image_cache, image_variants, jobs, llm, narrative,
+               pdf_export, rate_limit, scheduler, search, similarity, views)
+from .generation import (fallback_game_content, save_image_chunks,
+                         stream_game_creation)
+from .json_stream import ConceptStreamParser
+from .models import (Character, ContentCacheVariant, Favorite, Game,
+                     GenerationJob, ImageCacheEntry, Keyword, Location,
+                     NarrativeChoice, NarrativeHistory, RateLimitBucket,
+                     SearchPosting, StoredBlob)
+from .pagination import encode_cursor, paginate_keyset
+
+
+class BlobStorageTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.staging_dir = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root, BLOB_STAGING_DIR=self.staging_dir)
+        self.settings_override.enable()
+        self.owner = User.objects.create(username='blob-owner')
+        self.game = Game.objects.create(owner=self.owner, title='Blob', genre='fantasy', ambiance='dark')
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+        shutil.rmtree(self.staging_dir, ignore_errors=True)
+
+    def exists(self, relative_path):
+        return os.path.exists(os.path.join(self.media_root, relative_path))
+
+    def create_references(self, character_path, location_path):
+        character = Character.objects.create(game=self.game, name='C', image=character_path)
+        location = Location.objects.create(game=self.game, name='L', image=location_path)
+        blob_storage.add_references([character_path, location_path])
+        return character, location
+
+    def test_same_content_in_two_subfolders_shares_one_file(self):
+        character_path = blob_storage.save_bytes(b'same image', 'characters', 'jpg')
+        location_path = blob_storage.save_bytes(b'same image', 'locations', 'jpg')
+
+        self.assertEqual(character_path, location_path)
+        self.assertEqual(StoredBlob.objects.count(), 1)
+        self.assertEqual(StoredBlob.objects.get().refcount, 0)
+
+    def test_refcount_follows_model_references(self):
+        path = blob_storage.save_bytes(b'shared', 'characters', 'jpg')
+        path = blob_storage.save_bytes(b'shared', 'locations', 'jpg')
+        character, location = self.create_references(path, path)
+        self.assertEqual(StoredBlob.objects.get(path=path).refcount, 2)
+
+        character.delete()
+        self.assertEqual(StoredBlob.objects.get(path=path).refcount, 1)
+        self.assertTrue(self.exists(path))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            location.delete()
+        self.assertFalse(StoredBlob.objects.filter(path=path).exists())
+        self.assertFalse(self.exists(path))
+
+    def test_game_delete_releases_every_file(self):
+        path = blob_storage.save_bytes(b'game image', 'characters', 'jpg')
+        self.create_references(path, path)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Game.objects.all().delete()
+
+        self.assertFalse(StoredBlob.objects.exists())
+        self.assertFalse(self.exists(path))
+
+    def test_release_removes_variants(self):
+        path = blob_storage.save_bytes(b'with variants', 'characters', 'jpg')
+        folder, filename = os.path.split(path)
+        variant = f"{folder}/variants/{os.path.splitext(filename)[0]}-320.webp"
+        os.makedirs(os.path.join(self.media_root, folder, 'variants'))
+        open(os.path.join(self.media_root, variant), 'wb').close()
+        blob_storage.add_references([path])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            blob_storage.release(path)
+
+        self.assertFalse(self.exists(variant))
+
+    def test_rolled_back_release_keeps_file(self):
+        path = blob_storage.save_bytes(b'kept', 'characters', 'jpg')
+        blob_storage.add_references([path])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                blob_storage.release(path)
+                raise RuntimeError
+
+        self.assertEqual(StoredBlob.objects.get(path=path).refcount, 1)
+        self.assertTrue(self.exists(path))
+
+    def test_store_after_release_restores_file(self):
+        path = blob_storage.save_bytes(b'again', 'characters', 'jpg')
+        blob_storage.add_references([path])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            blob_storage.release(path)
+            # Stocké à nouveau avant la suppression différée du fichier
+            again = blob_storage.save_bytes(b'again', 'characters', 'jpg')
+
+        self.assertEqual(again, path)
+        self.assertTrue(self.exists(path))
+        self.assertEqual(StoredBlob.objects.get(path=path).refcount, 0)
+
+    def test_unmanaged_path_is_left_alone(self):
+        self.assertFalse(blob_storage.release('characters/legacy.jpg'))
+
+    def test_collect_orphans_keeps_referenced_and_recent_files(self):
+        referenced = blob_storage.save_bytes(b'referenced', 'characters', 'jpg')
+        blob_storage.add_references([referenced])
+        recent = blob_storage.save_bytes(b'recent', 'characters', 'jpg')
+        orphan = blob_storage.save_bytes(b'orphan', 'characters', 'jpg')
+        StoredBlob.objects.filter(path__in=[referenced, orphan]).update(
+            last_stored_at=timezone.now() - timedelta(days=2)
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            removed = blob_storage.collect_orphans(grace=24 * 3600)
+
+        self.assertEqual(removed, 1)
+        self.assertFalse(self.exists(orphan))
+        self.assertTrue(self.exists(referenced))
+        self.assertTrue(self.exists(recent))
+
+
+@override_settings(IMAGE_CACHE_ENABLED=True)
+class ImageCacheTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.staging_dir = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root, BLOB_STAGING_DIR=self.staging_dir)
+        self.settings_override.enable()
+        self.owner = User.objects.create(username='cache-owner')
+        self.game = Game.objects.create(owner=self.owner, title='Cache', genre='fantasy', ambiance='dark')
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+        shutil.rmtree(self.staging_dir, ignore_errors=True)
+
+    def test_entry_references_stored_file_without_copy(self):
+        path = blob_storage.save_bytes(b'cached image', 'characters', 'jpg')
+        image_cache.put('a castle', path)
+
+        self.assertEqual(image_cache.get_path('a castle'), path)
+        self.assertEqual(StoredBlob.objects.get(path=path).refcount, 1)
+        self.assertEqual(len(os.listdir(self.media_root)), 1)
+
+    def test_eviction_keeps_file_used_by_a_character(self):
+        path = blob_storage.save_bytes(b'used image', 'characters', 'jpg')
+        image_cache.put('a knight', path)
+        Character.objects.create(game=self.game, name='Knight', image=path)
+        blob_storage.add_references([path])
+
+        image_cache.prune(max_bytes=0)
+
+        self.assertFalse(ImageCacheEntry.objects.exists())
+        self.assertEqual(StoredBlob.objects.get(path=path).refcount, 1)
+        self.assertTrue(os.path.exists(os.path.join(self.media_root, path)))
+
+    def test_eviction_removes_unused_file(self):
+        path = blob_storage.save_bytes(b'unused image', 'characters', 'jpg')
+        image_cache.put('a dragon', path)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            image_cache.clear()
+
+        self.assertFalse(StoredBlob.objects.filter(path=path).exists())
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, path)))
+
+    def test_missing_file_is_a_miss(self):
+        path = blob_storage.save_bytes(b'gone', 'characters', 'jpg')
+        image_cache.put('a ghost', path)
+        os.remove(os.path.join(self.media_root, path))
+
+        self.assertIsNone(image_cache.get_path('a ghost'))
+        self.assertFalse(ImageCacheEntry.objects.exists())
+
+
+class SaveImageTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.staging_dir = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root, BLOB_STAGING_DIR=self.staging_dir)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+        shutil.rmtree(self.staging_dir, ignore_errors=True)
+
+    def image_bytes(self, image_format):
+        buffer = io.BytesIO()
+        Image.new('RGB', (8, 8), 'red').save(buffer, image_format)
+        return buffer.getvalue()
+
+    def test_extension_follows_detected_format(self):
+        for image_format, extension in (('PNG', 'png'), ('WEBP', 'webp'), ('JPEG', 'jpg')):
+            path = save_image_chunks([self.image_bytes(image_format)], 'character_Hero', 'characters')
+            self.assertTrue(path.endswith(f".{extension}"), path)
+
+    def test_non_image_is_rejected(self):
+        self.assertIsNone(save_image_chunks([b'<html>quota exceeded</html>'], 'character_Hero', 'characters'))
+
+    def test_files_are_staged_outside_media_root(self):
+        staged = []
+        real_mkstemp = tempfile.mkstemp
+
+        def mkstemp(**kwargs):
+            staged.append(kwargs['dir'])
+            return real_mkstemp(**kwargs)
+
+        with mock.patch.object(blob_storage.tempfile, 'mkstemp', side_effect=mkstemp):
+            save_image_chunks([self.image_bytes('PNG')], 'character_Hero', 'characters')
+            save_image_chunks([b'<html>quota exceeded</html>'], 'character_Hero', 'characters')
+
+        self.assertEqual(staged, [self.staging_dir, self.staging_dir])
+        self.assertEqual(os.listdir(self.staging_dir), [])
+        self.assertEqual(os.listdir(self.media_root), ['characters'])
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, 'characters', 'tmp')))
+
+    @override_settings(IMAGE_VARIANT_WIDTHS=[4, 8])
+    def test_existing_variants_are_not_rewritten(self):
+        path = save_image_chunks([self.image_bytes('PNG')], 'character_Hero', 'characters')
+        variants = image_variants.build_variants(path)
+
+        with mock.patch.object(image_variants, '_write_variant') as write_variant:
+            self.assertEqual(image_variants.build_variants(path), variants)
+
+        write_variant.assert_not_called()
+        self.assertEqual(sorted(variants['webp']), ['4', '8'])
+        self.assertEqual(os.listdir(self.staging_dir), [])
+
+
+@override_settings(SIMILARITY_ENABLED=True, SIMILARITY_DIMENSIONS=64, SIMILARITY_COMPACT_INTERVAL=1000)
+class SimilarityIndexTests(TestCase):
+    def setUp(self):
+        self.index_dir = tempfile.mkdtemp()
+        self.settings_override = override_settings(SIMILARITY_INDEX_DIR=self.index_dir)
+        self.settings_override.enable()
+        self.owner = User.objects.create(username='similarity-owner')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.game = Game.objects.create(owner=self.owner, title='Dragon keep', genre='fantasy', ambiance='dark')
+            self.other = Game.objects.create(owner=self.owner, title='Dragon cave', genre='fantasy', ambiance='dark')
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.index_dir, ignore_errors=True)
+
+    def row_count(self):
+        rows, vectors = similarity._load()
+        return 0 if rows is None else len(rows)
+
+    def test_unchanged_save_does_not_append(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.game.save()
+
+        self.assertEqual(self.row_count(), 2)
+
+    def test_compaction_keeps_latest_rows_only(self):
+        for title in ('Dragon tower', 'Dragon lair', 'Dragon hoard'):
+            self.game.title = title
+            with self.captureOnCommitCallbacks(execute=True):
+                self.game.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.other.delete()
+
+        removed = similarity.compact_index()
+
+        rows, vectors = similarity._load()
+        self.assertEqual(removed, 5)
+        self.assertEqual(list(rows['game_id']), [self.game.id])
+        self.assertTrue(vectors[0].any())
+
+    def test_rebuild_indexes_every_game(self):
+        self.assertEqual(similarity.rebuild_index(Game.objects.all()), 2)
+        self.assertEqual(self.row_count(), 2)
+
+
+@override_settings(
+    RATE_LIMIT_ENABLED=True,
+    RATE_LIMITS={'test': {'requests_per_minute': 2, 'tokens_per_minute': 100}},
+)
+class RateLimitTests(TestCase):
+    def call(self, provider='test', tokens=0, max_wait=0):
+        with rate_limit.scheduled_call(provider, tokens=tokens, max_wait=max_wait):
+            pass
+
+    def test_calls_beyond_quota_are_rejected(self):
+        self.call()
+        self.call()
+
+        with self.assertRaises(rate_limit.RateLimitExceeded):
+            self.call()
+        self.assertEqual(rate_limit.get_stats()['providers']['test']['rejected_calls'], 1)
+
+    def test_token_quota_and_settlement(self):
+        self.call(tokens=80)
+        with self.assertRaises(rate_limit.RateLimitExceeded):
+            self.call(tokens=80)
+
+        # L'appel n'a consommé que 10 des 80 tokens réservés
+        rate_limit.settle_tokens('test', 80, 10)
+
+        self.call(tokens=80)
+
+    def test_rate_limited_response_empties_bucket(self):
+        self.call()
+
+        rate_limit.report_rate_limited('test')
+
+        with self.assertRaises(rate_limit.RateLimitExceeded):
+            self.call()
+
+    @override_settings(AI_SCHEDULER_ENABLED=True)
+    def test_throttled_call_gives_back_its_slot(self):
+        fair_scheduler = scheduler.FairScheduler(capacity=1, user_caps={}, user_weights={})
+        self.call(max_wait=None)
+        self.call(max_wait=None)
+        running_while_waiting = []
+
+        def wait_for_quota(seconds):
+            running_while_waiting.append(fair_scheduler.get_stats()['running'])
+            RateLimitBucket.objects.update(available_requests=2)
+
+        with mock.patch.object(scheduler, 'get_scheduler', return_value=fair_scheduler), \
+                mock.patch.object(rate_limit.time, 'sleep', side_effect=wait_for_quota):
+            with rate_limit.scheduled_call('test', work=scheduler.Work(1, scheduler.BULK)):
+                self.assertEqual(fair_scheduler.get_stats()['running'], 1)
+
+        self.assertEqual(running_while_waiting, [0])
+        self.assertEqual(rate_limit.get_stats()['providers']['test']['throttled_calls'], 1)
+
+    def test_unknown_provider_is_not_limited(self):
+        for _ in range(5):
+            self.call('other')
+        self.assertNotIn('other', rate_limit.get_stats()['providers'])
+
+
+class FairSchedulerTests(TestCase):
+    def wait_for_queued(self, fair_scheduler, count):
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            stats = fair_scheduler.get_stats()['classes']
+            if sum(class_stats['queued'] for class_stats in stats.values()) == count:
+                return
+            time.sleep(0.01)
+        self.fail("Les appels ne sont pas arrivés en file")
+
+    def run_queued(self, fair_scheduler, works):
+        """
+        Occupe l'unique place, met les travaux en file dans l'ordre donné puis
+        libère la place: retourne l'ordre dans lequel ils ont été servis
+        """
+        holder = scheduler.Work(None, scheduler.BULK)
+        fair_scheduler.acquire(holder)
+        served = []
+        served_lock = threading.Lock()
+
+        def call(work):
+            fair_scheduler.acquire(work, timeout=5)
+            with served_lock:
+                served.append(work)
+            fair_scheduler.release(work)
+
+        threads = []
+        for position, work in enumerate(works, start=1):
+            thread = threading.Thread(target=call, args=(work,))
+            thread.start()
+            threads.append(thread)
+            self.wait_for_queued(fair_scheduler, position)
+        fair_scheduler.release(holder)
+        for thread in threads:
+            thread.join()
+        return served
+
+    def test_interactive_calls_go_first(self):
+        fair_scheduler = scheduler.FairScheduler(capacity=1, user_caps={}, user_weights={})
+        image = scheduler.Work(1, scheduler.IMAGE)
+        bulk = scheduler.Work(2, scheduler.BULK)
+        interactive = scheduler.Work(3, scheduler.INTERACTIVE)
+
+        served = self.run_queued(fair_scheduler, [image, bulk, interactive])
+
+        self.assertEqual(served, [interactive, bulk, image])
+
+    def test_users_take_turns_within_a_class(self):
+        fair_scheduler = scheduler.FairScheduler(capacity=1, user_caps={}, user_weights={})
+        first = scheduler.Work(1, scheduler.BULK)
+        second = scheduler.Work(2, scheduler.BULK)
+
+        served = self.run_queued(fair_scheduler, [first, first, first, second])
+
+        self.assertEqual(served[:2], [first, second])
+
+    def test_user_cap_lets_other_users_through(self):
+        fair_scheduler = scheduler.FairScheduler(capacity=2, user_caps={scheduler.BULK: 1}, user_weights={})
+        busy = scheduler.Work(1, scheduler.BULK)
+        fair_scheduler.acquire(busy)
+
+        with self.assertRaises(scheduler.QueueTimeout):
+            fair_scheduler.acquire(busy, timeout=0.05)
+        fair_scheduler.acquire(scheduler.Work(2, scheduler.BULK), timeout=0.05)
+
+        stats = fair_scheduler.get_stats()['classes'][scheduler.BULK]
+        self.assertEqual((stats['running'], stats['timeouts']), (2, 1))
+
+
+@override_settings(
+    RATE_LIMIT_ENABLED=True,
+    RATE_LIMITS={
+        'huggingface': {'requests_per_minute': 1000, 'tokens_per_minute': 0},
+        'github_models': {'requests_per_minute': 1000, 'tokens_per_minute': 0},
+    },
+    AI_SCHEDULER_ENABLED=False,
+    HTTP_MAX_RETRIES=2,
+    LLM_MAX_RETRIES=2,
+)
+class ProviderRetryTests(TestCase):
+    def rate_limit_error(self):
+        response = httpx.Response(429, request=httpx.Request('POST', 'https://models.test/chat'))
+        return RateLimitError('quota', response=response, body=None)
+
+    def http_response(self, status_code):
+        return mock.Mock(status_code=status_code, headers={})
+
+    def test_http_retries_go_through_the_limiter(self):
+        session = mock.Mock()
+        session.request.side_effect = [self.http_response(503), self.http_response(200)]
+
+        with mock.patch.object(http_client, 'get_session', return_value=session), \
+                mock.patch.object(rate_limit, '_try_take', return_value=0) as take, \
+                mock.patch.object(http_client.time, 'sleep'):
+            response = http_client.post('https://api-inference.huggingface.co/models/test')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(take.call_count, 2)
+
+    def test_http_transport_does_not_retry_limited_hosts(self):
+        adapter = http_client.get_session().get_adapter('https://api-inference.huggingface.co/models/test')
+        self.assertFalse(adapter.max_retries.status_forcelist)
+        self.assertFalse(adapter.max_retries.respect_retry_after_header)
+
+    def test_llm_retries_go_through_the_limiter(self):
+        client = mock.Mock()
+        client.chat.completions.create.side_effect = [
+            self.rate_limit_error(),
+            mock.Mock(usage=None, choices=[mock.Mock(message=mock.Mock(content='ok'))]),
+        ]
+
+        with mock.patch.object(llm, 'get_client', return_value=client), \
+                mock.patch.object(rate_limit, '_try_take', return_value=0) as take:
+            result = llm.chat_completion([{'role': 'user', 'content': 'hi'}], max_tokens=10)
+
+        self.assertEqual(result, 'ok')
+        self.assertEqual(take.call_count, 2)
+
+    def test_llm_persistent_429_raises_rate_limit_exceeded(self):
+        client = mock.Mock()
+        client.chat.completions.create.side_effect = self.rate_limit_error()
+
+        with mock.patch.object(llm, 'get_client', return_value=client), \
+                mock.patch.object(rate_limit, '_try_take', return_value=0):
+            with self.assertRaises(rate_limit.RateLimitExceeded):
+                llm.chat_completion([{'role': 'user', 'content': 'hi'}], max_tokens=10)
+        self.assertEqual(client.chat.completions.create.call_count, 3)
+
+    def test_game_creation_reports_exhausted_quota(self):
+        owner = User.objects.create(username='quota-owner')
+        params = {'genre': 'fantasy', 'ambiance': 'dark', 'keywords': 'dragon'}
+
+        with mock.patch.object(llm, 'get_client', return_value=mock.Mock()), \
+                mock.patch.object(llm, 'stream_chat_completion', side_effect=rate_limit.RateLimitExceeded('quota')):
+            events = [event for event, data in stream_game_creation(owner, params)]
+
+        self.assertEqual(events[-1], 'error')
+        self.assertFalse(Game.objects.exists())
+
+
+class ConceptStreamParserTests(SimpleTestCase):
+    document = (
+        '```json\n{"title": "L\'\u00e9p\u00e9e \\"Aube\\" \\ud83d\\udde1", '
+        '"universe_description": "Ligne 1\\nLigne 2 {pas un objet} [ni un tableau]", '
+        '"characters": [{"name": "Aria", "role": "Mage {rouge}"}, {"name": "Brann", "tags": ["a", "b"]}], '
+        '"locations": [{"name": "Tour"}]}\n```'
+    )
+
+    def parse(self, chunks):
+        parser = ConceptStreamParser(
+            text_fields=('title', 'universe_description'), entity_arrays=('characters', 'locations')
+        )
+        events = []
+        for chunk in chunks:
+            events.extend(parser.feed(chunk))
+        return parser, events
+
+    def test_split_chunks_give_same_result(self):
+        whole, whole_events = self.parse([self.document])
+        split, split_events = self.parse(list(self.document))
+
+        self.assertEqual(split.fields, whole.fields)
+        self.assertEqual(
+            [event for event in split_events if event.kind == 'entity'],
+            [event for event in whole_events if event.kind == 'entity'],
+        )
+        self.assertEqual(''.join(event.value for event in split_events if event.name == 'title'), whole.fields['title'])
+
+    def test_escapes_and_surrogate_pairs(self):
+        parser, events = self.parse([self.document])
+
+        self.assertEqual(parser.fields['title'], "L'\u00e9p\u00e9e \"Aube\" \U0001f5e1")
+        self.assertEqual(parser.fields['universe_description'], 'Ligne 1\nLigne 2 {pas un objet} [ni un tableau]')
+
+    def test_surrogate_pair_split_across_chunks(self):
+        parser, events = self.parse(['{"title": "\\ud83d', '\\ude00', '!"}'])
+
+        self.assertEqual(parser.fields['title'], '\U0001f600!')
+
+    def test_braces_inside_strings_do_not_break_entities(self):
+        parser, events = self.parse([self.document])
+
+        entities = [(event.name, event.index, event.value) for event in events if event.kind == 'entity']
+        self.assertEqual(entities, [
+            ('characters', 0, {'name': 'Aria', 'role': 'Mage {rouge}'}),
+            ('characters', 1, {'name': 'Brann', 'tags': ['a', 'b']}),
+            ('locations', 0, {'name': 'Tour'}),
+        ])
+
+    def test_truncated_input_keeps_completed_parts(self):
+        cut = self.document.index('{"name": "Brann"') + 10
+        parser, events = self.parse([self.document[:cut]])
+
+        self.assertEqual([event.value['name'] for event in events if event.kind == 'entity'], ['Aria'])
+        self.assertEqual(parser.fields['universe_description'], 'Ligne 1\nLigne 2 {pas un objet} [ni un tableau]')
+
+
+@override_settings(GAME_CONTENT_CACHE_ENABLED=True, GAME_CONTENT_CACHE_VARIANTS=2)
+class ContentCacheTests(TestCase):
+    def setUp(self):
+        self.request = content_cache.normalize_request('rpg', 'dark', 'Dragon, keep', '')
+
+    def test_pool_is_not_overfilled(self):
+        # Générations lancées alors que le pool était vide, terminées ensemble
+        for number in range(4):
+            content_cache.store_variant(self.request, {'title': f"Variant {number}"})
+
+        self.assertEqual(ContentCacheVariant.objects.count(), 2)
+        self.assertIn(content_cache.get_variant(self.request)['title'], ('Variant 0', 'Variant 1'))
+
+    def test_expired_variants_leave_room(self):
+        content_cache.store_variant(self.request, {'title': 'Old'})
+        content_cache.store_variant(self.request, {'title': 'Older'})
+        ContentCacheVariant.objects.update(created_at=timezone.now() - timedelta(days=365))
+
+        content_cache.store_variant(self.request, {'title': 'New'})
+
+        self.assertTrue(ContentCacheVariant.objects.filter(payload__title='New').exists())
+
+
+@override_settings(GENERATION_JOB_TIMEOUT=60, GENERATION_JOB_MAX_ATTEMPTS=3)
+class GenerationJobTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create(username='job-owner')
+        params = {'genre': 'rpg', 'ambiance': 'dark', 'keywords': 'dragon'}
+        self.job = jobs.enqueue_generation_job(self.owner, GenerationJob.KIND_CREATE, params)
+        patches = [
+            mock.patch.object(generation.content_cache, 'get_variant', return_value=fallback_game_content()),
+            mock.patch.object(
+                generation, 'generate_and_save_image',
+                side_effect=lambda prompt, filename, subfolder: (f"{subfolder}/{filename}.png", {})
+            ),
+            mock.patch.object(generation.pdf_export, 'schedule_pdf_prerender'),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def make_stale(self):
+        GenerationJob.objects.filter(id=self.job.id).update(heartbeat_at=timezone.now() - timedelta(minutes=5))
+
+    def assert_game_complete(self, game):
+        self.assertTrue(game.characters.exists())
+        self.assertTrue(game.locations.exists())
+        self.assertFalse(game.characters.filter(image='').exists())
+        self.assertFalse(game.locations.filter(image='').exists())
+        generation.pdf_export.schedule_pdf_prerender.assert_called_with(game)
+
+    def test_game_is_recorded_on_the_job(self):
+        game = jobs.run_job(jobs.claim_next_job())
+
+        self.job.refresh_from_db()
+        self.assertEqual((self.job.status, self.job.game_id), (GenerationJob.STATUS_DONE, game.id))
+        self.assertEqual(self.job.concept['title'], game.title)
+        self.assert_game_complete(game)
+
+    def test_new_game_is_indexed_once_with_its_characters(self):
+        with mock.patch.object(generation.search, 'index_game', wraps=search.index_game) as index_game:
+            with self.captureOnCommitCallbacks(execute=True):
+                game = jobs.run_job(jobs.claim_next_job())
+
+        index_game.assert_called_once()
+        character = game.characters.first()
+        self.assertTrue(SearchPosting.objects.filter(
+            document__game=game, term__in=search.tokenize(character.name)
+        ).exists())
+
+    def test_requeued_job_finishes_the_saved_game(self):
+        # Worker arrêté après l'enregistrement du jeu et de ses personnages et lieux
+        with mock.patch.object(generation.pdf_export, 'schedule_pdf_prerender', side_effect=SystemExit):
+            with self.assertRaises(SystemExit):
+                jobs.run_job(jobs.claim_next_job())
+        saved = Game.objects.get()
+        counts = (saved.characters.count(), saved.locations.count())
+        self.make_stale()
+        self.assertEqual(jobs.requeue_stale_jobs(), (1, 0))
+
+        game = jobs.run_job(jobs.claim_next_job())
+
+        self.assertEqual(Game.objects.get(), game)
+        self.assertEqual((game.characters.count(), game.locations.count()), counts)
+        self.assert_game_complete(game)
+        self.job.refresh_from_db()
+        self.assertEqual((self.job.status, self.job.game_id), (GenerationJob.STATUS_DONE, game.id))
+
+    def test_resume_creates_missing_assets(self):
+        game_data = fallback_game_content()
+        game = generation.save_game(self.owner, self.job.params, game_data)
+
+        generation.resume_game_creation(game, self.job.params, game_data)
+
+        self.assertEqual(game.characters.count(), len(game_data['characters']))
+        self.assert_game_complete(game)
+
+    def test_job_with_recent_progress_is_not_requeued(self):
+        job = jobs.claim_next_job()
+        GenerationJob.objects.filter(id=job.id).update(started_at=timezone.now() - timedelta(hours=1))
+        jobs.update_job_progress(job, 40, "Génération des images...")
+
+        self.assertEqual(jobs.requeue_stale_jobs(), (0, 0))
+        self.make_stale()
+        self.assertEqual(jobs.requeue_stale_jobs(), (1, 0))
+
+
+@override_settings(GENERATION_USE_WORKER=True, GENERATION_STREAM_INTERVAL=0.01)
+class CreationStreamTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create(username='stream-owner')
+        self.client.force_login(self.owner)
+        params = {'genre': 'rpg', 'ambiance': 'post_apocalyptic', 'keywords': 'dragon'}
+        self.job = jobs.enqueue_generation_job(self.owner, GenerationJob.KIND_CREATE, params)
+
+    def update_job(self, **fields):
+        GenerationJob.objects.filter(id=self.job.id).update(**fields)
+
+    def test_stream_view_enqueues_instead_of_generating(self):
+        form = {'genre': 'rpg', 'ambiance': 'post_apocalyptic', 'keywords': 'dragon'}
+        with mock.patch('games.views.create_game_from_params') as create, \
+                mock.patch('games.views.iter_job_events', return_value=iter([('error', {'message': 'stop'})])):
+            response = self.client.post(reverse('create_game_stream'), form)
+            body = b''.join(response.streaming_content).decode()
+
+        create.assert_not_called()
+        job = GenerationJob.objects.latest('id')
+        self.assertEqual((job.status, job.params['keywords']), (GenerationJob.STATUS_PENDING, 'dragon'))
+        self.assertIn('event: error', body)
+
+    def test_events_follow_the_job(self):
+        self.update_job(preview={'title': 'Drag'}, message='Génération du concept...', progress=5)
+        events = jobs.iter_job_events(self.job.id)
+
+        self.assertEqual(next(events), ('field', {'name': 'title', 'delta': 'Drag'}))
+        self.assertEqual(next(events), ('status', {'message': 'Génération du concept...', 'progress': 5}))
+
+        game = Game.objects.create(owner=self.owner, title='Dragon', genre='rpg', ambiance='post_apocalyptic')
+        self.update_job(preview={'title': 'Dragon'}, status=GenerationJob.STATUS_DONE, game=game)
+
+        self.assertEqual(next(events), ('field', {'name': 'title', 'delta': 'on'}))
+        self.assertEqual(list(events)[-1], ('done', {'game_id': game.id}))
+
+    def test_replaced_text_is_reset(self):
+        self.update_job(preview={'title': 'Long title'})
+        events = jobs.iter_job_events(self.job.id)
+        next(events)
+
+        self.update_job(preview={'title': 'New'}, status=GenerationJob.STATUS_FAILED, message='Erreur')
+
+        self.assertEqual([event for event, data in events], ['status', 'reset', 'field', 'status', 'error'])
+
+    def test_worker_writes_the_preview(self):
+        with mock.patch.object(generation.content_cache, 'get_variant', return_value=fallback_game_content()), \
+                mock.patch.object(generation, 'generate_and_save_image', return_value=(None, {})), \
+                mock.patch.object(generation.pdf_export, 'schedule_pdf_prerender'):
+            jobs.run_job(jobs.claim_next_job())
+
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.preview['title'], fallback_game_content()['title'])
+
+
+class KeywordTagTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create(username='tag-owner')
+        self.other = User.objects.create(username='tag-other')
+
+    def create_game(self, owner, keywords):
+        return Game.objects.create(owner=owner, title='Tagged', genre='rpg', ambiance='post_apocalyptic', keywords=keywords)
+
+    def usage(self):
+        return dict(Keyword.objects.values_list('slug', 'usage_count'))
+
+    def test_usage_count_follows_keywords(self):
+        game = self.create_game(self.owner, 'Magie, dragons,  magie ')
+        self.create_game(self.other, 'magie')
+        self.assertEqual(self.usage(), {'magie': 2, 'dragons': 1})
+
+        game.keywords = 'dragons, trahison'
+        game.save()
+        self.assertEqual(self.usage(), {'magie': 1, 'dragons': 1, 'trahison': 1})
+
+        game.delete()
+        self.assertEqual(self.usage(), {'magie': 1, 'dragons': 0, 'trahison': 0})
+
+    def test_unrelated_save_keeps_counts(self):
+        game = self.create_game(self.owner, 'magie')
+
+        game.title = 'Renamed'
+        game.save(update_fields=['title'])
+
+        self.assertEqual(self.usage(), {'magie': 1})
+
+    def test_tag_list_shows_own_tags_by_usage(self):
+        self.create_game(self.owner, 'rare, magie')
+        self.create_game(self.other, 'magie, secret')
+        self.client.force_login(self.owner)
+
+        response = self.client.get(reverse('tag_list'))
+
+        self.assertEqual(
+            [(tag.slug, tag.usage_count) for tag in response.context['tags']],
+            [('magie', 2), ('rare', 1)]
+        )
+
+    def test_tag_detail_lists_only_own_games(self):
+        game = self.create_game(self.owner, 'magie')
+        self.create_game(self.other, 'magie')
+        self.client.force_login(self.owner)
+
+        response = self.client.get(reverse('tag_detail', kwargs={'slug': 'magie'}))
+
+        self.assertEqual([item.id for item in response.context['games']], [game.id])
+
+
+@override_settings(SEARCH_BACKEND='postings')
+class SearchFallbackTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create(username='search-owner')
+        self.other = User.objects.create(username='search-other')
+
+    def create_game(self, owner, title, keywords=''):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Game.objects.create(owner=owner, title=title, genre='rpg', ambiance='post_apocalyptic', keywords=keywords)
+
+    def test_games_matching_every_term_come_first(self):
+        partial = self.create_game(self.owner, 'Dragons du nord')
+        full = self.create_game(self.owner, 'Vallée', keywords='dragons, nécromancie')
+        self.create_game(self.owner, 'Sans rapport')
+
+        games, has_next = search.search_games(self.owner, 'Dragons Necromancie')
+
+        self.assertEqual([game.id for game in games], [full.id, partial.id])
+        self.assertFalse(has_next)
+
+    def test_only_own_games_are_found(self):
+        game = self.create_game(self.owner, 'Dragons')
+        self.create_game(self.other, 'Dragons')
+
+        games, _ = search.search_games(self.owner, 'dragons')
+
+        self.assertEqual([item.id for item in games], [game.id])
+
+    def test_pages_follow_the_ranking(self):
+        created = [self.create_game(self.owner, f'Dragons {index}') for index in range(3)]
+
+        first, has_next = search.search_games(self.owner, 'dragons', offset=0, limit=2)
+        last, has_more = search.search_games(self.owner, 'dragons', offset=2, limit=2)
+
+        self.assertEqual(len(first), 2)
+        self.assertTrue(has_next)
+        self.assertEqual(len(last), 1)
+        self.assertFalse(has_more)
+        self.assertCountEqual([game.id for game in first + last], [game.id for game in created])
+
+    def test_stopwords_only_query_returns_nothing(self):
+        self.create_game(self.owner, 'Le jeu')
+
+        self.assertEqual(search.search_games(self.owner, 'le de la'), ([], False))
+
+
+@override_settings(PDF_CACHE_ENABLED=True, PDF_PRERENDER_ENABLED=False)
+class PdfExportTests(TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.settings_override = override_settings(PDF_CACHE_DIR=self.cache_dir)
+        self.settings_override.enable()
+        self.owner = User.objects.create(username='pdf-owner')
+        self.game = Game.objects.create(owner=self.owner, title='Export', genre='rpg', ambiance='dark')
+        self.client.force_login(self.owner)
+        self.url = reverse('export_game_pdf', kwargs={'game_id': self.game.id})
+        self.render_patch = mock.patch.object(pdf_export, 'render_game_pdf', return_value=b'%PDF-1.4 test')
+        self.render = self.render_patch.start()
+        self.addCleanup(self.render_patch.stop)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def download(self, **headers):
+        response = self.client.get(self.url, headers=headers)
+        if response.status_code == 200:
+            b''.join(response.streaming_content)
+            response.close()
+        return response
+
+    def test_validators_answer_not_modified_without_rendering(self):
+        first = self.download()
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first['ETag'], f'"{pdf_export.pdf_fingerprint(self.game)}"')
+        self.assertIn('Last-Modified', first)
+
+        by_etag = self.download(if_none_match=first['ETag'])
+        by_date = self.download(if_modified_since=first['Last-Modified'])
+
+        self.assertEqual((by_etag.status_code, by_date.status_code), (304, 304))
+        self.render.assert_called_once()
+
+    def test_edited_game_gets_a_new_etag(self):
+        first = self.download()
+        self.game.title = 'Renamed'
+        self.game.save()
+
+        second = self.download(if_none_match=first['ETag'])
+
+        self.assertEqual(second.status_code, 200)
+        self.assertNotEqual(second['ETag'], first['ETag'])
+        cached = os.listdir(os.path.join(self.cache_dir, str(self.game.id)))
+        self.assertEqual(cached, [f"{pdf_export.pdf_fingerprint(self.game)}.pdf"])
+
+    def test_stale_render_keeps_the_current_pdf(self):
+        current = pdf_export.pdf_fingerprint(self.game)
+        current_path = pdf_export._store_pdf(self.game, current, b'current')
+
+        self.assertIsNone(pdf_export._store_pdf(self.game, 'stale', b'stale'))
+        self.assertTrue(os.path.exists(current_path))
+        self.assertEqual(os.listdir(os.path.dirname(current_path)), [f"{current}.pdf"])
+
+    def test_pdf_date_is_the_content_date(self):
+        Game.objects.filter(id=self.game.id).update(updated_at=timezone.now() - timedelta(days=400))
+        self.game.refresh_from_db()
+        self.render_patch.stop()
+
+        with mock.patch.object(pdf_export, 'html_to_pdf', return_value=False) as html_to_pdf:
+            pdf_export.render_game_pdf(self.game)
+
+        self.assertIn(timezone.localtime(self.game.updated_at).strftime("%d/%m/%Y"), html_to_pdf.call_args.args[0])
+
+
+@override_settings(GAMES_PAGE_SIZE=2)
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create(username='page-owner')
+        self.client.force_login(self.owner)
+        # Trois jeux créés au même instant (départagés par id), un plus ancien
+        same_time = timezone.now()
+        self.games = [
+            Game.objects.create(owner=self.owner, title=f'Game {index}', genre='rpg', ambiance='dark')
+            for index in range(4)
+        ]
+        Game.objects.filter(id__in=[game.id for game in self.games[1:]]).update(created_at=same_time)
+        Game.objects.filter(id=self.games[0].id).update(created_at=same_time - timedelta(days=1))
+
+    def walk(self, queryset, page_size):
+        pages, cursor = [], None
+        while True:
+            page = paginate_keyset(queryset, cursor, page_size)
+            pages.append([item.id for item in page.items])
+            cursor = page.next_cursor
+            if cursor is None:
+                return pages
+
+    def test_ties_on_created_at_are_split_by_id(self):
+        ids = [game.id for game in self.games]
+
+        self.assertEqual(
+            self.walk(Game.objects.all(), 2),
+            [[ids[3], ids[2]], [ids[1], ids[0]]]
+        )
+
+    def test_full_last_page_has_no_next_cursor(self):
+        self.assertEqual(len(self.walk(Game.objects.all(), 4)), 1)
+        self.assertEqual([len(page) for page in self.walk(Game.objects.all(), 3)], [3, 1])
+
+    def test_invalid_cursor_starts_over(self):
+        for cursor in ('not-a-cursor', encode_cursor(timezone.now(), 1)[:-4], ''):
+            page = paginate_keyset(Game.objects.all(), cursor, 2)
+            self.assertTrue(page.is_first)
+            self.assertEqual(page.items[0].id, self.games[3].id)
+
+    def test_dashboard_flags_favorites_on_every_page(self):
+        Favorite.objects.create(user=self.owner, game=self.games[0])
+
+        first = self.client.get(reverse('dashboard'))
+        second = self.client.get(reverse('dashboard'), {'cursor': first.context['page'].next_cursor})
+
+        flags = {game.id: game.is_favorited for game in list(first.context['games']) + list(second.context['games'])}
+        self.assertEqual(flags, {game.id: game == self.games[0] for game in self.games})
+        self.assertIsNone(second.context['page'].next_cursor)
+
+    def test_favorites_page_queries_do_not_grow_with_favorites(self):
+        for game in self.games:
+            Favorite.objects.create(user=self.owner, game=game)
+        self.client.get(reverse('favorites'))
+
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('favorites'))
+
+        self.assertEqual([game.id for game in response.context['games']], [self.games[3].id, self.games[2].id])
+
+
+def create_narrative_game(owner):
+    game = Game.objects.create(
+        owner=owner, title='Saga', genre='rpg', ambiance='dark', has_dynamic_narrative=True,
+        universe_description='Un monde', story_act1='Acte un', story_act2='Acte deux', story_act3='Acte trois'
+    )
+    choice = NarrativeChoice.objects.create(game=game, act=1, choice_text='Partir', outcome_description='Le voyage')
+    return game, choice
+
+
+NEXT_CHOICES = [{'choice_text': f'Choix {index}', 'outcome_description': 'Suite'} for index in range(3)]
+
+
+@override_settings(NARRATIVE_PREFETCH_ENABLED=True, NARRATIVE_COMBINED_STEP=False, NARRATIVE_PREFETCH_TIMEOUT=120)
+class NarrativePrefetchTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create(username='narrative-owner')
+        self.client.force_login(self.owner)
+        self.game, self.choice = create_narrative_game(self.owner)
+        patches = [
+            mock.patch('games.views.update_game_story_with_choice'),
+            # Le thread de préchargement ferme sa connexion: pas dans une transaction de test
+            mock.patch.object(narrative, 'connection'),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def select_choice(self, run_prefetch=True):
+        def submit(func, *args):
+            if run_prefetch:
+                func(*args)
+            return mock.Mock()
+
+        with mock.patch.object(narrative._prefetch_executor, 'submit', side_effect=submit) as submitted, \
+                self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('select_choice', kwargs={'game_id': self.game.id, 'choice_id': self.choice.id}))
+        self.game.refresh_from_db()
+        return submitted
+
+    def test_next_act_choices_are_ready_when_the_page_renders(self):
+        with mock.patch.object(narrative, 'generate_narrative_choices', return_value=NEXT_CHOICES):
+            self.select_choice()
+
+        response = self.client.get(reverse('narrative_choices', kwargs={'game_id': self.game.id}))
+
+        self.assertEqual(self.game.current_act, 2)
+        self.assertEqual([choice.choice_text for choice in response.context['current_choices']],
+                         ['Choix 0', 'Choix 1', 'Choix 2'])
+        self.assertTrue(response.context['choices_prefetched'])
+        self.assertFalse(response.context['choices_pending'])
+
+    def test_page_reports_pending_prefetch(self):
+        self.select_choice(run_prefetch=False)
+
+        response = self.client.get(reverse('narrative_choices', kwargs={'game_id': self.game.id}))
+
+        self.assertEqual(self.game.choices_prefetch_status, Game.PREFETCH_PENDING)
+        self.assertTrue(response.context['choices_pending'])
+
+    def test_stale_prefetch_writes_nothing(self):
+        self.select_choice(run_prefetch=False)
+        revision = self.game.narrative_revision
+        narrative.invalidate_choices_prefetch(self.game)
+
+        with mock.patch.object(narrative, 'generate_narrative_choices', return_value=NEXT_CHOICES) as generate:
+            narrative.prefetch_narrative_choices(self.game.id, 2, revision)
+
+        generate.assert_not_called()
+        self.assertFalse(NarrativeChoice.objects.filter(game=self.game, act=2).exists())
+
+    def test_failed_prefetch_is_reported(self):
+        with mock.patch.object(narrative, 'generate_narrative_choices', return_value=None):
+            self.select_choice()
+
+        self.assertEqual(self.game.choices_prefetch_status, Game.PREFETCH_FAILED)
+        self.assertFalse(narrative.is_prefetch_pending(self.game))
+
+    def test_abandoned_prefetch_stops_being_pending(self):
+        self.select_choice(run_prefetch=False)
+        self.assertTrue(narrative.is_prefetch_pending(self.game))
+
+        self.game.choices_prefetch_started_at -= timedelta(seconds=121)
+
+        self.assertFalse(narrative.is_prefetch_pending(self.game))
+
+
+@override_settings(NARRATIVE_COMBINED_STEP=True, NARRATIVE_PREFETCH_ENABLED=True)
+class NarrativeStepTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create(username='step-owner')
+        self.client.force_login(self.owner)
+        self.game, self.choice = create_narrative_game(self.owner)
+        patches = [
+            mock.patch.object(narrative.llm, 'get_client', return_value=mock.Mock()),
+            mock.patch('games.views.update_game_story_with_choice'),
+            mock.patch('games.views.schedule_choices_prefetch'),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def select_choice(self, reply):
+        with mock.patch.object(narrative.llm, 'chat_completion', side_effect=reply) as chat_completion:
+            self.client.post(reverse('select_choice', kwargs={'game_id': self.game.id, 'choice_id': self.choice.id}))
+        self.game.refresh_from_db()
+        return chat_completion
+
+    def test_one_call_rewrites_the_act_and_saves_next_choices(self):
+        reply = json.dumps({'story': 'Acte un réécrit', 'next_choices': NEXT_CHOICES})
+
+        chat_completion = self.select_choice(lambda **kwargs: f"Voici le résultat:\n{reply}")
+
+        chat_completion.assert_called_once()
+        self.assertEqual(self.game.story_act1, 'Acte un réécrit')
+        self.assertEqual(self.game.choices_prefetch_status, Game.PREFETCH_READY)
+        self.assertEqual(NarrativeChoice.objects.filter(game=self.game, act=2).count(), 3)
+        self.assertFalse(NarrativeChoice.objects.filter(game=self.game, act=1).exists())
+        views.update_game_story_with_choice.assert_not_called()
+        views.schedule_choices_prefetch.assert_not_called()
+
+    def test_incomplete_reply_falls_back_to_separate_calls(self):
+        self.select_choice(lambda **kwargs: json.dumps({'story': 'Acte un réécrit', 'next_choices': []}))
+
+        self.assertEqual(self.game.story_act1, 'Acte un')
+        self.assertFalse(NarrativeChoice.objects.filter(game=self.game, act=2).exists())
+        views.update_game_story_with_choice.assert_called_once()
+        views.schedule_choices_prefetch.assert_called_once()
+
+    def test_step_overtaken_by_another_choice_writes_nothing(self):
+        def reply(**kwargs):
+            # Un autre choix est validé pendant l'appel
+            narrative.invalidate_choices_prefetch(self.game)
+            return json.dumps({'story': 'Acte un réécrit', 'next_choices': NEXT_CHOICES})
+
+        self.select_choice(reply)
+
+        self.assertEqual(self.game.story_act1, 'Acte un')
+        self.assertFalse(NarrativeChoice.objects.filter(game=self.game, act=2).exists())
+        views.update_game_story_with_choice.assert_not_called()
+
+    def test_parse_rejects_choices_without_text(self):
+        self.assertIsNone(narrative.parse_narrative_step('{"story": "Suite", "next_choices": [{"outcome_description": "x"}]}'))
+        self.assertIsNone(narrative.parse_narrative_step('pas de JSON'))
+        self.assertEqual(
+            narrative.parse_narrative_step(json.dumps({'story': ' Suite ', 'next_choices': NEXT_CHOICES})),
+            ('Suite', NEXT_CHOICES)
+        )
+
+
+class InlineExecutor:
+    """
+    Remplace le pool de processus de l'export groupé: rendu immédiat dans le test
+    """
+
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, func, *args):
+        self.submitted.append(args)
+        future = Future()
+        future.set_result(func(*args))
+        return future
+
+
+class BulkExportTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create(username='export-owner')
+        self.other = User.objects.create(username='export-other')
+        self.client.force_login(self.owner)
+        self.games = [
+            Game.objects.create(owner=self.owner, title=f'Jeu {index}', genre='rpg', ambiance='dark', keywords='magie')
+            for index in range(3)
+        ]
+        Character.objects.create(game=self.games[0], name='Aldric', role='Mage')
+        self.executor = InlineExecutor()
+        self.cached_pdf = tempfile.NamedTemporaryFile(suffix='.pdf', delete=False)
+        self.cached_pdf.write(b'%PDF-1.4 cached' * 10000)
+        self.cached_pdf.close()
+        self.addCleanup(os.remove, self.cached_pdf.name)
+        patches = [
+            mock.patch.object(bulk_export, '_get_executor', return_value=self.executor),
+            mock.patch.object(bulk_export, '_render_pdf', side_effect=self.render_pdf),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def render_pdf(self, game_id):
+        # Premier jeu: PDF en cache (chemin), deuxième: en mémoire, troisième: échec
+        return {self.games[0].id: self.cached_pdf.name, self.games[1].id: b'%PDF-1.4 memory'}.get(game_id)
+
+    def download(self, **params):
+        response = self.client.get(reverse('export_games_zip'), params)
+        return response, zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+
+    def test_archive_holds_one_pdf_and_one_json_per_game(self):
+        Game.objects.create(owner=self.other, title='Autre', genre='rpg', ambiance='dark')
+
+        response, archive = self.download()
+
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        first, second, third = (f"{game.id}-jeu-{index}" for index, game in enumerate(self.games))
+        self.assertEqual(sorted(archive.namelist()), sorted([
+            f"{first}.json", f"{first}.pdf", f"{second}.json", f"{second}.pdf", f"{third}.json"
+        ]))
+        self.assertEqual(archive.read(f"{first}.pdf"), b'%PDF-1.4 cached' * 10000)
+        self.assertEqual(archive.read(f"{second}.pdf"), b'%PDF-1.4 memory')
+        data = json.loads(archive.read(f"{first}.json"))
+        self.assertEqual((data['title'], data['keywords']), ('Jeu 0', ['magie']))
+        self.assertEqual(data['characters'][0]['name'], 'Aldric')
+
+    def test_selected_ids_are_limited_to_own_games(self):
+        other = Game.objects.create(owner=self.other, title='Autre', genre='rpg', ambiance='dark')
+
+        _, archive = self.download(ids=f"{self.games[1].id},{other.id}")
+
+        self.assertEqual(archive.namelist(), [f"{self.games[1].id}-jeu-1.json", f"{self.games[1].id}-jeu-1.pdf"])
+        self.assertEqual(self.executor.submitted, [(self.games[1].id,)])
+
+    def test_invalid_or_empty_selection(self):
+        self.assertEqual(self.client.get(reverse('export_games_zip'), {'ids': '1,abc'}).status_code, 400)
+        Game.objects.filter(owner=self.owner).delete()
+        self.assertRedirects(self.client.get(reverse('export_games_zip')), reverse('dashboard'))
+
+    def test_renders_are_bounded_ahead_of_the_archive(self):
+        for index in range(10):
+            Game.objects.create(owner=self.owner, title=f'Plus {index}', genre='rpg', ambiance='dark')
+        game_ids = list(Game.objects.filter(owner=self.owner).order_by('id').values_list('id', flat=True))
+
+        chunks = bulk_export.iter_games_zip(game_ids, workers=2)
+        next(chunks)
+
+        # workers * 2 rendus lancés d'avance, plus celui qui remplace le jeu en cours d'écriture
+        self.assertEqual(len(self.executor.submitted), 5)
+        list(chunks)
+        self.assertEqual(len(self.executor.submitted), len(game_ids))
+
+
+@override_settings(AI_SCHEDULER_ENABLED=False)
+class ImageFanOutTests(TestCase):
+    def test_images_are_generated_concurrently(self):
+        # Deux images qui s'attendent l'une l'autre: bloquant si elles étaient générées en série
+        barrier = threading.Barrier(2, timeout=5)
+
+        def generate(prompt, filename, subfolder):
+            barrier.wait()
+            return f"{subfolder}/{filename}.png", {}
+
+        fan_out = generation.ImageFanOut(max_workers=2)
+        self.addCleanup(fan_out.shutdown)
+        with mock.patch.object(generation, 'generate_and_save_image', side_effect=generate):
+            fan_out.submit('a', 'prompt a', 'a', 'characters')
+            fan_out.submit('b', 'prompt b', 'b', 'locations')
+            results = fan_out.collect(['a', 'b'])
+
+        self.assertEqual(results, {'a': ('characters/a.png', {}), 'b': ('locations/b.png', {})})
+
+    def test_key_is_generated_once_and_failures_are_reported(self):
+        calls = []
+
+        def generate(prompt, filename, subfolder):
+            calls.append(filename)
+            if filename == 'broken':
+                raise OSError('network down')
+            return f"{subfolder}/{filename}.png", {}
+
+        progress = []
+        fan_out = generation.ImageFanOut(max_workers=2)
+        self.addCleanup(fan_out.shutdown)
+        with mock.patch.object(generation, 'generate_and_save_image', side_effect=generate):
+            fan_out.submit('hero', 'prompt', 'hero', 'characters')
+            fan_out.submit('hero', 'prompt', 'hero', 'characters')
+            fan_out.submit('broken', 'prompt', 'broken', 'locations')
+            results = fan_out.collect(['hero', 'broken'], on_progress=lambda done, total: progress.append((done, total)))
+
+        self.assertEqual(sorted(calls), ['broken', 'hero'])
+        self.assertEqual(results['broken'], (None, {}))
+        self.assertEqual(progress, [(1, 2), (2, 2)])
+
+    def test_assets_keep_the_images_that_succeeded(self):
+        owner = User.objects.create(username='fan-out-owner')
+        game = Game.objects.create(owner=owner, title='Fan out', genre='rpg', ambiance='dark')
+        game_data = {
+            'characters': [{'name': 'Aldric'}, {'name': 'Brune'}],
+            'locations': [{'name': 'Tour'}],
+        }
+
+        def generate(prompt, filename, subfolder):
+            return (None, {}) if filename == 'character_Brune' else (f"{subfolder}/{filename}.png", {})
+
+        with mock.patch.object(generation, 'generate_and_save_image', side_effect=generate):
+            generation.create_game_assets(game, game_data)
+
+        self.assertEqual(
+            dict(game.characters.values_list('name', 'image')),
+            {'Aldric': 'characters/character_Aldric.png', 'Brune': ''}
+        )
+        self.assertEqual(game.locations.get().image.name, 'locations/location_Tour.png')
+
+
+@override_settings(LLM_BASE_URL='https://models.test', LLM_MODEL='test-model', LLM_MAX_CONNECTIONS=3)
+class LlmClientTests(TestCase):
+    def setUp(self):
+        self.addCleanup(setattr, llm, '_client', None)
+        llm._client = None
+
+    def test_one_client_is_shared_by_every_thread(self):
+        clients = []
+        with mock.patch.dict(os.environ, {'GITHUB_TOKEN': 'token'}):
+            threads = [threading.Thread(target=lambda: clients.append(llm.get_client())) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            clients.append(llm.get_client())
+
+        self.assertEqual(len({id(client) for client in clients}), 1)
+        self.assertEqual(str(clients[0].base_url).rstrip('/'), 'https://models.test')
+        self.assertEqual(clients[0].max_retries, 0)
+
+    def test_missing_token_means_no_client(self):
+        with mock.patch.dict(os.environ, {'GITHUB_TOKEN': ''}):
+            self.assertIsNone(llm.get_client())
+            with self.assertRaises(RuntimeError):
+                llm.chat_completion([{'role': 'user', 'content': 'hi'}], max_tokens=10)
+
+    def test_call_sites_use_the_shared_client_and_model(self):
+        client = mock.Mock()
+        client.chat.completions.create.return_value = mock.Mock(
+            usage=None, choices=[mock.Mock(message=mock.Mock(content='[]'))]
+        )
+        game, _ = create_narrative_game(User.objects.create(username='llm-owner'))
+        calls_before = llm.get_stats()['calls']
+
+        with mock.patch.object(llm, 'get_client', return_value=client):
+            narrative.generate_narrative_choices(game, 1, NarrativeHistory.objects.none())
+            narrative.update_game_story_with_choice(game, NarrativeChoice.objects.get(game=game))
+
+        self.assertEqual(client.chat.completions.create.call_count, 2)
+        for call in client.chat.completions.create.call_args_list:
+            self.assertEqual(call.kwargs['model'], 'test-model')
+        self.assertEqual(llm.get_stats()['calls'], calls_before + 2)
@@ -5,13 +5,21 @@ from . import views
 urlpatterns = [
     path('', views.home, name='home'),
     path('dashboard/', views.dashboard, name='dashboard'),
+    path('search/', views.search, name='search'),
+    path('tags/', views.tag_list, name='tag_list'),
+    path('tags/<slug:slug>/', views.tag_detail, name='tag_detail'),
     path('create/', views.create_game, name='create_game'),
+    path('create/stream/', views.create_game_stream, name='create_game_stream'),
     path('random/', views.random_game, name='random_game'),
+    path('jobs/<int:job_id>/', views.generation_job, name='generation_job'),
+    path('jobs/<int:job_id>/status/', views.generation_job_status, name='generation_job_status'),
     path('game/<int:game_id>/', views.game_detail, name='game_detail'),
     path('game/<int:game_id>/favorite/', views.toggle_favorite, name='toggle_favorite'),
     path('game/<int:game_id>/export-pdf/', views.export_game_pdf, name='export_game_pdf'),
+    path('export/zip/', views.export_games_zip, name='export_games_zip'),
     path('favorites/', views.favorites, name='favorites'),
     path('game/<int:game_id>/narrative-choices/', views.narrative_choices, name='narrative_choices'),
     path('game/<int:game_id>/generate-choices/', views.generate_choices, name='generate_choices'),
     path('game/<int:game_id>/select-choice/<int:choice_id>/', views.select_choice, name='select_choice'),
+    path('ops/ai-scheduler/', views.ai_scheduler_status, name='ai_scheduler_status'),
 ]
\ No newline at end of file
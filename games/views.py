@@ -1,23 +1,41 @@
 import json
 import os
-from datetime import datetime
-from io import BytesIO
 
-import openai
-import requests
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.contrib import messages
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
-from django.contrib.staticfiles import finders
-from django.http import HttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.http import (FileResponse, HttpResponse, JsonResponse,
+                         StreamingHttpResponse)
 from django.shortcuts import get_object_or_404, redirect, render
-from django.template.loader import get_template
-from openai import OpenAI
-from xhtml2pdf import pisa
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
 
+from . import rate_limit
+from .bulk_export import iter_games_zip
 from .forms import GameCreationForm
-from .models import (Character, Favorite, Game, Location, NarrativeChoice,
-                     NarrativeHistory)
+from .generation import create_game_from_params
+from .jobs import enqueue_generation_job, iter_job_events
+from .models import (Character, Favorite, Game, GenerationJob, Keyword,
+                     Location, NarrativeChoice, NarrativeHistory)
+from .narrative import (ACT_NAMES, apply_narrative_step,
+                        generate_narrative_choices, get_current_act,
+                        invalidate_choices_prefetch, is_prefetch_pending,
+                        record_narrative_step, save_narrative_choices,
+                        schedule_choices_prefetch,
+                        update_game_story_with_choice)
+from .pagination import paginate_keyset
+from .pdf_export import get_or_render_pdf, pdf_fingerprint
+from .scheduler import INTERACTIVE, scheduled_view
+from .scheduler import get_stats as get_scheduler_stats
+from .search import search_games
+from .similarity import similar_games
 
 
 def home(request):
@@ -25,14 +43,15 @@ def home(request):
 
 @login_required
 def dashboard(request):
-    games = Game.objects.filter(owner=request.user)
-    # Get games this user has favorited
-    favorites = Favorite.objects.filter(user=request.user)
-    favorited_games = [favorite.game for favorite in favorites]
+    # L'état favori est calculé dans la même requête SQL que la liste des jeux
+    games = Game.objects.filter(owner=request.user).only(*Game.CARD_FIELDS).prefetch_related('tags').annotate(
+        is_favorited=Exists(Favorite.objects.filter(user=request.user, game=OuterRef('pk')))
+    )
+    page = paginate_keyset(games, request.GET.get('cursor'), settings.GAMES_PAGE_SIZE)
     
     return render(request, 'games/dashboard.html', {
-        'games': games,
-        'favorited_games': favorited_games
+        'games': page.items,
+        'page': page
     })
 
 @login_required
@@ -40,68 +59,18 @@ def create_game(request):
     if request.method == 'POST':
         form = GameCreationForm(request.POST)
         if form.is_valid():
-            # Créer le jeu sans sauvegarder
-            game = form.save(commit=False)
-            game.owner = request.user
-            
             # Récupérer les informations du formulaire
-            genre = form.cleaned_data['genre']
-            ambiance = form.cleaned_data['ambiance']
-            keywords = form.cleaned_data['keywords']
-            references = form.cleaned_data.get('references', '')
-            has_dynamic_narrative = form.cleaned_data.get('has_dynamic_narrative', False)
+            params = get_creation_params(form)
             
-            # Génération du contenu avec l'API OpenAI (ChatGPT)
-            game_data = generate_game_content(genre, ambiance, keywords, references)
+            # Génération en arrière-plan par le worker
+            if settings.GENERATION_USE_WORKER:
+                job = enqueue_generation_job(request.user, GenerationJob.KIND_CREATE, params)
+                return redirect('generation_job', job_id=job.id)
             
-            if game_data:
-                # Mise à jour des champs du jeu
-                game.title = game_data.get('title', 'Untitled Game')
-                game.universe_description = game_data.get('universe_description', '')
-                game.story_act1 = game_data.get('story_act1', '')
-                game.story_act2 = game_data.get('story_act2', '')
-                game.story_act3 = game_data.get('story_act3', '')
-                game.has_dynamic_narrative = has_dynamic_narrative
-                game.save()
-                
-                # Création des personnages et génération de leurs images
-                characters = game_data.get('characters', [])
-                for char_data in characters:
-                    character = Character(
-                        game=game,
-                        name=char_data.get('name', 'Unknown Character'),
-                        role=char_data.get('role', 'Unknown Role'),
-                        background=char_data.get('background', ''),
-                        abilities=char_data.get('abilities', '')
-                    )
-                    
-                    # Générer une image pour le personnage avec Stable Diffusion
-                    character_prompt = f"Portrait of {character.name}, a {character.role} from a {game.genre_name} game with {game.ambiance_name} ambiance."
-                    image_data = generate_image(character_prompt)
-                    if image_data:
-                        # Télécharger et sauvegarder l'image
-                        character.image = download_and_save_image(image_data, f"character_{character.name}.jpg", "characters")
-                    
-                    character.save()
-                
-                # Création des lieux et génération de leurs images
-                locations = game_data.get('locations', [])
-                for loc_data in locations:
-                    location = Location(
-                        game=game,
-                        name=loc_data.get('name', 'Unknown Location'),
-                        description=loc_data.get('description', '')
-                    )
-                    
-                    # Générer une image pour le lieu avec Stable Diffusion
-                    location_prompt = f"{location.name} from a {game.genre_name} game with {game.ambiance_name} ambiance, {game.title}."
-                    image_data = generate_image(location_prompt)
-                    if image_data:
-                        # Télécharger et sauvegarder l'image
-                        location.image = download_and_save_image(image_data, f"location_{location.name}.jpg", "locations")
-                    
-                    location.save()
-                
+            # Génération du contenu avec l'API OpenAI (ChatGPT) puis des images
+            game = create_game_from_params(request.user, params)
+            
+            if game:
                 messages.success(request, "Votre concept de jeu a été généré avec succès!")
                 return redirect('game_detail', game_id=game.id)
             else:
@@ -109,7 +78,116 @@ def create_game(request):
     else:
         form = GameCreationForm()
     
-    return render(request, 'games/create_game.html', {'form': form})
+    return render(request, 'games/create_game.html', {
+        'form': form,
+        # Le flux relaie une tâche du worker: pas de streaming sans worker
+        'streaming_enabled': settings.GENERATION_STREAMING_ENABLED and settings.GENERATION_USE_WORKER
+    })
+
+def get_creation_params(form):
+    return {
+        'genre': form.cleaned_data['genre'],
+        'ambiance': form.cleaned_data['ambiance'],
+        'keywords': form.cleaned_data['keywords'],
+        'references': form.cleaned_data.get('references', ''),
+        'has_dynamic_narrative': form.cleaned_data.get('has_dynamic_narrative', False),
+    }
+
+@login_required
+def create_game_stream(request):
+    """
+    Met la génération d'un concept en file puis relaie l'avancement de la
+    tâche en streaming (server-sent events): le titre, l'univers et les actes
+    sont envoyés au navigateur au fur et à mesure que le worker les génère
+    """
+    if request.method != 'POST':
+        return redirect('create_game')
+    if not settings.GENERATION_USE_WORKER:
+        # Le formulaire est alors soumis normalement (génération pendant la requête)
+        return HttpResponse("Génération en arrière-plan désactivée.", status=404)
+    
+    form = GameCreationForm(request.POST)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors}, status=400)
+    
+    job = enqueue_generation_job(request.user, GenerationJob.KIND_CREATE, get_creation_params(form))
+    
+    def event_stream():
+        for event, data in iter_job_events(job.id):
+            if event == 'done':
+                data['redirect_url'] = reverse('game_detail', kwargs={'game_id': data['game_id']})
+            yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+    
+    response = StreamingHttpResponse(
+        streaming_content_for(request, event_stream()),
+        content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+def streaming_content_for(request, iterator):
+    """
+    Sous ASGI, Django met en mémoire tampon les itérateurs synchrones avant de
+    les envoyer: on les expose alors via un itérateur asynchrone pour que chaque
+    événement parte immédiatement. Sous WSGI l'itérateur est renvoyé tel quel.
+    """
+    if not isinstance(request, ASGIRequest):
+        return iterator
+    
+    async def async_iterator():
+        finished = object()
+        try:
+            while True:
+                chunk = await sync_to_async(next)(iterator, finished)
+                if chunk is finished:
+                    break
+                yield chunk
+        finally:
+            await sync_to_async(iterator.close)()
+    
+    return async_iterator()
+
+@login_required
+def search(request):
+    query = request.GET.get('q', '').strip()
+    try:
+        page_number = max(1, int(request.GET.get('page', 1)))
+    except ValueError:
+        page_number = 1
+    
+    games, has_next = [], False
+    if query:
+        page_size = settings.SEARCH_PAGE_SIZE
+        games, has_next = search_games(request.user, query, offset=(page_number - 1) * page_size, limit=page_size)
+    
+    return render(request, 'games/search.html', {
+        'query': query,
+        'games': games,
+        'page_number': page_number,
+        'has_next': has_next
+    })
+
+@login_required
+def tag_list(request):
+    # Mots-clés des jeux de l'utilisateur, classés par leur compteur d'utilisation
+    # (maintenu à l'écriture par games.tags: aucun comptage à l'affichage)
+    user_games = Game.tags.through.objects.filter(keyword=OuterRef('pk'), game__owner=request.user)
+    tags = Keyword.objects.filter(Exists(user_games)).order_by('-usage_count', 'name')
+    
+    return render(request, 'games/tag_list.html', {'tags': tags})
+
+@login_required
+def tag_detail(request, slug):
+    tag = get_object_or_404(Keyword, slug=slug)
+    games = Game.objects.filter(owner=request.user, tags=tag).only(*Game.CARD_FIELDS).prefetch_related('tags')
+    page = paginate_keyset(games, request.GET.get('cursor'), settings.GAMES_PAGE_SIZE)
+    
+    return render(request, 'games/tag_detail.html', {
+        'tag': tag,
+        'games': page.items,
+        'page': page
+    })
 
 @login_required
 def game_detail(request, game_id):
@@ -124,75 +202,65 @@ def game_detail(request, game_id):
         'game': game,
         'characters': characters,
         'locations': locations,
-        'is_favorited': is_favorited
+        'is_favorited': is_favorited,
+        'similar_games': similar_games(game),
     })
 
 @login_required
 def random_game(request):
     # Créer un jeu aléatoire avec des paramètres prédéfinis
-    genre = Game.GENRE_CHOICES[0][0]  # Premier genre comme défaut
-    ambiance = Game.AMBIANCE_CHOICES[0][0]  # Première ambiance comme défaut
-    keywords = "adventure, mystery, magic"
-    
-    game_data = generate_game_content(genre, ambiance, keywords, "")
-    
-    if game_data:
-        game = Game(
-            owner=request.user,
-            title=game_data.get('title', 'Random Game'),
-            genre=genre,
-            ambiance=ambiance,
-            keywords=keywords,
-            references="",
-            universe_description=game_data.get('universe_description', ''),
-            story_act1=game_data.get('story_act1', ''),
-            story_act2=game_data.get('story_act2', ''),
-            story_act3=game_data.get('story_act3', '')
-        )
-        game.save()
-        
-        # Création des personnages avec images générées
-        characters = game_data.get('characters', [])
-        for char_data in characters:
-            character = Character(
-                game=game,
-                name=char_data.get('name', 'Random Character'),
-                role=char_data.get('role', 'Unknown Role'),
-                background=char_data.get('background', ''),
-                abilities=char_data.get('abilities', '')
-            )
-            
-            # Générer une image pour le personnage
-            character_prompt = f"Portrait of {character.name}, a {character.role} from a {game.genre_name} game with {game.ambiance_name} ambiance."
-            image_data = generate_image(character_prompt)
-            if image_data:
-                character.image = download_and_save_image(image_data, f"character_{character.name}.jpg", "characters")
-            
-            character.save()
-        
-        # Création des lieux avec images générées
-        locations = game_data.get('locations', [])
-        for loc_data in locations:
-            location = Location(
-                game=game,
-                name=loc_data.get('name', 'Random Location'),
-                description=loc_data.get('description', '')
-            )
-            
-            # Générer une image pour le lieu
-            location_prompt = f"{location.name} from a {game.genre_name} game with {game.ambiance_name} ambiance, {game.title}."
-            image_data = generate_image(location_prompt)
-            if image_data:
-                location.image = download_and_save_image(image_data, f"location_{location.name}.jpg", "locations")
-            
-            location.save()
-        
+    params = {
+        'genre': Game.GENRE_CHOICES[0][0],  # Premier genre comme défaut
+        'ambiance': Game.AMBIANCE_CHOICES[0][0],  # Première ambiance comme défaut
+        'keywords': "adventure, mystery, magic",
+        'references': "",
+        'default_title': 'Random Game',
+        'default_character_name': 'Random Character',
+        'default_location_name': 'Random Location',
+    }
+    
+    if settings.GENERATION_USE_WORKER:
+        job = enqueue_generation_job(request.user, GenerationJob.KIND_RANDOM, params)
+        return redirect('generation_job', job_id=job.id)
+    
+    game = create_game_from_params(request.user, params)
+    
+    if game:
         messages.success(request, "Un jeu aléatoire a été généré avec succès!")
         return redirect('game_detail', game_id=game.id)
     else:
         messages.error(request, "Erreur lors de la génération du jeu aléatoire.")
         return redirect('dashboard')
 
+@login_required
+def generation_job(request, job_id):
+    job = get_object_or_404(GenerationJob, id=job_id, owner=request.user)
+    
+    if job.status == GenerationJob.STATUS_DONE and job.game_id:
+        messages.success(request, job.message)
+        return redirect('game_detail', game_id=job.game_id)
+    
+    return render(request, 'games/generation_job.html', {'job': job})
+
+@login_required
+def generation_job_status(request, job_id):
+    """
+    Endpoint JSON interrogé par la page de suivi d'une génération
+    """
+    job = get_object_or_404(GenerationJob, id=job_id, owner=request.user)
+    
+    data = {
+        'id': job.id,
+        'status': job.status,
+        'progress': job.progress,
+        'message': job.message,
+        'redirect_url': None,
+    }
+    if job.status == GenerationJob.STATUS_DONE and job.game_id:
+        data['redirect_url'] = reverse('game_detail', kwargs={'game_id': job.game_id})
+    
+    return JsonResponse(data)
+
 @login_required
 def toggle_favorite(request, game_id):
     game = get_object_or_404(Game, id=game_id)
@@ -220,275 +288,81 @@ def toggle_favorite(request, game_id):
 
 @login_required
 def favorites(request):
-    # Get all favorites for the current user
-    favorites = Favorite.objects.filter(user=request.user)
-    favorited_games = [favorite.game for favorite in favorites]
-    
-    return render(request, 'games/favorites.html', {'games': favorited_games})
-
-# Ajouter cette fonction pour aider xhtml2pdf à trouver les fichiers statiques
-def link_callback(uri, rel):
-    """
-    Convert HTML URIs to absolute system paths so xhtml2pdf can access those resources
-    """
-    # Utiliser Django's static finder pour trouver les fichiers
-    if uri.startswith(settings.STATIC_URL):
-        path = finders.find(uri.replace(settings.STATIC_URL, ""))
-        return path
-    
-    # Gérer les fichiers média
-    elif uri.startswith(settings.MEDIA_URL):
-        return os.path.join(settings.MEDIA_ROOT, uri.replace(settings.MEDIA_URL, ""))
-    
-    # Gérer les urls absolues
-    elif uri.startswith("http"):
-        return uri
-    
-    # Gestion par défaut
-    return uri
+    # Get the favorites for the current user, with their games in the same query
+    favorites = Favorite.objects.filter(user=request.user).select_related('game').only(
+        'id', 'created_at', 'game', *[f'game__{field}' for field in Game.CARD_FIELDS]
+    ).prefetch_related('game__tags')
+    page = paginate_keyset(favorites, request.GET.get('cursor'), settings.GAMES_PAGE_SIZE)
+    favorited_games = [favorite.game for favorite in page.items]
+    
+    return render(request, 'games/favorites.html', {'games': favorited_games, 'page': page})
 
 @login_required
 def export_game_pdf(request, game_id):
     """
-    Export a game as a styled PDF document using xhtml2pdf
+    Export a game as a styled PDF document using xhtml2pdf.
+    Le PDF est mis en cache sur disque et servi avec ETag/Last-Modified.
     """
     game = get_object_or_404(Game, id=game_id, owner=request.user)
-    characters = Character.objects.filter(game=game)
-    locations = Location.objects.filter(game=game)
-    
-    keywords = game.keywords.split(',') if game.keywords else []
-    keywords = [k.strip() for k in keywords]
-    
-    # Prepare the context for the template
-    context = {
-        'game': game,
-        'characters': characters,
-        'locations': locations,
-        'keywords': keywords,
-        'generation_date': datetime.now().strftime("%d/%m/%Y"),
-        'STATIC_URL': settings.STATIC_URL,
-        'base_url': request.build_absolute_uri('/').rstrip('/')
-    }
     
-    # Render the template
-    template = get_template('games/game_pdf.html')
-    html_string = template.render(context)
+    # L'empreinte change avec l'histoire, les personnages et les lieux
+    fingerprint = pdf_fingerprint(game)
+    etag = f'"{fingerprint}"'
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        return not_modified
     
-    # Create HTTP response with PDF
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="{game.title.replace(" ", "_")}_gameforge.pdf"'
-    
-    # Convert HTML to PDF and write to response
-    pdf_status = html_to_pdf(html_string, response, link_callback)
+    pdf, fingerprint = get_or_render_pdf(game, fingerprint)
+    if pdf is None:
+        return HttpResponse("Une erreur s'est produite lors de la génération du PDF.", status=500)
     
-    # Return the response
-    if pdf_status:
-        return response
+    filename = f'{game.title.replace(" ", "_")}_gameforge.pdf'
+    if isinstance(pdf, bytes):
+        # Cache désactivé: PDF généré en mémoire
+        response = HttpResponse(pdf, content_type='application/pdf')
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
     else:
-        return HttpResponse("Une erreur s'est produite lors de la génération du PDF.", status=500)
+        # La date de rendu du fichier en cache sert de Last-Modified
+        last_modified = int(os.path.getmtime(pdf))
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            return not_modified
+        response = FileResponse(open(pdf, 'rb'), as_attachment=True, filename=filename,
+                                content_type='application/pdf')
+        response['Last-Modified'] = http_date(last_modified)
+    
+    response['ETag'] = etag
+    # Le PDF est privé: le navigateur doit revalider avant de réutiliser sa copie
+    response['Cache-Control'] = 'private, no-cache'
+    return response
 
-def html_to_pdf(html_string, output, link_callback=None):
+@login_required
+def export_games_zip(request):
     """
-    Simple function to convert HTML to PDF using xhtml2pdf
+    Exporte les jeux de l'utilisateur (tous, ou ceux passés dans ?ids=1,2,3)
+    dans une archive ZIP envoyée au fil de sa construction
     """
-    # Convert external URLs in the HTML string to base64 for images
-    pisa_status = pisa.CreatePDF(
-        src=html_string,
-        dest=output,
-        encoding='utf-8',
-        link_callback=link_callback
-    )
+    games = Game.objects.filter(owner=request.user).order_by('created_at', 'id')
     
-    # Return True if PDF generation was successful
-    return pisa_status.err == 0
-
-def generate_game_content(genre, ambiance, keywords, references):
-    """
-    Fonction qui appelle l'API OpenAI (ChatGPT) pour générer le contenu du jeu
-    """
-    github_token = os.getenv('GITHUB_TOKEN')
+    selected = [value for value in request.GET.get('ids', '').split(',') if value.strip()]
+    if selected:
+        try:
+            games = games.filter(id__in=[int(value) for value in selected])
+        except ValueError:
+            return HttpResponse("Liste de jeux invalide.", status=400)
     
-    if not github_token:
-        print("Erreur: Token GitHub non trouvé dans les variables d'environnement")
-        return None
+    game_ids = list(games.values_list('id', flat=True))
+    if not game_ids:
+        messages.error(request, "Aucun jeu à exporter.")
+        return redirect('dashboard')
     
-    # Initialiser le client OpenAI avec la nouvelle configuration
-    client = OpenAI(
-        base_url="https://models.inference.ai.azure.com",
-        api_key=github_token,
+    response = StreamingHttpResponse(
+        streaming_content_for(request, iter_games_zip(game_ids)),
+        content_type='application/zip'
     )
-    
-    # Préparation du prompt pour l'API
-    prompt = f"""
-    Crée un concept de jeu vidéo original avec les paramètres suivants:
-    - Genre: {genre}
-    - Ambiance: {ambiance}
-    - Mots-clés: {keywords}
-    - Références (si spécifiées): {references}
-    
-    Renvoie uniquement un objet JSON avec le format suivant, sans explications ni guillemets supplémentaires:
-    {{
-      "title": "Titre du jeu",
-      "universe_description": "Description détaillée de l'univers du jeu",
-      "story_act1": "Description de l'acte 1 du scénario",
-      "story_act2": "Description de l'acte 2 du scénario avec retournement",
-      "story_act3": "Description de l'acte 3 et conclusion",
-      "characters": [
-        {{
-          "name": "Nom du personnage 1",
-          "role": "Rôle dans l'histoire",
-          "background": "Histoire et motivations",
-          "abilities": "Capacités et compétences"
-        }},
-        {{
-          "name": "Nom du personnage 2",
-          "role": "Rôle dans l'histoire",
-          "background": "Histoire et motivations",
-          "abilities": "Capacités et compétences"
-        }}
-      ],
-      "locations": [
-        {{
-          "name": "Nom du lieu 1",
-          "description": "Description immersive du lieu"
-        }},
-        {{
-          "name": "Nom du lieu 2",
-          "description": "Description immersive du lieu"
-        }}
-      ]
-    }}
-    """
-    
-    try:
-        # Appel à l'API OpenAI avec le nouveau format
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",  
-            messages=[
-                {"role": "system", "content": "Tu es un concepteur de jeux vidéo professionnel spécialisé dans la création de concepts originaux."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-            max_tokens=2000,
-            top_p=1
-        )
-        
-        # Extraction du contenu généré
-        result_text = response.choices[0].message.content
-        
-        # Trouver le début et la fin du JSON dans la réponse
-        json_start = result_text.find('{')
-        json_end = result_text.rfind('}') + 1
-        
-        if json_start >= 0 and json_end > json_start:
-            json_text = result_text[json_start:json_end]
-            try:
-                generated_data = json.loads(json_text)
-                return generated_data
-            except json.JSONDecodeError:
-                print("Erreur: La réponse de l'API n'est pas au format JSON valide")
-        else:
-            print("Erreur: Impossible de trouver du JSON dans la réponse")
-    
-    except Exception as e:
-        print(f"Erreur lors de l'appel à l'API OpenAI: {e}")
-    
-    # En cas d'erreur, fournir des données par défaut
-    return {
-        "title": "Nouveau Jeu",
-        "universe_description": "Un univers mystérieux à explorer.",
-        "story_act1": "Le début de l'aventure...",
-        "story_act2": "Le coeur de l'histoire...",
-        "story_act3": "La conclusion épique...",
-        "characters": [
-            {
-                "name": "Héros",
-                "role": "Protagoniste principal",
-                "background": "Origine inconnue",
-                "abilities": "Détermination et courage"
-            }
-        ],
-        "locations": [
-            {
-                "name": "Monde initial",
-                "description": "Le point de départ de l'aventure"
-            }
-        ]
-    }
-
-def generate_image(prompt):
-    """
-    Function that uses Hugging Face's Stable Diffusion API to generate an image
-    """
-    # Get Hugging Face API token from environment variables
-    hf_token = os.getenv('HUGGINGFACE_TOKEN')
-    
-    # Hugging Face API configuration
-    API_URL = "https://api-inference.huggingface.co/models/stabilityai/stable-diffusion-2"
-    headers = {"Authorization": f"Bearer {hf_token}"}
-    
-    try:
-        # Send request to Hugging Face API
-        response = requests.post(
-            API_URL,
-            headers=headers,
-            json={"inputs": prompt}
-        )
-        
-        # Check if the request was successful
-        if response.status_code == 200:
-            # Return binary image data
-            return response.content
-        else:
-            print(f"Error from Hugging Face API: Status {response.status_code}")
-            print(f"Response: {response.text}")
-            return None
-            
-    except Exception as e:
-        print(f"Error during image generation: {e}")
-        return None
-
-def download_and_save_image(image_data, filename, subfolder):
-    """
-    Saves image data (either URL or binary content) and saves it to the file system
-    Returns the relative path for the ImageField
-    """
-    try:
-        # Create media folder if it doesn't exist
-        media_path = os.path.join(settings.MEDIA_ROOT, subfolder)
-        if not os.path.exists(media_path):
-            os.makedirs(media_path, exist_ok=True)
-        
-        # Clean filename to avoid special character issues
-        import re
-        safe_filename = re.sub(r'[^\w\s.-]', '', filename)
-        safe_filename = re.sub(r'\s+', '_', safe_filename)
-        
-        # Full file path
-        file_path = os.path.join(media_path, safe_filename)
-        
-        # Check if image_data is a URL (string) or binary content (bytes)
-        if isinstance(image_data, str) and (image_data.startswith('http://') or image_data.startswith('https://')):
-            # Download from URL (old DALL-E method - for backward compatibility)
-            response = requests.get(image_data, stream=True)
-            if response.status_code != 200:
-                return None
-                
-            # Save the image from URL
-            with open(file_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
-        else:
-            # Save binary data directly (new Stable Diffusion method)
-            with open(file_path, 'wb') as f:
-                f.write(image_data)
-        
-        # Return the relative path for the model
-        return f"{subfolder}/{safe_filename}"
-        
-    except Exception as e:
-        print(f"Error during image save: {e}")
-        return None
+    filename = f"gameforge_export_{timezone.now().strftime('%Y%m%d')}.zip"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
 
 @login_required
 def narrative_choices(request, game_id):
@@ -498,31 +372,28 @@ def narrative_choices(request, game_id):
         messages.error(request, "Ce jeu n'utilise pas le système de narration dynamique.")
         return redirect('game_detail', game_id=game.id)
     
-    # Déterminer l'acte actuel en fonction de l'historique des choix
+    # L'acte actuel est stocké sur le jeu (pas de requête sur l'historique)
     narrative_history = NarrativeHistory.objects.filter(game=game)
-    
-    if narrative_history.count() == 0:
-        current_act = 1
-        current_act_name = "Introduction"
-    elif narrative_history.filter(act=1).exists() and not narrative_history.filter(act=2).exists():
-        current_act = 2
-        current_act_name = "Développement"
-    elif narrative_history.filter(act=2).exists():
-        current_act = 3
-        current_act_name = "Conclusion"
+    current_act = get_current_act(game)
     
     # Récupérer les choix narratifs disponibles pour l'acte actuel
     current_choices = NarrativeChoice.objects.filter(game=game, act=current_act)
     
+    # Les choix de l'acte peuvent être en cours de préchargement
+    choices_pending = not current_choices.exists() and is_prefetch_pending(game)
+    
     return render(request, 'games/narrative_choices.html', {
         'game': game,
         'current_act': current_act,
-        'current_act_name': current_act_name,
+        'current_act_name': ACT_NAMES[current_act],
         'current_choices': current_choices,
+        'choices_pending': choices_pending,
+        'choices_prefetched': game.choices_prefetch_status == Game.PREFETCH_READY,
         'narrative_history': narrative_history
     })
 
 @login_required
+@scheduled_view(INTERACTIVE)
 def generate_choices(request, game_id):
     if request.method != 'POST':
         return redirect('narrative_choices', game_id=game_id)
@@ -533,32 +404,18 @@ def generate_choices(request, game_id):
         messages.error(request, "Ce jeu n'utilise pas le système de narration dynamique.")
         return redirect('game_detail', game_id=game.id)
     
+    # Une génération manuelle remplace tout préchargement en cours
+    invalidate_choices_prefetch(game)
+    
     # Déterminer l'acte actuel
     narrative_history = NarrativeHistory.objects.filter(game=game)
-    
-    if narrative_history.count() == 0:
-        current_act = 1
-    elif narrative_history.filter(act=1).exists() and not narrative_history.filter(act=2).exists():
-        current_act = 2
-    elif narrative_history.filter(act=2).exists():
-        current_act = 3
+    current_act = get_current_act(game)
     
     # Générer de nouveaux choix narratifs avec l'IA
     choices = generate_narrative_choices(game, current_act, narrative_history)
     
     if choices:
-        # Supprimer les anciens choix pour cet acte
-        NarrativeChoice.objects.filter(game=game, act=current_act).delete()
-        
-        # Créer les nouveaux choix
-        for choice_data in choices:
-            NarrativeChoice.objects.create(
-                game=game,
-                act=current_act,
-                choice_text=choice_data.get('choice_text', ''),
-                outcome_description=choice_data.get('outcome_description', '')
-            )
-        
+        save_narrative_choices(game, current_act, choices)
         messages.success(request, f"Nouveaux choix narratifs générés pour l'acte {current_act}.")
     else:
         messages.error(request, "Impossible de générer des choix narratifs pour le moment.")
@@ -566,6 +423,7 @@ def generate_choices(request, game_id):
     return redirect('narrative_choices', game_id=game.id)
 
 @login_required
+@scheduled_view(INTERACTIVE)
 def select_choice(request, game_id, choice_id):
     if request.method != 'POST':
         return redirect('narrative_choices', game_id=game_id)
@@ -573,236 +431,31 @@ def select_choice(request, game_id, choice_id):
     game = get_object_or_404(Game, id=game_id, owner=request.user)
     choice = get_object_or_404(NarrativeChoice, id=choice_id, game=game)
     
-    # Enregistrer ce choix dans l'historique
-    NarrativeHistory.objects.create(
-        game=game,
-        act=choice.act,
-        choice_text=choice.choice_text,
-        outcome_description=choice.outcome_description
-    )
-    
-    # Supprimer tous les choix de cet acte
-    NarrativeChoice.objects.filter(game=game, act=choice.act).delete()
+    with transaction.atomic():
+        # Enregistrer ce choix dans l'historique et faire avancer l'état narratif
+        record_narrative_step(game, choice)
+        
+        # Supprimer tous les choix de cet acte
+        NarrativeChoice.objects.filter(game=game, act=choice.act).delete()
     
-    # Mettre à jour l'histoire du jeu selon le choix
-    update_game_story_with_choice(game, choice)
+    # Réécrire l'acte et générer les choix suivants en un seul appel
+    if not apply_narrative_step(game, choice):
+        # Repli: mettre à jour l'histoire du jeu selon le choix
+        update_game_story_with_choice(game, choice)
+        
+        # Préparer dès maintenant les choix de l'acte suivant
+        schedule_choices_prefetch(game)
     
-    messages.success(request, f"Votre choix a été enregistré et l'histoire a été mise à jour.")
+    messages.success(request, "Votre choix a été enregistré et l'histoire a été mise à jour.")
     return redirect('narrative_choices', game_id=game.id)
 
-def generate_narrative_choices(game, act, history):
+@staff_member_required
+def ai_scheduler_status(request):
     """
-    Utilise l'API OpenAI pour générer des choix narratifs cohérents avec l'histoire du jeu
-    """
-    github_token = os.getenv('GITHUB_TOKEN')
-    
-    if not github_token:
-        return None
-    
-    client = OpenAI(
-        base_url="https://models.inference.ai.azure.com",
-        api_key=github_token,
-    )
-    
-    # Construire le contexte de l'histoire actuelle
-    context = f"Titre: {game.title}\nGenre: {game.get_genre_display()}\nAmbiance: {game.get_ambiance_display()}\n\n"
-    context += f"Description de l'univers: {game.universe_description}\n\n"
-    
-    if act == 1:
-        context += f"Début de l'histoire: {game.story_act1}\n\n"
-    elif act == 2:
-        context += f"Début de l'histoire: {game.story_act1}\n\n"
-        context += f"Développement: {game.story_act2}\n\n"
-    elif act == 3:
-        context += f"Début de l'histoire: {game.story_act1}\n\n"
-        context += f"Développement: {game.story_act2}\n\n"
-        context += f"Vers la conclusion: {game.story_act3}\n\n"
-    
-    # Ajouter l'historique des choix précédents
-    if history.exists():
-        context += "Historique des choix:\n"
-        for entry in history:
-            context += f"- Acte {entry.act}: {entry.choice_text} → {entry.outcome_description}\n"
-    
-    prompt = f"""
-    {context}
-    
-    Générez 3 choix narratifs significatifs pour l'Acte {act} de cette histoire. Chaque choix doit être mémorable 
-    et avoir un impact significatif sur l'histoire. Pour chaque choix, fournissez:
-    1. Un texte de choix clair (ce que le joueur déciderait)
-    2. Une description détaillée de l'impact de ce choix sur l'histoire
-    
-    Format attendu (JSON uniquement):
-    [
-        {{
-            "choice_text": "Premier choix possible",
-            "outcome_description": "Description de la conséquence du premier choix"
-        }},
-        {{
-            "choice_text": "Second choix possible",
-            "outcome_description": "Description de la conséquence du second choix"
-        }},
-        {{
-            "choice_text": "Troisième choix possible",
-            "outcome_description": "Description de la conséquence du troisième choix"
-        }}
-    ]
+    File d'attente des appels d'IA de ce processus (profondeur et attentes par
+    classe) et limiteur de débit partagé
     """
-    
-    try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",  # Changed from gpt-4 to gpt-4o-mini
-            messages=[
-                {"role": "system", "content": "Tu es un concepteur narratif de jeux vidéo expert dans la création d'histoires interactives avec des choix significatifs."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-            max_tokens=1000,
-            top_p=1
-        )
-        
-        result_text = response.choices[0].message.content
-        
-        # Trouver le début et la fin du JSON dans la réponse
-        json_start = result_text.find('[')
-        json_end = result_text.rfind(']') + 1
-        
-        if json_start >= 0 and json_end > json_start:
-            json_text = result_text[json_start:json_end]
-            try:
-                choices_data = json.loads(json_text)
-                return choices_data
-            except json.JSONDecodeError:
-                print("Erreur: La réponse de l'API n'est pas au format JSON valide")
-        else:
-            print("Erreur: Impossible de trouver du JSON dans la réponse")
-    
-    except Exception as e:
-        print(f"Erreur lors de l'appel à l'API OpenAI: {e}")
-    
-    return None
-
-def update_game_story_with_choice(game, choice):
-    """
-    Met à jour l'histoire du jeu basée sur le choix narratif sélectionné
-    """
-    github_token = os.getenv('GITHUB_TOKEN')
-    
-    if not github_token:
-        return
-    
-    client = OpenAI(
-        base_url="https://models.inference.ai.azure.com",
-        api_key=github_token,
-    )
-    
-    # Construire le contexte de l'histoire actuelle
-    context = f"Titre: {game.title}\nGenre: {game.get_genre_display()}\nAmbiance: {game.get_ambiance_display()}\n\n"
-    context += f"Description de l'univers: {game.universe_description}\n\n"
-    context += f"Histoire actuelle - Acte 1: {game.story_act1}\n\n"
-    
-    if choice.act >= 2:
-        context += f"Histoire actuelle - Acte 2: {game.story_act2}\n\n"
-    
-    if choice.act >= 3:
-        context += f"Histoire actuelle - Acte 3: {game.story_act3}\n\n"
-    
-    # Récupérer tous les choix précédents
-    history = NarrativeHistory.objects.filter(game=game)
-    
-    if history.exists():
-        context += "Historique des choix narratifs:\n"
-        for entry in history:
-            context += f"- Acte {entry.act}: {entry.choice_text} → {entry.outcome_description}\n"
-    
-    # Ajouter le choix actuel
-    context += f"\nChoix actuel (Acte {choice.act}): {choice.choice_text}\n"
-    context += f"Conséquence attendue: {choice.outcome_description}\n"
-    
-    # Demande à l'IA de mettre à jour la partie correspondante de l'histoire
-    if choice.act == 1:
-        prompt = f"""
-        {context}
-        
-        Basé sur ce choix narratif important, réécris l'Acte 1 de l'histoire pour intégrer ce choix et ses conséquences.
-        La nouvelle version doit être cohérente avec l'univers et le ton du jeu, tout en reflétant l'impact du choix.
-        
-        Renvoie uniquement le texte mis à jour pour l'Acte 1.
-        """
-        
-        try:
-            response = client.chat.completions.create(
-                model="gpt-4o-mini",  
-                messages=[
-                    {"role": "system", "content": "Tu es un écrivain narratif de jeux vidéo expert dans l'adaptation d'histoires selon les choix des joueurs."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7,
-                max_tokens=1000,
-                top_p=1
-            )
-            
-            updated_story = response.choices[0].message.content
-            game.story_act1 = updated_story
-            game.save()
-            
-        except Exception as e:
-            print(f"Erreur lors de la mise à jour de l'histoire: {e}")
-            
-    elif choice.act == 2:
-        prompt = f"""
-        {context}
-        
-        Basé sur ce choix narratif important, réécris l'Acte 2 de l'histoire pour intégrer ce choix et ses conséquences.
-        La nouvelle version doit être cohérente avec l'univers et le ton du jeu, tout en reflétant l'impact du choix.
-        
-        Renvoie uniquement le texte mis à jour pour l'Acte 2.
-        """
-        
-        try:
-            response = client.chat.completions.create(
-                model="gpt-4o-mini",  
-                messages=[
-                    {"role": "system", "content": "Tu es un écrivain narratif de jeux vidéo expert dans l'adaptation d'histoires selon les choix des joueurs."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7,
-                max_tokens=1000,
-                top_p=1
-            )
-            
-            updated_story = response.choices[0].message.content
-            game.story_act2 = updated_story
-            game.save()
-            
-        except Exception as e:
-            print(f"Erreur lors de la mise à jour de l'histoire: {e}")
-            
-    elif choice.act == 3:
-        prompt = f"""
-        {context}
-        
-        Basé sur ce choix narratif important, réécris l'Acte 3 (conclusion) de l'histoire pour intégrer ce choix et ses conséquences.
-        La nouvelle version doit être cohérente avec l'univers et le ton du jeu, tout en reflétant l'impact du choix.
-        
-        Renvoie uniquement le texte mis à jour pour l'Acte 3.
-        """
-        
-        try:
-            response = client.chat.completions.create(
-                model="gpt-4o-mini", 
-                messages=[
-                    {"role": "system", "content": "Tu es un écrivain narratif de jeux vidéo expert dans l'adaptation d'histoires selon les choix des joueurs."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7,
-                max_tokens=1000,
-                top_p=1
-            )
-            
-            updated_story = response.choices[0].message.content
-            game.story_act3 = updated_story
-            game.save()
-            
-        except Exception as e:
-            print(f"Erreur lors de la mise à jour de l'histoire: {e}")
+    return JsonResponse({
+        'scheduler': get_scheduler_stats(),
+        'rate_limit': rate_limit.get_stats(),
+    })